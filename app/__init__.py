@@ -2,21 +2,31 @@ from flask import Flask
 from flask.ext.bootstrap import Bootstrap
 from flask.ext.mail import Mail
 from flask.ext.moment import Moment
-from flask.ext.sqlalchemy import SQLAlchemy
 from flask.ext.login import LoginManager
 from config import config
+from .assets import Assets
+from .profiling import RequestProfiler
+from .metrics import Metrics
+from .caching import InvalidationBus
+from .admission import Admission
+from .sharding import ShardedSQLAlchemy
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = ShardedSQLAlchemy()
+assets = Assets()
+profiler = RequestProfiler()
+metrics_registry = Metrics()
+bus = InvalidationBus()
+admission_control = Admission()
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
 login_manager.login_view = 'auth.login'
 
 
-def create_app(config_name):
+def create_app(config_name, preload=False, import_timer=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
@@ -25,8 +35,25 @@ def create_app(config_name):
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    from . import tenancy
+    tenancy.init_app(app)
     login_manager.init_app(app)
+    admission_control.init_app(app)
+    assets.init_app(app)
+    profiler.init_app(app)
+    metrics_registry.init_app(app)
+    bus.init_app(app)
 
+    if preload:
+        from .warmup import preload as preload_app
+        preload_app(app, register_blueprints, import_timer)
+    else:
+        register_blueprints(app)
+
+    return app
+
+
+def register_blueprints(app):
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
@@ -36,4 +63,5 @@ def create_app(config_name):
     from .teacher import teacher as teacher_blueprint
     app.register_blueprint(teacher_blueprint, url_prefix='/teacher')
 
-    return app
+    from .student import student as student_blueprint
+    app.register_blueprint(student_blueprint, url_prefix='/student')
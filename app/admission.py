@@ -0,0 +1,154 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+from flask import g, request, render_template
+from flask.ext.login import current_user
+from .sharding import current_shard
+
+# key digest, tokens left, time of the last update
+BUCKET = struct.Struct('<Qdd')
+
+
+class Admission(object):
+    def __init__(self, app=None):
+        self.limits = {}
+        self.directory = None
+        self.directory_made = False
+        self.slots = 0
+        self.lock = Lock()
+        self.pid = None
+        self.table_file = None
+        self.table = None
+        self.metrics = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import metrics_registry
+        self.limits = app.config['KYBURZ_ADMISSION_LIMITS']
+        self.directory = app.config['KYBURZ_ADMISSION_DIR']
+        self.slots = app.config['KYBURZ_ADMISSION_BUCKETS']
+        self.metrics = metrics_registry
+        if not self.limits:
+            return
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def admit(self):
+        limit = self.limits.get(request.endpoint)
+        if limit is None or \
+                request.method not in limit.get('methods', ('POST',)):
+            return
+        for kind, key in self.keys(limit):
+            rate, burst = limit[kind]
+            wait = self.take(u'{0}|{1}|{2}'.format(request.endpoint, kind,
+                                                   key), rate, burst)
+            if wait:
+                return self.reject(429, kind, wait)
+        if limit.get('concurrency'):
+            slot = self.acquire(request.endpoint, limit['concurrency'])
+            if slot is None:
+                return self.reject(503, 'busy', 1)
+            g.admission_slot = slot
+
+    def release(self, exc=None):
+        slot = getattr(g, 'admission_slot', None)
+        if slot is not None:
+            g.admission_slot = None
+            # closing the file also drops its lock
+            os.close(slot)
+
+    def keys(self, limit):
+        if 'user' in limit:
+            if current_user.is_authenticated:
+                key = '{0}:{1}'.format(current_shard(), current_user.id)
+            else:
+                # logins and reset requests name the account in the form;
+                # keyed by address too, so nobody can lock another person
+                # out by typing their email
+                email = request.form.get('email', '').strip().lower()
+                key = email and u'{0}|{1}'.format(email, request.remote_addr)
+            if key:
+                yield 'user', key
+        if 'ip' in limit:
+            yield 'ip', request.remote_addr
+
+    def reject(self, status, reason, wait):
+        self.metrics.admission_rejections.inc(endpoint=request.endpoint,
+                                              reason=reason)
+        if status == 429:
+            body = render_template('429.html')
+        else:
+            body = render_template('503.html', message='The site is busy. '
+                                   'Please try again in a few seconds.')
+        return body, status, {'Retry-After': str(int(math.ceil(wait)))}
+
+    def make_directory(self):
+        # only when a limit is first used, not by every create_app
+        if self.directory_made:
+            return
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        self.directory_made = True
+
+    def acquire(self, endpoint, concurrency):
+        # each slot is a lock file, so a crashed worker never keeps one
+        self.make_directory()
+        for slot in range(concurrency):
+            path = os.path.join(self.directory,
+                                '{0}.{1}.lock'.format(endpoint, slot))
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def buckets(self):
+        if self.pid != os.getpid():
+            self.make_directory()
+            self.pid = os.getpid()
+            path = os.path.join(self.directory, 'buckets')
+            self.table_file = open(path, 'a+b')
+            size = self.slots * BUCKET.size
+            if os.fstat(self.table_file.fileno()).st_size < size:
+                self.table_file.truncate(size)
+            self.table = mmap.mmap(self.table_file.fileno(), size)
+        return self.table
+
+    def take(self, key, rate, burst):
+        digest, = struct.unpack('<Q', hashlib.sha1(
+            key.encode('utf-8')).digest()[:8])
+        offset = (digest % self.slots) * BUCKET.size
+        now = time.time()
+        with self.lock:
+            table = self.buckets()
+            # the file lock keeps other workers out, the thread lock the
+            # threads of this one
+            fcntl.flock(self.table_file.fileno(), fcntl.LOCK_EX)
+            try:
+                stored, tokens, updated = BUCKET.unpack_from(table, offset)
+                if stored != digest:
+                    # a key that collides with another simply starts over
+                    tokens, updated = burst, now
+                tokens = min(burst, tokens + max(0, now - updated) * rate)
+                wait = 0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+                BUCKET.pack_into(table, offset, digest, tokens, now)
+            finally:
+                fcntl.flock(self.table_file.fileno(), fcntl.LOCK_UN)
+        return wait
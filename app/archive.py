@@ -0,0 +1,245 @@
+import fcntl
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import tuple_
+from . import db
+from .sharding import current_shard
+from .models import AnswerSubmission, AnswerRollup, Problem, Lesson
+
+COLUMNS = [c.name for c in AnswerSubmission.__table__.columns]
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def archive_root(directory=None):
+    directory = directory or current_app.config['KYBURZ_ARCHIVE_DIR']
+    shard = current_shard()
+    # teacher ids repeat across shards
+    if shard is None:
+        return directory
+    return os.path.join(directory, 'shards', shard)
+
+
+def archive_path(directory, month, teacher_id):
+    # answers whose problem or lesson is gone have no teacher
+    if teacher_id is None:
+        return os.path.join(directory, month, 'no-teacher.jsonl.gz')
+    return os.path.join(directory, month,
+                        'teacher-{0}.jsonl.gz'.format(teacher_id))
+
+
+def encode(row):
+    record = dict(zip(COLUMNS, row))
+    record['timestamp'] = record['timestamp'].strftime(TIMESTAMP_FORMAT)
+    return record
+
+
+def decode(record):
+    record['timestamp'] = datetime.strptime(record['timestamp'],
+                                            TIMESTAMP_FORMAT)
+    return record
+
+
+@contextmanager
+def locked(directory):
+    # appends and rewrites of a month's files take turns
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def write_partition(path, records):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # each batch is appended as its own gzip member; readers see one stream
+    with locked(directory):
+        with open(path, 'ab') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as out:
+                for record in records:
+                    out.write(json.dumps(record, sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def rewrite_partition(path, matches, dry_run=False):
+    with locked(os.path.dirname(path)):
+        with gzip.open(path) as f:
+            lines = f.readlines()
+        kept = [line for line in lines if not matches(json.loads(line))]
+        if dry_run or len(kept) == len(lines):
+            return len(lines) - len(kept)
+        if not kept:
+            os.unlink(path)
+            return len(lines)
+        with open(path + '.tmp', 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as out:
+                out.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+    return len(lines) - len(kept)
+
+
+def remove_archived(matches, teacher_ids=None, directory=None,
+                    dry_run=False):
+    """Drop the archived records that match, from every file or only from
+    the files of the given teachers."""
+    directory = archive_root(directory)
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for month in sorted(os.listdir(directory)):
+        # the main database's root also holds the shards' roots
+        if month == 'shards':
+            continue
+        if teacher_ids is None:
+            paths = [os.path.join(directory, month, filename)
+                     for filename in sorted(os.listdir(
+                         os.path.join(directory, month)))
+                     if filename.endswith('.jsonl.gz')]
+        else:
+            paths = [archive_path(directory, month, teacher_id)
+                     for teacher_id in teacher_ids]
+        for path in paths:
+            if os.path.exists(path):
+                removed += rewrite_partition(path, matches, dry_run)
+    return removed
+
+
+def update_rollups(records):
+    totals = {}
+    for record in records:
+        key = (record['user_id'], record['problem_id'])
+        attempts, correct, first_correct, last = totals.get(
+            key, (0, 0, None, None))
+        timestamp = record['timestamp']
+        if record['is_correct']:
+            correct += 1
+            if first_correct is None or timestamp < first_correct:
+                first_correct = timestamp
+        if last is None or timestamp > last:
+            last = timestamp
+        totals[key] = (attempts + 1, correct, first_correct, last)
+
+    existing = {}
+    keys = list(totals)
+    for i in range(0, len(keys), 500):
+        existing.update(((r.user_id, r.problem_id), r) for r in
+                        AnswerRollup.query.filter(tuple_(
+                            AnswerRollup.user_id, AnswerRollup.problem_id)
+                            .in_(keys[i:i + 500])))
+    for key, (attempts, correct, first_correct, last) in totals.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = AnswerRollup(user_id=key[0], problem_id=key[1],
+                                  attempts=0, correct=0)
+        rollup.attempts += attempts
+        rollup.correct += correct
+        if first_correct is not None and (rollup.first_correct_at is None or
+                                          first_correct <
+                                          rollup.first_correct_at):
+            rollup.first_correct_at = first_correct
+        if rollup.last_submitted_at is None or last > rollup.last_submitted_at:
+            rollup.last_submitted_at = last
+        db.session.add(rollup)
+
+
+def archive_before(cutoff, directory=None, batch_size=None, dry_run=False,
+                   report=None):
+    directory = archive_root(directory)
+    batch_size = batch_size or current_app.config['KYBURZ_ARCHIVE_BATCH_SIZE']
+    answers = AnswerSubmission.__table__
+    archived = 0
+    last_id = 0
+    while True:
+        # outer joins, so answers to deleted problems are archived too
+        rows = db.session.query(answers, Lesson.author_id) \
+            .outerjoin(Problem, Problem.id == answers.c.problem_id) \
+            .outerjoin(Lesson, Lesson.id == Problem.lesson_id) \
+            .filter(answers.c.timestamp < cutoff, answers.c.id > last_id) \
+            .order_by(answers.c.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        if dry_run:
+            archived += len(rows)
+            continue
+        partitions = {}
+        records = []
+        for row in rows:
+            record = encode(row[:-1])
+            month = record['timestamp'][:7]
+            partitions.setdefault((month, row[-1]), []).append(record)
+            # a summary needs a problem to belong to
+            if row[-1] is not None:
+                records.append(dict(record, timestamp=row.timestamp))
+        # the files are written before the rows are deleted; a crash in
+        # between leaves duplicates, which readers skip by id
+        for (month, teacher_id), partition in sorted(partitions.items()):
+            write_partition(archive_path(directory, month, teacher_id),
+                            partition)
+        update_rollups(records)
+        ids = [row[0] for row in rows]
+        db.session.execute(answers.delete().where(answers.c.id.in_(ids)))
+        db.session.commit()
+        archived += len(rows)
+        if report is not None:
+            report(archived, last_id)
+    return archived
+
+
+def archive_old_submissions(days=None, **kwargs):
+    days = days or current_app.config['KYBURZ_ARCHIVE_AFTER_DAYS']
+    return archive_before(datetime.utcnow() - timedelta(days=days), **kwargs)
+
+
+def archived_months(teacher_id, directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(month for month in os.listdir(directory) if os.path.exists(
+        archive_path(directory, month, teacher_id)))
+
+
+def has_archive(teacher_ids, directory=None):
+    directory = archive_root(directory)
+    return any(archived_months(teacher_id, directory)
+               for teacher_id in teacher_ids)
+
+
+def read_archive(teacher_id, problem_ids=None, directory=None):
+    directory = archive_root(directory)
+    seen = set()
+    for month in archived_months(teacher_id, directory):
+        with gzip.open(archive_path(directory, month, teacher_id)) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['id'] in seen or problem_ids is not None and \
+                        record['problem_id'] not in problem_ids:
+                    continue
+                seen.add(record['id'])
+                yield decode(record)
+
+
+def lesson_submissions(lesson):
+    problem_ids = set(problem_id for problem_id, in
+                      db.session.query(Problem.id)
+                      .filter(Problem.lesson_id == lesson.id))
+    if not problem_ids:
+        return
+    archived = set()
+    for record in read_archive(lesson.author_id, problem_ids):
+        archived.add(record['id'])
+        yield record
+    answers = AnswerSubmission.__table__
+    for row in db.session.execute(
+            answers.select().where(answers.c.problem_id.in_(problem_ids))
+            .order_by(answers.c.id)):
+        if row.id not in archived:
+            yield dict(zip(COLUMNS, row))
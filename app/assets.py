@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory, url_for
+
+BUNDLES = {
+    'kyburz.css': ['bootstrap:css/bootstrap.css', 'styles.css'],
+    'kyburz.js': ['bootstrap:jquery.js', 'bootstrap:js/bootstrap.js'],
+}
+
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE = ('.css', '.js', '.svg')
+
+css_comment = re.compile(r'/\*.*?\*/', re.S)
+css_space = re.compile(r'\s*([{};,>])\s*')
+css_url = re.compile(r'url\(\s*[\'"]?([^\'")]+?)[\'"]?\s*\)')
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['kyburz_assets'] = \
+            load_manifest(app.config['KYBURZ_ASSETS_DIR'])
+        app.add_url_rule('/assets/<path:filename>', 'assets', send_asset)
+        app.add_template_global(asset_url)
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    filename = current_app.extensions['kyburz_assets'].get(name)
+    if filename is None:
+        return None
+    return url_for('assets', filename=filename)
+
+
+def send_asset(filename):
+    directory = current_app.config['KYBURZ_ASSETS_DIR']
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in accepted and \
+                os.path.isfile(os.path.join(directory, filename + suffix)):
+            encoding = candidate
+            filename += suffix
+            break
+    response = send_from_directory(
+        directory, filename, mimetype=mimetype,
+        cache_timeout=current_app.config['KYBURZ_ASSETS_MAX_AGE'])
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    return response
+
+
+def fingerprint(name, content):
+    root, ext = os.path.splitext(name)
+    digest = hashlib.md5(content).hexdigest()[:12]
+    return '{0}.{1}{2}'.format(root, digest, ext)
+
+
+def resolve_source(app, source):
+    if source.startswith('bootstrap:'):
+        folder = app.blueprints['bootstrap'].static_folder
+        source = source[len('bootstrap:'):]
+    else:
+        folder = app.static_folder
+    path = os.path.join(folder, source)
+    root, ext = os.path.splitext(path)
+    if os.path.isfile(root + '.min' + ext):
+        return root + '.min' + ext, True
+    return path, False
+
+
+def minify_css(css):
+    css = css_comment.sub('', css)
+    css = css_space.sub(r'\1', ' '.join(css.split()))
+    return css.replace(';}', '}')
+
+
+def write_file(directory, filename, content):
+    with open(os.path.join(directory, filename), 'wb') as f:
+        f.write(content)
+    if not filename.endswith(COMPRESSIBLE):
+        return
+    with open(os.path.join(directory, filename + '.gz'), 'wb') as raw:
+        with gzip.GzipFile(filename, 'wb', 9, raw, 0) as f:
+            f.write(content)
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(os.path.join(directory, filename + '.br'), 'wb') as f:
+        f.write(brotli.compress(content))
+
+
+def copy_css_references(css, source_dir, directory):
+    def replace(match):
+        reference = match.group(1)
+        if reference.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return match.group(0)
+        path = re.split(r'[?#]', reference, 1)[0]
+        suffix = reference[len(path):]
+        with open(os.path.join(source_dir, path), 'rb') as f:
+            content = f.read()
+        filename = fingerprint(os.path.basename(path), content)
+        write_file(directory, filename, content)
+        return 'url({0}{1})'.format(filename, suffix)
+    return css_url.sub(replace, css)
+
+
+def build(app, bundles=BUNDLES):
+    directory = app.config['KYBURZ_ASSETS_DIR']
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest = {}
+    for name, sources in sorted(bundles.items()):
+        parts = []
+        for source in sources:
+            path, minified = resolve_source(app, source)
+            with open(path, 'rb') as f:
+                content = f.read().decode('utf-8')
+            if name.endswith('.css'):
+                if not minified:
+                    content = minify_css(content)
+                content = copy_css_references(content, os.path.dirname(path),
+                                              directory)
+            parts.append(content.strip())
+        separator = '\n' if name.endswith('.css') else ';\n'
+        content = separator.join(parts).encode('utf-8')
+        manifest[name] = fingerprint(name, content)
+        write_file(directory, manifest[name], content)
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    app.extensions['kyburz_assets'] = manifest
+    return manifest
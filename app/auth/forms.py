@@ -2,7 +2,7 @@ from flask.ext.wtf import Form
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import Required, Length, Email, Regexp, EqualTo
 from wtforms import ValidationError
-from ..models import User
+from ..tenancy import email_taken
 
 
 class LoginForm(Form):
@@ -24,7 +24,7 @@ class RegistrationForm(Form):
     submit = SubmitField('Register')
 
     def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
+        if email_taken(field.data):
             raise ValidationError('Email already registered.')
 
 
@@ -51,7 +51,7 @@ class PasswordResetForm(Form):
     submit = SubmitField('Reset Password')
 
     def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first() is None:
+        if not email_taken(field.data):
             raise ValidationError('Unknown email address.')
 
 
@@ -62,5 +62,5 @@ class ChangeEmailForm(Form):
     submit = SubmitField('Update Email Address')
 
     def validate_email(self, field):
-        if User.query.filter_by(email=field.data).first():
+        if email_taken(field.data):
             raise ValidationError('Email already registered.')
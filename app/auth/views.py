@@ -2,7 +2,7 @@ from flask import render_template, redirect, request, url_for, flash
 from flask.ext.login import login_user, logout_user, login_required, \
     current_user
 from . import auth
-from .. import db
+from .. import db, metrics_registry, tenancy
 from ..models import User
 from ..email import send_email
 from .forms import LoginForm, RegistrationForm, ChangePasswordForm,\
@@ -30,8 +30,13 @@ def unconfirmed():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user is not None and user.verify_password(form.password.data):
+        with metrics_registry.login_seconds.time() as labels:
+            tenancy.use_tenant_of(form.email.data)
+            user = User.query.filter_by(email=form.email.data).first()
+            valid = user is not None and \
+                user.verify_password(form.password.data)
+            labels['result'] = 'success' if valid else 'failure'
+        if valid:
             login_user(user, form.remember_me.data)
             return redirect(request.args.get('next') or url_for('main.index'))
         flash('Invalid username or password.')
@@ -55,6 +60,7 @@ def register():
                     last_name=form.last_name.data,
                     password=form.password.data)
         db.session.add(user)
+        tenancy.locate([user.email])
         db.session.commit()
         token = user.generate_confirmation_token()
         send_email(user.email, 'Confirm Your Account',
@@ -107,6 +113,7 @@ def password_reset_request():
         return redirect(url_for('main.index'))
     form = PasswordResetRequestForm()
     if form.validate_on_submit():
+        tenancy.use_tenant_of(form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
         if user:
             token = user.generate_reset_token()
@@ -126,6 +133,7 @@ def password_reset(token):
         return redirect(url_for('main.index'))
     form = PasswordResetForm()
     if form.validate_on_submit():
+        tenancy.use_tenant_of(form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
         if user is None:
             return redirect(url_for('main.index'))
@@ -159,7 +167,9 @@ def change_email_request():
 @auth.route('/change-email/<token>')
 @login_required
 def change_email(token):
+    old_email = current_user.email
     if current_user.change_email(token):
+        tenancy.relocate(old_email, current_user.email)
         flash('Your email address has been updated.')
     else:
         flash('Invalid request.')
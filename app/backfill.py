@@ -0,0 +1,168 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, select
+from sqlalchemy.engine import Engine
+from . import db
+from .models import BackfillCheckpoint, Problem, AnswerSubmission
+
+checkpoints = BackfillCheckpoint.__table__
+
+backfills = OrderedDict()
+
+
+class Backfill(object):
+    def __init__(self, name, table, process, columns=None, where=None):
+        self.name = name
+        self.table = table
+        self.process = process
+        self.columns = columns
+        self.where = where
+
+    def chunk(self, connection, last_id, batch_size):
+        key = self.table.c.id
+        columns = [key] + [self.table.c[c] for c in self.columns or []]
+        query = select(columns).where(key > last_id)
+        if self.where is not None:
+            query = query.where(self.where)
+        return connection.execute(
+            query.order_by(key).limit(batch_size)).fetchall()
+
+
+def register(name, table, columns=None, where=None):
+    def decorator(f):
+        backfills[name] = Backfill(name, table, f, columns, where)
+        return f
+    return decorator
+
+
+@contextmanager
+def transaction(bind):
+    # an engine gets one short transaction per chunk; a connection that is
+    # already inside a transaction, as in a migration, keeps using it
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            yield connection
+    else:
+        with bind.begin():
+            yield bind
+
+
+def load_checkpoint(connection, name):
+    row = connection.execute(select([checkpoints])
+                             .where(checkpoints.c.name == name)).first()
+    if row is None:
+        connection.execute(checkpoints.insert(), name=name, last_id=0,
+                           rows=0, started_at=datetime.utcnow())
+        return 0, 0, None
+    return row.last_id, row.rows, row.finished_at
+
+
+def save_checkpoint(connection, name, **values):
+    values['updated_at'] = datetime.utcnow()
+    connection.execute(checkpoints.update()
+                       .where(checkpoints.c.name == name), **values)
+
+
+def run(name, bind=None, batch_size=None, sleep=None, restart=False,
+        report=None):
+    backfill = backfills[name]
+    if bind is None:
+        bind = db.engine
+    if batch_size is None:
+        batch_size = current_app.config['KYBURZ_BACKFILL_BATCH_SIZE']
+    if sleep is None:
+        sleep = current_app.config['KYBURZ_BACKFILL_SLEEP']
+    with transaction(bind) as connection:
+        if restart:
+            connection.execute(checkpoints.delete()
+                               .where(checkpoints.c.name == name))
+        last_id, done, finished_at = load_checkpoint(connection, name)
+    if finished_at is not None:
+        return {'name': name, 'rows': 0, 'last_id': last_id, 'seconds': 0.0,
+                'finished': True}
+
+    start = time.time()
+    processed = 0
+    while True:
+        chunk_start = time.time()
+        with transaction(bind) as connection:
+            rows = backfill.chunk(connection, last_id, batch_size)
+            if not rows:
+                save_checkpoint(connection, name,
+                                finished_at=datetime.utcnow())
+                break
+            backfill.process(connection, rows)
+            last_id = rows[-1][0]
+            done += len(rows)
+            save_checkpoint(connection, name, last_id=last_id, rows=done)
+        processed += len(rows)
+        if report is not None:
+            report(name, done, last_id,
+                   len(rows) / max(time.time() - chunk_start, 1e-6))
+        if sleep:
+            time.sleep(sleep)
+    elapsed = time.time() - start
+    return {'name': name, 'rows': processed, 'last_id': last_id,
+            'seconds': elapsed, 'finished': True}
+
+
+def status(bind=None):
+    bind = bind or db.engine
+    rows = dict((row.name, row) for row in
+                bind.execute(select([checkpoints])))
+    return [(name, rows.get(name)) for name in backfills]
+
+
+@register('problem_features', Problem.__table__,
+          columns=['text', 'left_coefficient', 'left_constant',
+                   'right_coefficient', 'right_constant',
+                   'solution_numerator', 'solution_denominator'],
+          where=Problem.__table__.c.difficulty == None)
+def problem_features(connection, rows):
+    from .student.recommend import describe
+    problems = Problem.__table__
+    values = []
+    for row in rows:
+        described = describe(row)
+        values.append({'problem_id': row.id, 'skill': described['skill'],
+                       'difficulty': described['difficulty']})
+    connection.execute(problems.update()
+                       .where(problems.c.id == bindparam('problem_id'))
+                       .values(skill=bindparam('skill'),
+                               difficulty=bindparam('difficulty')), values)
+
+
+@register('problem_misconceptions', Problem.__table__,
+          columns=['text', 'left_coefficient', 'left_constant',
+                   'right_coefficient', 'right_constant',
+                   'solution_numerator', 'solution_denominator'],
+          where=Problem.__table__.c.misconceptions == None)
+def problem_misconceptions(connection, rows):
+    from .student.misconceptions import table_columns
+    problems = Problem.__table__
+    values = [dict(table_columns(row), problem_id=row.id) for row in rows]
+    connection.execute(problems.update()
+                       .where(problems.c.id == bindparam('problem_id'))
+                       .values(misconceptions=bindparam('misconceptions')),
+                       values)
+
+
+@register('answer_fractions', AnswerSubmission.__table__,
+          columns=['variable_value', 'left_side_value', 'right_side_value'],
+          where=AnswerSubmission.__table__.c.variable_denominator == None)
+def answer_fractions(connection, rows):
+    from .student.grading import fraction_columns
+    answers = AnswerSubmission.__table__
+    values = []
+    for row in rows:
+        columns = fraction_columns(row.variable_value, row.left_side_value,
+                                   row.right_side_value)
+        columns['answer_id'] = row.id
+        values.append(columns)
+    connection.execute(answers.update()
+                       .where(answers.c.id == bindparam('answer_id'))
+                       .values(dict((c, bindparam(c)) for c in values[0]
+                                    if c != 'answer_id')), values)
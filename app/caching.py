@@ -0,0 +1,276 @@
+import atexit
+import errno
+import json
+import os
+import socket
+import time
+from threading import Lock, Thread
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .metrics import process_alive
+from .sharding import current_shard
+
+MAX_MESSAGE = 65507
+SEND_TIMEOUT = 0.2
+CHANNEL = 'kyburz-invalidations'
+
+
+def hashable(key):
+    # keys come back from JSON with tuples turned into lists
+    if isinstance(key, list):
+        return tuple(hashable(part) for part in key)
+    return key
+
+
+class SharedCache(object):
+    def __init__(self, bus, name, sharded=True, size=10000,
+                 ttl_setting='KYBURZ_CACHE_FALLBACK_SECONDS'):
+        self.bus = bus
+        self.name = name
+        self.sharded = sharded
+        self.size = size
+        self.ttl_setting = ttl_setting
+        self.lock = Lock()
+        self.entries = {}
+        self.generation = 0
+        bus.register(self)
+
+    def key(self, key):
+        # ids repeat across shards
+        return (current_shard(), key) if self.sharded else key
+
+    def cached(self, key, load):
+        key = self.key(key)
+        entry = self.entries.get(key)
+        if entry is not None and self.bus.fresh(
+                entry[0], current_app.config[self.ttl_setting]):
+            return entry[1]
+        generation = self.generation
+        loaded_at = time.time()
+        value = load()
+        with self.lock:
+            # an invalidation that arrived while loading wins
+            if self.generation == generation:
+                if len(self.entries) >= self.size:
+                    self.entries.clear()
+                self.entries[key] = (loaded_at, value)
+        return value
+
+    def invalidate(self, *keys):
+        self.bus.publish(self.name, [self.key(key) for key in keys])
+
+    def invalidate_on_commit(self, *keys):
+        self.bus.publish_on_commit(self.name, [self.key(key) for key in keys])
+
+    def clear(self):
+        self.bus.publish(self.name, None)
+
+    def discard(self, keys):
+        with self.lock:
+            self.generation += 1
+            if keys is None:
+                self.entries.clear()
+            for key in keys or ():
+                self.entries.pop(key, None)
+
+
+class SocketTransport(object):
+    # one datagram socket per process in a shared directory, for the
+    # workers of a single machine
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+        self.sender = None
+
+    def listen(self, ready, receive):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.path = os.path.join(self.directory,
+                                 '{0}.sock'.format(os.getpid()))
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.bind(self.path)
+        atexit.register(self.close)
+        ready()
+        while True:
+            receive(listener.recv(MAX_MESSAGE))
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def send(self, message):
+        if self.sender is None:
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.settimeout(SEND_TIMEOUT)
+        failed = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if not filename.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self.sender.sendto(message, path)
+            except socket.error as e:
+                pid = filename.split('.')[0]
+                if e.errno not in (errno.ECONNREFUSED, errno.ENOENT) or \
+                        pid.isdigit() and process_alive(int(pid)):
+                    # one busy listener must not keep the rest from hearing
+                    failed.append((filename, e))
+                    continue
+                # left behind by a process that died
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        if failed:
+            raise socket.error('Not delivered to {0}.'.format(', '.join(
+                '{0} ({1})'.format(filename, e) for filename, e in failed)))
+
+
+class RedisTransport(object):
+    # for processes on several machines
+    def __init__(self, url):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+
+    def listen(self, ready, receive):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CHANNEL)
+        ready()
+        for message in pubsub.listen():
+            receive(message['data'])
+
+    def send(self, message):
+        self.client.publish(CHANNEL, message)
+
+
+def transport_for(url):
+    if url.startswith('unix://'):
+        return SocketTransport(url[len('unix://'):])
+    if url.startswith('redis://'):
+        return RedisTransport(url)
+    raise ValueError('Unknown cache bus {0}.'.format(url))
+
+
+class InvalidationBus(object):
+    def __init__(self, app=None):
+        self.caches = {}
+        self.lock = Lock()
+        self.url = None
+        self.retry = 5
+        self.logger = None
+        self.metrics = None
+        self.pid = None
+        self.origin = None
+        self.transport = None
+        # entries loaded after this time hear about every change; None
+        # means the bus is down and entries expire after a short ttl
+        self.since = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from . import metrics_registry
+        self.url = app.config['KYBURZ_CACHE_BUS_URL']
+        self.retry = app.config['KYBURZ_CACHE_BUS_RETRY']
+        self.logger = app.logger
+        self.metrics = metrics_registry
+        if not event.contains(Session, 'after_commit', self.after_commit):
+            event.listen(Session, 'after_commit', self.after_commit)
+            event.listen(Session, 'after_rollback', self.after_rollback)
+
+    def register(self, cache):
+        self.caches[cache.name] = cache
+        return cache
+
+    def fresh(self, loaded_at, ttl):
+        since = self.listening_since()
+        return since is not None and loaded_at >= since or \
+            time.time() - loaded_at < ttl
+
+    def listening_since(self):
+        # a forked worker needs a listener of its own
+        if self.pid != os.getpid():
+            self.start()
+        return self.since
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.origin = '{0}:{1}'.format(socket.gethostname(), self.pid)
+            self.since = None
+            self.transport = None
+            if not self.url:
+                return
+            try:
+                self.transport = transport_for(self.url)
+            except Exception:
+                self.logger.exception('Cache bus %s is not available; '
+                                      'caches expire instead.', self.url)
+                return
+            listener = Thread(target=self.listen)
+            listener.daemon = True
+            listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                self.transport.listen(self.ready, self.receive)
+            except Exception:
+                self.logger.exception('Cache bus listener failed.')
+            self.since = None
+            time.sleep(self.retry)
+
+    def ready(self):
+        self.since = time.time()
+
+    def receive(self, message):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return
+        if message.get('origin') == self.origin:
+            return
+        self.discard(message['cache'], message['keys'], 'bus')
+
+    def discard(self, name, keys, source):
+        cache = self.caches.get(name)
+        if cache is None:
+            return
+        cache.discard(None if keys is None else
+                      [hashable(key) for key in keys])
+        self.metrics.cache_invalidations.inc(cache=name, source=source)
+
+    def publish(self, name, keys):
+        self.discard(name, keys, 'local')
+        self.listening_since()
+        if self.transport is None:
+            return
+        message = json.dumps({'origin': self.origin, 'cache': name,
+                              'keys': keys})
+        try:
+            self.transport.send(message)
+        except Exception:
+            # the other processes fall back on their ttl only if their own
+            # listener is down, so this is worth a look
+            self.logger.exception('Could not publish a cache invalidation.')
+
+    def publish_on_commit(self, name, keys):
+        # published once the change is visible to the other processes;
+        # until then they would only load the old data again
+        from . import db
+        db.session.info.setdefault('invalidations', []).append((name, keys))
+
+    def after_commit(self, session):
+        for name, keys in session.info.pop('invalidations', ()):
+            self.publish(name, keys)
+
+    def after_rollback(self, session):
+        # the change never happened, so nobody needs to hear about it
+        session.info.pop('invalidations', None)
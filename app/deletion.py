@@ -0,0 +1,168 @@
+from flask import current_app
+from sqlalchemy import func, or_, select
+from . import db
+from .archive import remove_archived
+from .models import User, Lesson, Problem, AnswerSubmission, AnswerRollup, \
+    Mastery, TeachingRelationship, Job, UserLocation, Assignment, WorkItem, \
+    user_permissions
+
+users = User.__table__
+lessons = Lesson.__table__
+problems = Problem.__table__
+answers = AnswerSubmission.__table__
+rollups = AnswerRollup.__table__
+mastery = Mastery.__table__
+relationships = TeachingRelationship.__table__
+jobs = Job.__table__
+locations = UserLocation.__table__
+assignments = Assignment.__table__
+work_items = WorkItem.__table__
+
+
+class Step(object):
+    def __init__(self, description, table, where, batched=False):
+        self.description = description
+        self.table = table
+        self.where = where
+        self.batched = batched
+
+    def count(self):
+        return db.session.execute(select([func.count()])
+                                  .select_from(self.table)
+                                  .where(self.where)).scalar()
+
+    def execute(self, batch_size):
+        if not self.batched:
+            deleted = db.session.execute(
+                self.table.delete().where(self.where)).rowcount
+            db.session.commit()
+            return deleted
+        # big tables go in short transactions of batch_size rows each
+        deleted = 0
+        while True:
+            ids = [row[0] for row in db.session.execute(
+                select([self.table.c.id]).where(self.where)
+                .limit(batch_size))]
+            if not ids:
+                return deleted
+            db.session.execute(self.table.delete()
+                               .where(self.table.c.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+
+
+class ArchiveStep(object):
+    # archived answers live in files; values and teachers are queries that
+    # are run when the step is, like the where clauses of the other steps
+    def __init__(self, description, column, values, teachers=None):
+        self.description = description
+        self.column = column
+        self.values = values
+        self.teachers = teachers
+
+    def ids(self, query):
+        return set(value for value, in db.session.execute(query)
+                   if value is not None)
+
+    def remove(self, dry_run):
+        values = self.ids(self.values)
+        if not values:
+            return 0
+        return remove_archived(
+            lambda record: record.get(self.column) in values,
+            None if self.teachers is None else self.ids(self.teachers),
+            dry_run=dry_run)
+
+    def count(self):
+        return self.remove(True)
+
+    def execute(self, batch_size):
+        return self.remove(False)
+
+
+class Deletion(object):
+    def __init__(self, steps, lesson_ids=(), user_ids=()):
+        self.steps = steps
+        self.lesson_ids = lesson_ids
+        self.user_ids = user_ids
+
+    def counts(self):
+        return [(step.description, step.count()) for step in self.steps]
+
+    def execute(self, batch_size=None):
+        from .student import recommend
+        from .teacher import analytics, worksheets
+        batch_size = batch_size or \
+            current_app.config['KYBURZ_DELETE_BATCH_SIZE']
+        # children go first, so stopping part way leaves a consistent
+        # database and running the deletion again finishes the job
+        deleted = [(step.description, step.execute(batch_size))
+                   for step in self.steps]
+        if self.lesson_ids:
+            recommend.indexes.invalidate(*self.lesson_ids)
+            analytics.analyses.invalidate(*self.lesson_ids)
+        for lesson_id in self.lesson_ids:
+            worksheets.forget(lesson_id)
+        if self.user_ids:
+            # ids can be handed out again
+            user_permissions.invalidate(*self.user_ids)
+        return deleted
+
+
+def lesson_steps(lesson_ids):
+    problem_ids = select([problems.c.id]) \
+        .where(problems.c.lesson_id.in_(lesson_ids))
+    return [
+        ArchiveStep('archived answers to lesson problems', 'problem_id',
+                    problem_ids, select([lessons.c.author_id])
+                    .where(lessons.c.id.in_(lesson_ids))),
+        Step('answer submissions to lesson problems', answers,
+             answers.c.problem_id.in_(problem_ids), batched=True),
+        Step('archived answer summaries for lesson problems', rollups,
+             rollups.c.problem_id.in_(problem_ids)),
+        Step('student work items for the lessons', work_items,
+             work_items.c.lesson_id.in_(lesson_ids)),
+        Step('assignments of the lessons', assignments,
+             assignments.c.lesson_id.in_(lesson_ids)),
+        Step('problems', problems, problems.c.lesson_id.in_(lesson_ids)),
+        Step('lessons', lessons, lessons.c.id.in_(lesson_ids)),
+    ]
+
+
+def delete_lesson(lesson):
+    return Deletion(lesson_steps([lesson.id]), [lesson.id])
+
+
+def delete_user(user, forget=True):
+    lesson_ids = [lesson_id for lesson_id, in db.session.query(Lesson.id)
+                  .filter(Lesson.author_id == user.id)]
+    steps = [
+        ArchiveStep("the user's archived answers", 'user_id',
+                    select([users.c.id]).where(users.c.id == user.id)),
+        Step("the user's answer submissions", answers,
+             answers.c.user_id == user.id, batched=True),
+        Step("the user's archived answer summaries", rollups,
+             rollups.c.user_id == user.id),
+        Step("the user's mastery ratings", mastery,
+             mastery.c.user_id == user.id),
+        Step("the user's background jobs", jobs, jobs.c.owner_id == user.id),
+        Step("the user's work items", work_items,
+             or_(work_items.c.student_id == user.id,
+                 work_items.c.assignment_id.in_(
+                     select([assignments.c.id])
+                     .where(assignments.c.teacher_id == user.id)))),
+        Step("the user's assignments", assignments,
+             assignments.c.teacher_id == user.id),
+    ]
+    if lesson_ids:
+        steps += lesson_steps(lesson_ids)
+    steps += [
+        Step('teacher and student links', relationships,
+             or_(relationships.c.teacher_id == user.id,
+                 relationships.c.student_id == user.id)),
+        Step('user accounts', users, users.c.id == user.id),
+    ]
+    if forget:
+        steps.append(Step("the user's directory entry", locations,
+                          locations.c.email == user.email))
+    return Deletion(steps, lesson_ids, [user.id])
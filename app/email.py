@@ -1,20 +1,67 @@
+from contextlib import contextmanager
 from threading import Thread
-from flask import current_app, render_template
+from flask import current_app, render_template, has_request_context
 from flask.ext.mail import Message
-from . import mail
+from . import mail, metrics_registry
 
 
 def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+    try:
+        with app.app_context():
+            with metrics_registry.mail_send_seconds.time():
+                mail.send(msg)
+    finally:
+        metrics_registry.mail_queue_depth.dec()
 
 
-def send_email(to, subject, template, **kwargs):
+def send_async_batch(app, messages):
+    pending = len(messages)
+    metrics_registry.mail_queue_depth.inc(pending)
+    try:
+        with app.app_context():
+            with mail.connect() as connection:
+                for msg in messages:
+                    with metrics_registry.mail_send_seconds.time():
+                        connection.send(msg)
+                    pending -= 1
+                    metrics_registry.mail_queue_depth.dec()
+    finally:
+        metrics_registry.mail_queue_depth.dec(pending)
+
+
+@contextmanager
+def link_context():
+    # url_for(_external=True) needs a request; outside of one the links
+    # point at the configured public address
+    if has_request_context():
+        yield
+    else:
+        app = current_app._get_current_object()
+        with app.test_request_context(
+                base_url=app.config['KYBURZ_EXTERNAL_URL']):
+            yield
+
+
+def make_message(to, subject, template, **kwargs):
     app = current_app._get_current_object()
     msg = Message(app.config['KYBURZ_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
                   sender=app.config['KYBURZ_MAIL_SENDER'], recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
+    return msg
+
+
+def send_email(to, subject, template, **kwargs):
+    app = current_app._get_current_object()
+    msg = make_message(to, subject, template, **kwargs)
+    metrics_registry.mail_queue_depth.inc()
     thr = Thread(target=send_async_email, args=[app, msg])
     thr.start()
     return thr
+
+
+def send_email_batch(messages):
+    app = current_app._get_current_object()
+    thr = Thread(target=send_async_batch, args=[app, messages])
+    thr.start()
+    return thr
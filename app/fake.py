@@ -0,0 +1,256 @@
+import hashlib
+import json
+import math
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from fractions import Fraction
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+from . import db, tenancy
+from .archive import archive_before
+from .models import Role, User, Lesson, Problem, AnswerSubmission, \
+    TeachingRelationship, Mastery, Assignment
+from .student import misconceptions, recommend, worklist
+from .teacher import parse
+
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Daniel', 'Emma', 'Felix', 'Grace',
+               'Hugo', 'Isla', 'Jack', 'Kai', 'Lily', 'Mason', 'Nora',
+               'Oscar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tara', 'Umar',
+               'Vera', 'Wes', 'Xena', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia',
+              'Hughes', 'Ito', 'Jones', 'Khan', 'Lopez', 'Miller', 'Nguyen',
+              'Okafor', 'Patel', 'Quist', 'Rossi', 'Smith', 'Tanaka',
+              'Usman', 'Virtanen', 'Wong', 'Young', 'Zimmer']
+LESSON_NAMES = ['One-step equations', 'Two-step equations',
+                'Variables on both sides', 'The distributive property',
+                'Negative coefficients', 'Fractional solutions',
+                'Review', 'Quiz practice']
+DOMAIN = 'fake.kyburz'
+
+
+class Generator(object):
+    def __init__(self, seed=0, batch_size=10000):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.password_hash = generate_password_hash('cat')
+        self.now = datetime(2016, 1, 1)
+        # numbering continues after earlier runs so emails stay unique
+        self.run = last_id(User)
+        self.mastery = {}
+
+    def insert(self, table, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                db.session.execute(table.insert(), batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+
+    def user_rows(self, count, role, prefix):
+        for i in range(count):
+            first_name = self.rng.choice(FIRST_NAMES)
+            last_name = self.rng.choice(LAST_NAMES)
+            email = '{0}-{1}.{2}.{3}@{4}'.format(
+                prefix, self.run + i, first_name, last_name, DOMAIN).lower()
+            member_since = self.now - timedelta(
+                days=self.rng.randint(0, 730))
+            yield {'email': email,
+                   'first_name': first_name,
+                   'last_name': last_name,
+                   'role_id': role.id,
+                   'password_hash': self.password_hash,
+                   'avatar_hash': hashlib.md5(email).hexdigest(),
+                   'confirmed': True,
+                   'member_since': member_since,
+                   'last_seen': member_since}
+
+    def users(self, count, role_name, prefix):
+        role = Role.query.filter_by(name=role_name).first()
+        before = last_id(User)
+        self.insert(User.__table__, self.user_rows(count, role, prefix))
+        users = db.session.query(User.id, User.email) \
+            .filter(User.id > before,
+                    User.email.like(prefix + '-%@' + DOMAIN)) \
+            .order_by(User.id).all()
+        # the directory that login looks people up in
+        for i in range(0, len(users), self.batch_size):
+            tenancy.locate([email for user_id, email in
+                            users[i:i + self.batch_size]])
+            db.session.commit()
+        return [user_id for user_id, email in users]
+
+    def equation(self):
+        while True:
+            a = self.rng.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, -1, -2, -3])
+            b = self.rng.randint(-20, 20)
+            c = self.rng.choice([0, 0, 0, 1, 2, 3, -1, -2])
+            d = self.rng.randint(-20, 20)
+            if a == c:
+                continue
+            shape = self.rng.random()
+            if shape < 0.2 and b:
+                text = '{0}(x{1:+d})={2}'.format(a, b, d)
+            elif c:
+                text = '{0}x{1:+d}={2}x{3:+d}'.format(a, b, c, d)
+            else:
+                text = '{0}x{1:+d}={2}'.format(a, b, d)
+            return parse.parse_equation(text.replace('+0', ''))
+
+    def generate(self, teachers=20, students_per_teacher=30,
+                 lessons_per_teacher=5, problems_per_lesson=10,
+                 submissions=1000000, archive_after_days=120):
+        Role.insert_roles()
+        teacher_ids = self.users(teachers, 'Teacher', 't')
+        student_ids = self.users(teachers * students_per_teacher, 'User', 's')
+
+        before_lessons = last_id(Lesson)
+        classes = {}
+        relationships = []
+        for i, student_id in enumerate(student_ids):
+            teacher_id = teacher_ids[i % len(teacher_ids)]
+            classes.setdefault(teacher_id, []).append(student_id)
+            relationships.append({'teacher_id': teacher_id,
+                                  'student_id': student_id})
+        self.insert(TeachingRelationship.__table__, relationships)
+
+        self.insert(Lesson.__table__, (
+            {'author_id': teacher_id, 'number': number + 1,
+             'name': LESSON_NAMES[number % len(LESSON_NAMES)]}
+            for teacher_id in teacher_ids
+            for number in range(lessons_per_teacher)))
+        lessons = db.session.query(Lesson.id, Lesson.author_id) \
+            .filter(Lesson.id > before_lessons).order_by(Lesson.id).all()
+
+        problem_rows = []
+        for lesson_id, author_id in lessons:
+            for number in range(problems_per_lesson):
+                row = self.equation()
+                row.update(lesson_id=lesson_id, number=number + 1)
+                row.update(recommend.describe(row))
+                row.update(misconceptions.table_columns(row))
+                problem_rows.append(row)
+        self.insert(Problem.__table__, problem_rows)
+        problems = {}
+        for problem in db.session.query(
+                Problem.id, Problem.solution_numerator,
+                Problem.solution_denominator, Problem.left_side_numerator,
+                Problem.left_side_denominator, Problem.skill,
+                Problem.difficulty, Problem.misconceptions,
+                Lesson.author_id) \
+                .join(Lesson, Lesson.id == Problem.lesson_id) \
+                .filter(Lesson.id > before_lessons) \
+                .order_by(Problem.id):
+            problems.setdefault(problem.author_id, []).append(
+                (problem.id, Fraction(problem.solution_numerator,
+                                      problem.solution_denominator),
+                 Fraction(problem.left_side_numerator,
+                          problem.left_side_denominator),
+                 self.rng.gauss(0, 1), problem.skill, problem.difficulty,
+                 json.loads(problem.misconceptions)))
+
+        self.insert(AnswerSubmission.__table__,
+                    self.submission_rows(classes, problems, submissions))
+        self.insert(Mastery.__table__, (
+            {'user_id': user_id, 'skill': skill, 'rating': rating,
+             'attempts': attempts} for (user_id, skill), (rating, attempts)
+            in sorted(self.mastery.items())))
+        # old answers move to the archive and its summaries, as they do
+        # when the archive command runs
+        if archive_after_days is not None:
+            archive_before(self.now - timedelta(days=archive_after_days),
+                           batch_size=self.batch_size)
+        self.assign(lessons, classes)
+
+    def assign(self, lessons, classes):
+        before = last_id(Assignment)
+        self.insert(Assignment.__table__, (
+            {'lesson_id': lesson_id, 'teacher_id': author_id,
+             'due_at': self.now + timedelta(days=self.rng.randint(-90, 30)),
+             'created_at': self.now - timedelta(days=120)}
+            for lesson_id, author_id in lessons))
+        assignments = {}
+        for assignment in Assignment.query.filter(Assignment.id > before):
+            assignments.setdefault(assignment.teacher_id, []).append(
+                assignment)
+        # the work queue counts what each student already solved
+        for teacher_id in sorted(assignments):
+            student_ids = classes.get(teacher_id, [])
+            for i in range(0, len(student_ids), self.batch_size):
+                worklist.add_work(assignments[teacher_id],
+                                  student_ids[i:i + self.batch_size])
+            db.session.commit()
+
+    def submission_rows(self, classes, problems, count):
+        students = []
+        for teacher_id in sorted(classes):
+            students.extend((s, teacher_id) for s in classes[teacher_id])
+        # a few students do most of the work, and earlier problems get
+        # more attempts than later ones
+        activity = cumulative(self.rng.paretovariate(1.5) for s in students)
+        ability = dict((s, self.rng.gauss(0, 1)) for s, t in students)
+        popularity = {}
+        for teacher_id, teacher_problems in problems.items():
+            popularity[teacher_id] = cumulative(
+                1.0 / (i % 10 + 1) for i in range(len(teacher_problems)))
+        for i in range(count):
+            student_id, teacher_id = students[pick(self.rng, activity)]
+            teacher_problems = problems.get(teacher_id)
+            if not teacher_problems:
+                continue
+            (problem_id, solution, side, difficulty, skill, rated_difficulty,
+             table) = teacher_problems[pick(self.rng, popularity[teacher_id])]
+            chance = 1 / (1 + math.exp(difficulty - ability[student_id] - 0.5))
+            is_correct = self.rng.random() < chance
+            if not is_correct and table and self.rng.random() < 0.5:
+                # half the wrong answers come from a known mistake
+                solution = Fraction(self.rng.choice(sorted(table)))
+            elif not is_correct:
+                wrong = self.rng.randint(-20, 20)
+                solution = Fraction(wrong + 1 if wrong == solution else wrong)
+            state = self.mastery.get((student_id, skill), (0.0, 0))
+            self.mastery[student_id, skill] = (
+                recommend.rate(state[0], state[1], rated_difficulty,
+                               is_correct),
+                state[1] + 1)
+            yield {'user_id': student_id,
+                   'problem_id': problem_id,
+                   'variable_value': str(solution),
+                   'left_side_value': str(side),
+                   'right_side_value': str(side),
+                   'variable_numerator': solution.numerator,
+                   'variable_denominator': solution.denominator,
+                   'left_side_numerator': side.numerator,
+                   'left_side_denominator': side.denominator,
+                   'right_side_numerator': side.numerator,
+                   'right_side_denominator': side.denominator,
+                   'is_correct': is_correct,
+                   'misconception': None if is_correct else
+                   table.get(str(solution)),
+                   'timestamp': self.now - timedelta(
+                       seconds=self.rng.randint(0, 180 * 24 * 3600))}
+
+
+def last_id(model):
+    return db.session.query(func.max(model.id)).scalar() or 0
+
+
+def cumulative(weights):
+    totals = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        totals.append(total)
+    return totals
+
+
+def pick(rng, totals):
+    return bisect(totals, rng.random() * totals[-1])
+
+
+def generate_users(count, seed=None):
+    return Generator(seed).users(count, 'User', 'u')
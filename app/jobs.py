@@ -0,0 +1,199 @@
+import json
+import os
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from multiprocessing import Event, Process, cpu_count
+from flask import current_app
+from sqlalchemy import select
+from . import db
+from .models import Job
+from .sharding import shard_keys
+from .tenancy import use_shard
+
+jobs = Job.__table__
+
+tasks = {}
+
+
+class Task(object):
+    def __init__(self, name, function, max_attempts=None, template=None):
+        self.name = name
+        self.function = function
+        self.max_attempts = max_attempts
+        self.template = template
+
+
+def task(name, max_attempts=None, template=None):
+    def decorator(f):
+        tasks[name] = Task(name, f, max_attempts, template)
+        return f
+    return decorator
+
+
+class JobContext(object):
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, percent, message=None):
+        # status goes through its own connection so that it never commits
+        # the task's unfinished work
+        values = {'progress': int(percent), 'heartbeat': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:256]
+        db.engine.execute(jobs.update().where(jobs.c.id == self.job_id),
+                          **values)
+
+
+def enqueue(name, owner=None, **kwargs):
+    if name not in tasks:
+        raise KeyError('Unknown job {0}'.format(name))
+    max_attempts = tasks[name].max_attempts or \
+        current_app.config['KYBURZ_JOB_MAX_ATTEMPTS']
+    job = Job(name=name, args=json.dumps(kwargs), status='queued',
+              owner_id=owner and owner.id, max_attempts=max_attempts,
+              run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config['KYBURZ_JOBS_INLINE'] and claim(job.id, 'inline'):
+        # the task may have ended the session the job was loaded in
+        job_id = job.id
+        execute(job_id)
+        job = Job.query.get(job_id)
+    return job
+
+
+def worker_name():
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+def claim(job_id, worker):
+    now = datetime.utcnow()
+    # only one worker can move a job out of the queued state
+    claimed = db.session.execute(
+        jobs.update().where(jobs.c.id == job_id)
+        .where(jobs.c.status == 'queued')
+        .values(status='running', worker=worker, started_at=now,
+                heartbeat=now, attempts=jobs.c.attempts + 1)).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def claim_next(worker):
+    while True:
+        job_id = db.session.execute(
+            select([jobs.c.id]).where(jobs.c.status == 'queued')
+            .where(jobs.c.run_after <= datetime.utcnow())
+            .order_by(jobs.c.id).limit(1)).scalar()
+        db.session.commit()
+        if job_id is None or claim(job_id, worker):
+            return job_id
+
+
+def execute(job_id):
+    job = Job.query.get(job_id)
+    task = tasks.get(job.name)
+    try:
+        if task is None:
+            raise KeyError('Unknown job {0}'.format(job.name))
+        result = task.function(JobContext(job.id), **json.loads(job.args))
+    except Exception:
+        db.session.rollback()
+        failed(job_id, traceback.format_exc())
+    else:
+        db.session.execute(jobs.update().where(jobs.c.id == job_id).values(
+            status='done', progress=100, result=json.dumps(result),
+            args='{}', finished_at=datetime.utcnow()))
+        db.session.commit()
+
+
+def failed(job_id, error):
+    job = Job.query.get(job_id)
+    message = error.strip().splitlines()[-1][:256]
+    if job.attempts < job.max_attempts:
+        delay = current_app.config['KYBURZ_JOB_RETRY_DELAY'] * \
+            2 ** (job.attempts - 1)
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        job.message = 'Retrying after: ' + message
+    else:
+        job.status = 'failed'
+        job.message = message
+        job.args = '{}'
+        job.finished_at = datetime.utcnow()
+    job.error = error
+    db.session.add(job)
+    db.session.commit()
+    current_app.logger.error('Job %s (%s) failed:\n%s', job.id, job.name,
+                             error)
+
+
+def requeue_stale():
+    # a worker that died mid-job stops sending heartbeats
+    cutoff = datetime.utcnow() - timedelta(
+        seconds=current_app.config['KYBURZ_JOB_TIMEOUT'])
+    for job_id, in db.session.execute(
+            select([jobs.c.id]).where(jobs.c.status == 'running')
+            .where(jobs.c.heartbeat < cutoff)).fetchall():
+        failed(job_id, 'The worker stopped responding.')
+
+
+def work(stopped, poll_interval):
+    worker = worker_name()
+    shards = shard_keys(current_app)
+    while not stopped():
+        # every shard keeps its own queue
+        idle = True
+        for shard in shards:
+            with use_shard(shard):
+                requeue_stale()
+                job_id = claim_next(worker)
+                if job_id is not None:
+                    execute(job_id)
+                    idle = False
+        if idle:
+            time.sleep(poll_interval)
+
+
+def worker_process(app, stop):
+    # signal handlers only set flags; touching the shared event from a
+    # handler can deadlock on its lock
+    stopping = []
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM,
+                  lambda signum, frame: stopping.append(signum))
+    with app.app_context():
+        # connections inherited from the parent must not be shared
+        for shard in shard_keys(app):
+            db.get_engine(app, bind=shard).dispose()
+        work(lambda: stopping or stop.is_set(),
+             app.config['KYBURZ_WORKER_POLL_INTERVAL'])
+
+
+def run_workers(app, processes=None):
+    processes = processes or app.config['KYBURZ_WORKER_PROCESSES'] or \
+        cpu_count()
+    stop = Event()
+    stopping = []
+
+    def shutdown(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    with app.app_context():
+        for shard in shard_keys(app):
+            db.get_engine(app, bind=shard).dispose()
+    children = []
+    while not stopping:
+        children = [child for child in children if child.is_alive()]
+        while len(children) < processes:
+            child = Process(target=worker_process, args=(app, stop))
+            child.start()
+            children.append(child)
+        time.sleep(1.0)
+    # running jobs are allowed to finish
+    stop.set()
+    for child in children:
+        child.join()
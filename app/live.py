@@ -0,0 +1,93 @@
+import json
+from threading import Lock
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+from sqlalchemy import func, cast, Integer
+from . import db
+from .sharding import current_shard
+from .models import AnswerSubmission, Problem, User
+
+
+class ProgressBroker(object):
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self.lock = Lock()
+        self.channels = {}
+
+    def subscribe(self, channel):
+        queue = Queue(self.queue_size)
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self.lock:
+            queues = self.channels.get(channel)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.channels[channel]
+
+    def publish(self, channel, event):
+        # lesson ids repeat across shards
+        queues = self.channels.get((current_shard(), channel))
+        if not queues:
+            return
+        with self.lock:
+            queues = list(queues)
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except Full:
+                pass
+
+    def listen(self, channel, keepalive=15):
+        channel = current_shard(), channel
+
+        def events():
+            queue = self.subscribe(channel)
+            try:
+                yield
+                while True:
+                    try:
+                        yield queue.get(timeout=keepalive)
+                    except Empty:
+                        yield None
+            finally:
+                self.unsubscribe(channel, queue)
+        stream = events()
+        # subscribed from here on, so nothing published after the caller
+        # reads its snapshot is missed; closing the stream unsubscribes
+        next(stream)
+        return stream
+
+
+broker = ProgressBroker()
+
+
+def format_event(event, data):
+    return 'event: {0}\ndata: {1}\n\n'.format(event, json.dumps(data))
+
+
+def lesson_progress(lesson_id):
+    rows = db.session.query(
+        AnswerSubmission.user_id,
+        User.first_name,
+        User.last_name,
+        AnswerSubmission.problem_id,
+        func.max(cast(AnswerSubmission.is_correct, Integer)),
+        func.count(AnswerSubmission.id)) \
+        .join(Problem, Problem.id == AnswerSubmission.problem_id) \
+        .join(User, User.id == AnswerSubmission.user_id) \
+        .filter(Problem.lesson_id == lesson_id) \
+        .group_by(AnswerSubmission.user_id, User.first_name, User.last_name,
+                  AnswerSubmission.problem_id)
+    return [{'user_id': user_id,
+             'student': u'{0} {1}'.format(first_name, last_name),
+             'problem_id': problem_id,
+             'is_correct': bool(solved),
+             'attempts': attempts}
+            for user_id, first_name, last_name, problem_id, solved, attempts
+            in rows]
@@ -2,7 +2,8 @@ from flask.ext.wtf import Form
 from wtforms import StringField, BooleanField, SelectField,SubmitField
 from wtforms.validators import Required, Length, Email
 from wtforms import ValidationError
-from ..models import Role, User
+from ..models import Role
+from ..tenancy import email_taken
 
 
 class EditProfileForm(Form):
@@ -27,6 +28,8 @@ class EditProfileAdminForm(Form):
         self.user = user
 
     def validate_email(self, field):
-        if field.data != self.user.email and \
-                User.query.filter_by(email=field.data).first():
-            raise ValidationError('Email already registered.')
\ No newline at end of file
+        if field.data != self.user.email and email_taken(field.data):
+            raise ValidationError('Email already registered.')
+
+class DeleteUserForm(Form):
+    submit = SubmitField('Delete User')
@@ -1,10 +1,13 @@
-from flask import render_template, redirect, url_for, flash
+import json
+from flask import render_template, redirect, url_for, flash, request, \
+    abort, jsonify
 from flask.ext.login import login_required, current_user
 from . import main
-from .forms import EditProfileForm, EditProfileAdminForm
-from .. import db
-from ..models import Role, User
+from .forms import EditProfileForm, EditProfileAdminForm, DeleteUserForm
+from .. import db, profiler, jobs, tenancy
+from ..models import Role, User, Job, user_permissions
 from ..decorators import admin_required
+from ..deletion import delete_user
 
 
 @main.route('/', methods=['GET', 'POST'])
@@ -44,9 +47,11 @@ def edit_profile_admin(id):
     user = User.query.get_or_404(id)
     form = EditProfileAdminForm(user=user)
     if form.validate_on_submit():
+        tenancy.relocate(user.email, form.email.data)
         user.email = form.email.data
         user.confirmed = form.confirmed.data
         user.role = Role.query.get(form.role.data)
+        user_permissions.invalidate_on_commit(user.id)
         user.first_name = form.first_name.data
         user.last_name = form.last_name.data
         db.session.add(user)
@@ -57,4 +62,58 @@ def edit_profile_admin(id):
     form.role.data = user.role_id
     form.first_name.data = user.first_name
     form.last_name.data = user.last_name
-    return render_template('edit_profile.html', form=form, user=user)
\ No newline at end of file
+    return render_template('edit_profile.html', form=form, user=user)
+
+
+@main.route('/admin/delete-user/<int:id>', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def delete_user_admin(id):
+    user = User.query.get_or_404(id)
+    deletion = delete_user(user)
+    form = DeleteUserForm()
+    if form.validate_on_submit():
+        email = user.email
+        deletion.execute()
+        flash(u'{0} was deleted.'.format(email))
+        return redirect(url_for('.index'))
+    return render_template('delete.html', form=form,
+                           title=u'{0} ({1})'.format(user.full_name,
+                                                     user.email),
+                           counts=deletion.counts())
+
+
+def job_for_current_user(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.owner_id != current_user.id and \
+            not current_user.is_administrator():
+        abort(403)
+    return job
+
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def job(job_id):
+    job = job_for_current_user(job_id)
+    task = jobs.tasks.get(job.name)
+    return render_template('job.html', job=job,
+                           template=task and task.template,
+                           result=job.result and json.loads(job.result))
+
+
+@main.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status(job_id):
+    return jsonify(job_for_current_user(job_id).to_json())
+
+
+@main.route('/admin/profiling')
+@login_required
+@admin_required
+def profiling():
+    sort = request.args.get('sort', 'total_time')
+    if sort not in ('total_time', 'average_time', 'max_time',
+                    'average_queries', 'repeated_queries', 'sql_time'):
+        sort = 'total_time'
+    return render_template('profiling.html', profiler=profiler,
+                           endpoints=profiler.top_offenders(sort), sort=sort)
@@ -0,0 +1,309 @@
+import atexit
+import errno
+import fcntl
+import hmac
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from flask import Response, request, abort, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# the totals of processes that have exited
+MERGED = 'merged.json'
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+
+    def key(self, labels):
+        return self.name + json.dumps(sorted(labels.items()))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            values = self.registry.local_values()
+            values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(registry, name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            values = self.registry.local_values()
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.time()
+        try:
+            yield labels
+        finally:
+            self.observe(time.time() - start, **labels)
+
+
+class Metrics(object):
+    def __init__(self, app=None):
+        self.metrics = OrderedDict()
+        # the request threads of one process share the values
+        self.lock = Lock()
+        self.values = {}
+        self.pid = None
+        self.filename = None
+        self.directory = None
+        self.flush_interval = 0
+        self.last_flush = 0
+
+        self.parse_seconds = self.histogram(
+            'kyburz_parse_equation_seconds', 'Time spent parsing equations.')
+        self.answers_graded = self.counter(
+            'kyburz_answers_graded_total', 'Answer submissions graded.')
+        self.mail_queue_depth = self.gauge(
+            'kyburz_mail_queue_depth', 'Emails waiting to be sent.')
+        self.mail_send_seconds = self.histogram(
+            'kyburz_mail_send_seconds', 'Time spent sending one email.')
+        self.login_seconds = self.histogram(
+            'kyburz_login_seconds', 'Time spent checking a login form.')
+        self.password_hash_seconds = self.histogram(
+            'kyburz_password_hash_seconds',
+            'Time spent generating or checking password hashes.')
+        self.pool_checkout_seconds = self.histogram(
+            'kyburz_db_pool_checkout_seconds',
+            'Time spent waiting for a database connection.')
+        self.cache_invalidations = self.counter(
+            'kyburz_cache_invalidations_total',
+            'Cache entries dropped because the data behind them changed.')
+        self.admission_rejections = self.counter(
+            'kyburz_admission_rejections_total',
+            'Requests turned away because an endpoint was over its limits.')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config['KYBURZ_METRICS_DIR']
+        self.flush_interval = app.config['KYBURZ_METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            app.after_request(self.after_request)
+            atexit.register(self.flush)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        if not event.contains(Engine, 'engine_connect', self.engine_connect):
+            event.listen(Engine, 'engine_connect', self.engine_connect)
+
+    def counter(self, name, help):
+        return self.register(Counter(self, name, help))
+
+    def gauge(self, name, help):
+        return self.register(Gauge(self, name, help))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(self, name, help, buckets))
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def local_values(self):
+        # a forked worker starts counting from zero under its own file;
+        # callers hold the lock
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.values = {}
+            self.filename = '{0}-{1}.json'.format(self.pid, int(time.time()))
+        return self.values
+
+    def after_request(self, response):
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    def snapshot(self):
+        with self.lock:
+            values = self.local_values()
+            filename = self.filename
+            return filename, dict((key, list(value) if isinstance(
+                value, list) else value) for key, value in values.items())
+
+    def flush(self):
+        filename, values = self.snapshot()
+        write_values(os.path.join(self.directory, filename), values)
+        self.last_flush = time.time()
+
+    def merge_exited(self):
+        # folds the files of processes that have exited into one, so the
+        # directory does not grow with every restart
+        with open(os.path.join(self.directory, 'merge.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = [filename for filename in os.listdir(self.directory)
+                      if file_pid(filename) is not None and
+                      not process_alive(file_pid(filename))]
+            if not exited:
+                return
+            merged = read_values(os.path.join(self.directory, MERGED)) or {}
+            for filename in exited:
+                # gauges describe live processes only
+                add_values(merged, dict(
+                    (key, value) for key, value in
+                    (read_values(os.path.join(self.directory, filename)) or
+                     {}).items()
+                    if not isinstance(self.metrics.get(key.split('[')[0]),
+                                      Gauge)))
+            write_values(os.path.join(self.directory, MERGED), merged)
+            for filename in exited:
+                os.unlink(os.path.join(self.directory, filename))
+
+    def collect(self):
+        filename, own = self.snapshot()
+        if not self.directory:
+            return [own]
+        self.merge_exited()
+        collected = [own]
+        for other in os.listdir(self.directory):
+            if other == filename or \
+                    other != MERGED and file_pid(other) is None:
+                continue
+            values = read_values(os.path.join(self.directory, other))
+            if values is not None:
+                collected.append(values)
+        return collected
+
+    def aggregate(self):
+        totals = {}
+        for values in self.collect():
+            add_values(totals, values)
+        return totals
+
+    def allowed(self):
+        if request.remote_addr in current_app.config['KYBURZ_METRICS_ALLOW']:
+            return True
+        expected = current_app.config['KYBURZ_METRICS_TOKEN']
+        scheme, _, token = request.headers.get('Authorization', '') \
+            .partition(' ')
+        return bool(expected) and scheme.lower() == 'bearer' and \
+            hmac.compare_digest(token.encode('utf-8'),
+                                expected.encode('utf-8'))
+
+    def export(self):
+        if not self.allowed():
+            abort(404)
+        totals = self.aggregate()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append('# HELP {0} {1}'.format(name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(name, metric.type))
+            for key in sorted(k for k in totals if k.split('[')[0] == name):
+                labels = OrderedDict(json.loads(key[len(name):]))
+                value = totals[key]
+                if metric.type != 'histogram':
+                    lines.append(sample(name, labels, value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value):
+                    cumulative += count
+                    bucket_labels = OrderedDict(labels, le=str(bound))
+                    lines.append(sample(name + '_bucket', bucket_labels,
+                                        cumulative))
+                lines.append(sample(name + '_sum', labels, value[-1]))
+                lines.append(sample(name + '_count', labels, cumulative))
+        return Response('\n'.join(lines) + '\n',
+                        mimetype='text/plain; version=0.0.4')
+
+    def engine_connect(self, connection, branch):
+        pool = connection.engine.pool
+        if getattr(pool, 'kyburz_timed', False):
+            return
+        connect = pool.connect
+
+        def timed_connect():
+            with self.pool_checkout_seconds.time():
+                return connect()
+        pool.connect = timed_connect
+        pool.kyburz_timed = True
+
+
+def read_values(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def write_values(path, values):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(values, f)
+    os.rename(path + '.tmp', path)
+
+
+def add_values(totals, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            total = totals.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                total[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def file_pid(filename):
+    # the files of processes are named <pid>-<start time>.json; anything
+    # else in the directory is not ours
+    pid = filename.split('-')[0]
+    if filename.endswith('.json') and '-' in filename and pid.isdigit():
+        return int(pid)
+    return None
+
+
+def escape(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(u'{0}="{1}"'.format(k, escape(v))
+                               for k, v in labels.items()) + '}'
+    return u'{0} {1}'.format(name, value)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # the process exists but belongs to another user
+        return e.errno == errno.EPERM
+    return True
@@ -1,10 +1,12 @@
+import json
 from datetime import datetime
 import hashlib
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from flask import current_app, request
 from flask.ext.login import UserMixin, AnonymousUserMixin
-from . import db, login_manager
+from . import db, login_manager, metrics_registry, bus
+from .caching import SharedCache
 
 
 class Permission:
@@ -33,6 +35,7 @@ class Role(db.Model):
             role.permissions = roles[r]
             db.session.add(role)
         db.session.commit()
+        user_permissions.clear()
 
     def __repr__(self):
         return '<Role %r>' % self.name
@@ -52,6 +55,10 @@ class Problem(db.Model):
     solution_denominator = db.Column(db.Integer)
     left_side_numerator = db.Column(db.Integer)
     left_side_denominator = db.Column(db.Integer)
+    skill = db.Column(db.String(16))
+    difficulty = db.Column(db.Float)
+    # JSON object from each wrong answer a common mistake gives to its name
+    misconceptions = db.Column(db.Text)
 
 
 class Lesson(db.Model):
@@ -60,20 +67,150 @@ class Lesson(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     name = db.Column(db.String(128), default='')
     number = db.Column(db.Integer)
+    version = db.Column(db.Integer, default=1)
     problems = db.relationship('Problem', foreign_keys=[Problem.lesson_id],
                                backref='lesson', lazy='dynamic')
 
 
+class Assignment(db.Model):
+    __tablename__ = 'assignments'
+    id = db.Column(db.Integer, primary_key=True)
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'), index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    due_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    lesson = db.relationship('Lesson')
+
+
+class WorkItem(db.Model):
+    __tablename__ = 'work_items'
+    __table_args__ = (db.Index('ix_work_items_student_id_completed_at_due_at',
+                               'student_id', 'completed_at', 'due_at'),
+                      db.Index('ix_work_items_lesson_id', 'lesson_id'))
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                           primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'),
+                              primary_key=True, index=True)
+    # copied from the assignment so the queue is read without joins
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'))
+    lesson_name = db.Column(db.String(128))
+    due_at = db.Column(db.DateTime)
+    problems_total = db.Column(db.Integer, default=0)
+    problems_solved = db.Column(db.Integer, default=0)
+    completed_at = db.Column(db.DateTime)
+
+
 class AnswerSubmission(db.Model):
     __tablename__ = 'answer_submissions'
+    __table_args__ = (db.Index('ix_answer_submissions_user_id_problem_id',
+                               'user_id', 'problem_id'),
+                      db.Index('ix_answer_submissions_problem_id_answer',
+                               'problem_id', 'variable_numerator',
+                               'variable_denominator', 'left_side_numerator',
+                               'left_side_denominator', 'right_side_numerator',
+                               'right_side_denominator'),
+                      db.Index('ix_answer_submissions_user_id_client_id',
+                               'user_id', 'client_id', unique=True),
+                      # covers the lesson reads of the item analysis
+                      db.Index('ix_answer_submissions_problem_id_user_id',
+                               'problem_id', 'user_id', 'is_correct', 'id'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
-    problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'), index=True)
+    problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'))
     variable_value = db.Column(db.String(32), default='')
     left_side_value = db.Column(db.String(32), default='')
     right_side_value = db.Column(db.String(32), default='')
+    variable_numerator = db.Column(db.Integer)
+    variable_denominator = db.Column(db.Integer)
+    left_side_numerator = db.Column(db.Integer)
+    left_side_denominator = db.Column(db.Integer)
+    right_side_numerator = db.Column(db.Integer)
+    right_side_denominator = db.Column(db.Integer)
     is_correct = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    client_id = db.Column(db.String(36))
+    steps = db.Column(db.Text)
+    step_checks = db.Column(db.String(32))
+    misconception = db.Column(db.String(32))
+
+
+class AnswerRollup(db.Model):
+    __tablename__ = 'answer_rollups'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'),
+                           primary_key=True, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    correct = db.Column(db.Integer, default=0)
+    first_correct_at = db.Column(db.DateTime)
+    last_submitted_at = db.Column(db.DateTime)
+
+
+class Mastery(db.Model):
+    __tablename__ = 'mastery'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    skill = db.Column(db.String(16), primary_key=True)
+    rating = db.Column(db.Float, default=0.0)
+    attempts = db.Column(db.Integer, default=0)
+
+
+class BackfillCheckpoint(db.Model):
+    __tablename__ = 'backfill_checkpoints'
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, default=0)
+    rows = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_after',
+                               'status', 'run_after'),)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64))
+    args = db.Column(db.Text, default='{}')
+    status = db.Column(db.String(16), default='queued')
+    progress = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(256))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    worker = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_json(self):
+        return {'id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'progress': self.progress,
+                'message': self.message,
+                'attempts': self.attempts,
+                'result': json.loads(self.result) if self.result else None}
+
+
+class Tenant(db.Model):
+    __tablename__ = 'tenants'
+    __table_args__ = {'info': {'directory': True}}
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), unique=True)
+    shard = db.Column(db.String(64))
+    moving = db.Column(db.Boolean, default=False)
+
+
+class UserLocation(db.Model):
+    __tablename__ = 'user_locations'
+    __table_args__ = {'info': {'directory': True}}
+    email = db.Column(db.String(64), primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), index=True)
 
 
 class TeachingRelationship(db.Model):
@@ -120,24 +257,8 @@ class User(UserMixin, db.Model):
 
     @staticmethod
     def generate_fake(count=100):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed
-        import forgery_py
-
-        seed()
-        for i in range(count):
-            u = User(email=forgery_py.internet.email_address(),
-                     password=forgery_py.lorem_ipsum.word(),
-                     confirmed=True,
-                     last_name=forgery_py.name.last_name(),
-                     first_name=forgery_py.name.first_name(),
-                     member_since=forgery_py.date.date(True))
-            db.session.add(u)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
-
+        from .fake import generate_users
+        generate_users(count)
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -153,11 +274,12 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        with metrics_registry.password_hash_seconds.time(operation='generate'):
+            self.password_hash = generate_password_hash(password)
 
     @property
     def full_name(self):
-        return '{first} {last}'.format(first=self.first_name, last=self.last_name)
+        return u'{first} {last}'.format(first=self.first_name, last=self.last_name)
 
     @full_name.setter
     def full_name(self, full_name):
@@ -165,11 +287,16 @@ class User(UserMixin, db.Model):
 
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        with metrics_registry.password_hash_seconds.time(operation='check'):
+            return check_password_hash(self.password_hash, password)
 
-    def generate_confirmation_token(self, expiration=3600):
+    @staticmethod
+    def confirmation_token(user_id, expiration=3600):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
-        return s.dumps({'confirm': self.id})
+        return s.dumps({'confirm': user_id})
+
+    def generate_confirmation_token(self, expiration=3600):
+        return User.confirmation_token(self.id, expiration)
 
     def confirm(self, token):
         s = Serializer(current_app.config['SECRET_KEY'])
@@ -222,9 +349,13 @@ class User(UserMixin, db.Model):
         db.session.add(self)
         return True
 
+    def get_auth_token(self):
+        from .tenancy import remember_token
+        return remember_token(self)
+
     def can(self, permissions):
-        return self.role is not None and \
-            (self.role.permissions & permissions) == permissions
+        granted = user_permissions.get(self)
+        return granted is not None and (granted & permissions) == permissions
 
     def is_administrator(self):
         return self.can(Permission.ADMINISTER)
@@ -275,6 +406,16 @@ class User(UserMixin, db.Model):
         return '<User %r>' % self.full_name
 
 
+class PermissionCache(SharedCache):
+    def get(self, user):
+        # saves loading the role on every request
+        load = lambda: user.role and user.role.permissions
+        return load() if user.id is None else self.cached(user.id, load)
+
+
+user_permissions = PermissionCache(bus, 'user_permissions')
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
         return False
@@ -0,0 +1,96 @@
+import time
+from collections import deque
+from threading import Lock
+from flask import g, request, request_started, request_finished
+from flask.ext.sqlalchemy import get_debug_queries
+
+
+class EndpointStats(object):
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.repeated_queries = 0
+
+    @property
+    def average_time(self):
+        return self.total_time / self.requests
+
+    @property
+    def average_queries(self):
+        return float(self.queries) / self.requests
+
+    def add(self, elapsed, queries, sql_time, repeated):
+        self.requests += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.sql_time += sql_time
+        self.repeated_queries += repeated
+
+
+class RequestProfiler(object):
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.endpoints = {}
+        self.slow_requests = deque(maxlen=50)
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['KYBURZ_PROFILE_REQUESTS']:
+            return
+        self.enabled = True
+        app.config['SQLALCHEMY_RECORD_QUERIES'] = True
+        request_started.connect(self.request_started, app)
+        request_finished.connect(self.request_finished, app)
+
+    def request_started(self, app, **extra):
+        g.profile_start = time.time()
+
+    def request_finished(self, app, response, **extra):
+        start = getattr(g, 'profile_start', None)
+        if start is None:
+            return
+        elapsed = time.time() - start
+        queries = get_debug_queries()
+        sql_time = sum(query.duration for query in queries)
+        repeated = len(queries) - len(set(q.statement for q in queries))
+        endpoint = request.endpoint or request.path
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(endpoint)
+            stats.add(elapsed, len(queries), sql_time, repeated)
+        if elapsed < app.config['KYBURZ_SLOW_REQUEST_TIME']:
+            return
+        # bound parameters hold passwords, emails and answers, so only the
+        # statements are kept and logged
+        queries = [{'statement': q.statement, 'duration': q.duration,
+                    'context': q.context} for q in queries]
+        slowest = sorted(queries, key=lambda q: -q['duration'])
+        self.slow_requests.appendleft({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'time': elapsed,
+            'sql_time': sql_time,
+            'queries': len(queries),
+            'slowest': slowest[:app.config['KYBURZ_SLOWEST_QUERIES_SHOWN']]})
+        app.logger.warning(
+            'Slow request: %s %s took %.3fs with %d queries (%.3fs in SQL)\n%s',
+            request.method, request.path, elapsed, len(queries), sql_time,
+            '\n'.join('%.4fs %s (%s)' % (q['duration'], q['statement'],
+                                         q['context'])
+                      for q in queries))
+
+    def top_offenders(self, key='total_time', limit=25):
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+        return sorted(endpoints, key=lambda s: -getattr(s, key))[:limit]
@@ -0,0 +1,158 @@
+import re
+from sqlalchemy import DDL, event, func, literal_column, text, union_all, \
+    select, literal
+from . import db
+from .models import Lesson, Problem
+
+# Lessons and problems share one SQLite FTS5 table. Their rows are told
+# apart by the rowid: lesson n is 2n and problem n is 2n + 1, so the
+# triggers can find a row without scanning the index.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE search_index USING fts5("
+    "body, author, lesson_id UNINDEXED)",
+    "CREATE TRIGGER lessons_search_insert AFTER INSERT ON lessons BEGIN "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "VALUES (new.id * 2, new.name, new.author_id, new.id); END",
+    "CREATE TRIGGER lessons_search_update AFTER UPDATE OF name, author_id "
+    "ON lessons BEGIN "
+    "UPDATE search_index SET body = new.name, author = new.author_id "
+    "WHERE rowid = new.id * 2; "
+    "UPDATE search_index SET author = new.author_id WHERE rowid IN "
+    "(SELECT id * 2 + 1 FROM problems WHERE lesson_id = new.id); END",
+    "CREATE TRIGGER lessons_search_delete AFTER DELETE ON lessons BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER problems_search_insert AFTER INSERT ON problems BEGIN "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT new.id * 2 + 1, new.text, author_id, id FROM lessons "
+    "WHERE id = new.lesson_id; END",
+    "CREATE TRIGGER problems_search_update AFTER UPDATE OF text, lesson_id "
+    "ON problems BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT new.id * 2 + 1, new.text, author_id, id FROM lessons "
+    "WHERE id = new.lesson_id; END",
+    "CREATE TRIGGER problems_search_delete AFTER DELETE ON problems BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS search_index"]
+
+# Lesson names are stemmed as English; equations are indexed verbatim.
+LESSON_VECTOR = "to_tsvector('english', coalesce(name, ''))"
+PROBLEM_VECTOR = "to_tsvector('simple', coalesce(text, ''))"
+POSTGRES_DDL = [
+    "CREATE INDEX ix_lessons_search ON lessons USING gin (" +
+    LESSON_VECTOR + ")",
+    "CREATE INDEX ix_problems_search ON problems USING gin (" +
+    PROBLEM_VECTOR + ")",
+]
+
+token_pattern = re.compile(r'\w+', re.UNICODE)
+
+
+for statement in SQLITE_DDL:
+    event.listen(Problem.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+for statement in SQLITE_DROP:
+    event.listen(Lesson.__table__, 'before_drop',
+                 DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Lesson.__table__, 'after_create',
+             DDL(POSTGRES_DDL[0]).execute_if(dialect='postgresql'))
+event.listen(Problem.__table__, 'after_create',
+             DDL(POSTGRES_DDL[1]).execute_if(dialect='postgresql'))
+
+
+class SearchResult(object):
+    def __init__(self, kind, id, lesson_id, text):
+        self.kind = kind
+        self.id = id
+        self.lesson_id = lesson_id
+        self.text = text
+        self.lesson = None
+
+
+class SearchPage(object):
+    def __init__(self, query, page, per_page, results, has_next):
+        self.query = query
+        self.page = page
+        self.per_page = per_page
+        self.items = results
+        self.has_prev = page > 1
+        self.has_next = has_next
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+
+def search(author_id, query, page=1, per_page=20):
+    terms = token_pattern.findall(query)
+    if not terms:
+        return SearchPage(query, page, per_page, [], False)
+    dialect = db.session.get_bind(Lesson.__mapper__).dialect.name
+    if dialect == 'sqlite':
+        search_rows = sqlite_search
+    elif dialect == 'postgresql':
+        search_rows = postgres_search
+    else:
+        search_rows = like_search
+    # one extra row says whether there is a next page without counting
+    rows = search_rows(author_id, terms, per_page + 1, (page - 1) * per_page)
+    results = [SearchResult(*row) for row in rows[:per_page]]
+    lesson_ids = set(result.lesson_id for result in results)
+    if lesson_ids:
+        lessons = dict((lesson.id, lesson) for lesson in
+                       Lesson.query.filter(Lesson.id.in_(lesson_ids)))
+        for result in results:
+            result.lesson = lessons.get(result.lesson_id)
+    return SearchPage(query, page, per_page, results, len(rows) > per_page)
+
+
+def sqlite_search(author_id, terms, limit, offset):
+    match = u'author : {0} AND body : ({1})'.format(
+        int(author_id), u' '.join(u'"{0}"*'.format(t) for t in terms))
+    rows = db.session.execute(text(
+        "SELECT rowid, lesson_id, body FROM search_index "
+        "WHERE search_index MATCH :match "
+        "ORDER BY bm25(search_index, 1.0, 0.0) LIMIT :limit OFFSET :offset"),
+        {'match': match, 'limit': limit, 'offset': offset})
+    return [('problem' if rowid % 2 else 'lesson', rowid // 2, lesson_id, body)
+            for rowid, lesson_id, body in rows]
+
+
+def postgres_search(author_id, terms, limit, offset):
+    lesson_query = func.to_tsquery(
+        'english', u' & '.join(t + u':*' for t in terms))
+    problem_query = func.to_tsquery(
+        'simple', u' & '.join(t + u':*' for t in terms))
+    lesson_vector = literal_column(LESSON_VECTOR)
+    problem_vector = literal_column(PROBLEM_VECTOR)
+    lessons = select([literal('lesson').label('kind'), Lesson.id,
+                      Lesson.id.label('lesson_id'), Lesson.name.label('body'),
+                      func.ts_rank(lesson_vector, lesson_query).label('rank')]) \
+        .where(Lesson.author_id == author_id) \
+        .where(lesson_vector.op('@@')(lesson_query))
+    problems = select([literal('problem').label('kind'), Problem.id,
+                       Problem.lesson_id, Problem.text.label('body'),
+                       func.ts_rank(problem_vector, problem_query)
+                       .label('rank')]) \
+        .select_from(Problem.__table__.join(Lesson.__table__)) \
+        .where(Lesson.author_id == author_id) \
+        .where(problem_vector.op('@@')(problem_query))
+    combined = union_all(lessons, problems).alias('results')
+    rows = db.session.execute(
+        select([combined.c.kind, combined.c.id, combined.c.lesson_id,
+                combined.c.body])
+        .order_by(combined.c.rank.desc(), combined.c.id)
+        .limit(limit).offset(offset))
+    return [tuple(row) for row in rows]
+
+
+def like_search(author_id, terms, limit, offset):
+    lessons = Lesson.query.filter(Lesson.author_id == author_id)
+    problems = Problem.query.join(Lesson).filter(Lesson.author_id == author_id)
+    for term in terms:
+        lessons = lessons.filter(Lesson.name.contains(term))
+        problems = problems.filter(Problem.text.contains(term))
+    rows = [('lesson', l.id, l.id, l.name) for l in
+            lessons.order_by(Lesson.number).limit(limit + offset)]
+    rows += [('problem', p.id, p.lesson_id, p.text) for p in
+             problems.order_by(Problem.id).limit(limit + offset)]
+    return rows[offset:offset + limit]
@@ -0,0 +1,57 @@
+from functools import partial
+from flask import g, has_app_context
+from flask.ext.sqlalchemy import SQLAlchemy, _SignallingSession
+from sqlalchemy import orm
+
+
+def current_shard():
+    # None is the main database, which also holds the tenant directory
+    return g.get('shard') if has_app_context() else None
+
+
+def shard_keys(app):
+    return [None] + sorted(app.config['KYBURZ_SHARDS'])
+
+
+def is_directory(mapper, clause):
+    if mapper is not None:
+        tables = [mapper.mapped_table]
+    elif getattr(clause, 'table', None) is not None:
+        tables = [clause.table]
+    else:
+        tables = getattr(clause, 'froms', ())
+    return any(getattr(table, 'info', {}).get('directory')
+               for table in tables)
+
+
+class ShardedSession(_SignallingSession):
+    def __init__(self, db, **options):
+        self.sa = db
+        _SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        shard = current_shard()
+        if shard is not None and not is_directory(mapper, clause):
+            return self.sa.get_engine(self.app, bind=shard)
+        return _SignallingSession.get_bind(self, mapper, clause)
+
+
+class ShardedSQLAlchemy(SQLAlchemy):
+    def init_app(self, app):
+        app.config.setdefault('KYBURZ_SHARDS', {})
+        # shards are ordinary binds, so their engines and pools are managed
+        # like any other
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update(app.config['KYBURZ_SHARDS'])
+        app.config['SQLALCHEMY_BINDS'] = binds
+        SQLAlchemy.init_app(self, app)
+
+    def create_scoped_session(self, options=None):
+        options = dict(options or {})
+        scopefunc = options.pop('scopefunc', None)
+        return orm.scoped_session(partial(ShardedSession, self, **options),
+                                  scopefunc=scopefunc)
+
+    @property
+    def engine(self):
+        return self.get_engine(self.get_app(), bind=current_shard())
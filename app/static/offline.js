@@ -0,0 +1,222 @@
+(function ($) {
+    'use strict';
+
+    var QUEUE_KEY = 'kyburz-answer-queue';
+    var BATCH_SIZE = 200;
+    var RETRY_SECONDS = 15;
+
+    var root = $('#offline-lesson');
+    if (!root.length) {
+        return;
+    }
+    var bundleKey = 'kyburz-bundle-' + root.data('lesson-id');
+    var syncing = false;
+
+    function load(key, fallback) {
+        try {
+            return JSON.parse(window.localStorage.getItem(key)) || fallback;
+        } catch (e) {
+            return fallback;
+        }
+    }
+
+    function save(key, value) {
+        try {
+            window.localStorage.setItem(key, JSON.stringify(value));
+        } catch (e) {}
+    }
+
+    function gcd(a, b) {
+        while (b) {
+            var t = b;
+            b = a % b;
+            a = t;
+        }
+        return Math.abs(a);
+    }
+
+    // mirrors fractions.Fraction for the inputs the answer form accepts
+    function parseFraction(text) {
+        var value = String(text).replace(/\s+/g, ''), match, n, d;
+        if ((match = /^([+-]?\d+)(?:\/(\d+))?$/.exec(value))) {
+            n = parseInt(match[1], 10);
+            d = match[2] === undefined ? 1 : parseInt(match[2], 10);
+        } else if ((match = /^([+-]?)(\d*)\.(\d+)$/.exec(value))) {
+            d = Math.pow(10, match[3].length);
+            n = parseInt((match[2] || '0') + match[3], 10);
+            if (match[1] === '-') {
+                n = -n;
+            }
+        } else {
+            return null;
+        }
+        if (!d) {
+            return null;
+        }
+        var g = gcd(n, d) || 1;
+        return (n / g) + '/' + (d / g);
+    }
+
+    function sha256(text) {
+        var bytes = new TextEncoder().encode(text);
+        return window.crypto.subtle.digest('SHA-256', bytes).then(function (digest) {
+            return Array.prototype.map.call(new Uint8Array(digest), function (b) {
+                return ('0' + b.toString(16)).slice(-2);
+            }).join('');
+        });
+    }
+
+    function canCheck(problem) {
+        return problem.solution && window.crypto && window.crypto.subtle &&
+            window.TextEncoder && window.Promise;
+    }
+
+    function checkLocally(bundle, problem, values) {
+        var x = parseFraction(values.variable_value),
+            left = parseFraction(values.left_side_value),
+            right = parseFraction(values.right_side_value);
+        if (x === null || left === null || right === null) {
+            return window.Promise.resolve(false);
+        }
+        return window.Promise.all([
+            sha256(bundle.salt + ':' + x),
+            sha256(bundle.salt + ':' + left),
+            sha256(bundle.salt + ':' + right)
+        ]).then(function (hashes) {
+            return hashes[0] === problem.solution &&
+                hashes[1] === problem.side && hashes[2] === problem.side;
+        });
+    }
+
+    function clientId() {
+        var bytes = new Uint8Array(16), i;
+        if (window.crypto && window.crypto.getRandomValues) {
+            window.crypto.getRandomValues(bytes);
+        } else {
+            for (i = 0; i < bytes.length; i++) {
+                bytes[i] = Math.floor(Math.random() * 256);
+            }
+        }
+        return Array.prototype.map.call(bytes, function (b) {
+            return ('0' + b.toString(16)).slice(-2);
+        }).join('');
+    }
+
+    function showStatus() {
+        var waiting = load(QUEUE_KEY, []).length;
+        $('#sync-status').text(waiting ? waiting + ' answer' +
+            (waiting === 1 ? ' is' : 's are') + ' waiting to be saved.' :
+            'All answers are saved.');
+    }
+
+    function sync() {
+        var queue = load(QUEUE_KEY, []);
+        if (syncing || !queue.length) {
+            showStatus();
+            return;
+        }
+        syncing = true;
+        var batch = queue.slice(0, BATCH_SIZE);
+        $.ajax({
+            url: root.data('sync-url'),
+            type: 'POST',
+            contentType: 'application/json',
+            dataType: 'json',
+            data: JSON.stringify({answers: batch})
+        }).done(function (data) {
+            var done = {};
+            $.each(data.results || [], function (i, result) {
+                done[result.client_id] = true;
+                if (result.error) {
+                    $('#feedback-' + result.client_id).text(result.error);
+                }
+            });
+            save(QUEUE_KEY, $.grep(load(QUEUE_KEY, []), function (answer) {
+                return !done[answer.client_id];
+            }));
+        }).always(function () {
+            // anything left over is retried by the timer below
+            syncing = false;
+            showStatus();
+        });
+    }
+
+    function submit(bundle, problem, row) {
+        var values = {
+            variable_value: row.find('[name=variable_value]').val(),
+            left_side_value: row.find('[name=left_side_value]').val(),
+            right_side_value: row.find('[name=right_side_value]').val()
+        };
+        var feedback = row.find('.feedback');
+        var answer = $.extend({
+            client_id: clientId(),
+            problem_id: problem.id,
+            answered_at: new Date().getTime()
+        }, values);
+        var queue = load(QUEUE_KEY, []);
+        queue.push(answer);
+        save(QUEUE_KEY, queue);
+        feedback.attr('id', 'feedback-' + answer.client_id);
+        if (canCheck(problem)) {
+            checkLocally(bundle, problem, values).then(function (correct) {
+                feedback.text(correct ? 'Correct!' : 'Not quite right. Try again.')
+                    .toggleClass('text-success', correct)
+                    .toggleClass('text-danger', !correct);
+            });
+        } else {
+            feedback.text('Saved. It will be checked when you are back online.');
+        }
+        sync();
+    }
+
+    function render(bundle) {
+        var table = $('<table class="table"></table>');
+        table.append('<tr><th>#</th><th>Equation</th><th>x</th>' +
+                     '<th>Left side</th><th>Right side</th><th></th><th></th></tr>');
+        $.each(bundle.problems, function (i, problem) {
+            var row = $('<tr></tr>');
+            row.append($('<td></td>').text(problem.number));
+            row.append($('<td></td>').text(problem.text));
+            $.each(['variable_value', 'left_side_value', 'right_side_value'], function (j, name) {
+                row.append($('<td></td>').append(
+                    $('<input class="form-control" maxlength="32">').attr('name', name)));
+            });
+            var button = $('<button class="btn btn-default">Check</button>');
+            button.on('click', function () {
+                submit(bundle, problem, row);
+            });
+            row.append($('<td></td>').append(button));
+            row.append('<td class="feedback"></td>');
+            table.append(row);
+        });
+        root.empty().append(table);
+    }
+
+    function fetchBundle() {
+        var cached = load(bundleKey, null);
+        $.ajax({
+            url: root.data('bundle-url'),
+            dataType: 'json',
+            headers: cached ? {'If-None-Match': '"' + cached.etag + '"'} : {}
+        }).done(function (data, status, xhr) {
+            if (xhr.status === 304 && cached) {
+                render(cached.bundle);
+                return;
+            }
+            var etag = (xhr.getResponseHeader('ETag') || '').replace(/"/g, '');
+            save(bundleKey, {etag: etag, bundle: data});
+            render(data);
+        }).fail(function () {
+            if (cached) {
+                render(cached.bundle);
+            } else {
+                root.text('The lesson could not be loaded. Check your connection.');
+            }
+        });
+    }
+
+    $(window).on('online', sync);
+    window.setInterval(sync, RETRY_SECONDS * 1000);
+    fetchBundle();
+    sync();
+})(jQuery);
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+student = Blueprint('student', __name__)
+
+from . import views
@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+from fractions import Fraction
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from .. import db
+from ..models import Problem, AnswerSubmission
+from .grading import record_answers
+from ..teacher import parse
+
+
+class SyncError(Exception):
+    def __init__(self, message):
+        super(SyncError, self).__init__(message)
+
+
+def bundle_salt(lesson):
+    # a new salt with every version, so old hashes cannot be reused
+    return hmac.new(current_app.config['SECRET_KEY'],
+                    'lesson-bundle:{0}:{1}'.format(lesson.id, lesson.version),
+                    hashlib.sha256).hexdigest()[:16]
+
+
+def bundle_etag(lesson):
+    return '{0}-{1}-{2}'.format(lesson.id, lesson.version,
+                                bundle_salt(lesson)[:8])
+
+
+def fraction_hash(salt, fraction):
+    return hashlib.sha256('{0}:{1}/{2}'.format(
+        salt, fraction.numerator, fraction.denominator)).hexdigest()
+
+
+def lesson_bundle(lesson):
+    salt = bundle_salt(lesson)
+    problems = []
+    for problem in lesson.problems.order_by(Problem.number):
+        entry = {'id': problem.id, 'number': problem.number,
+                 'text': problem.text}
+        if problem.solution_denominator:
+            entry['solution'] = fraction_hash(salt, Fraction(
+                problem.solution_numerator, problem.solution_denominator))
+            entry['side'] = fraction_hash(salt, Fraction(
+                problem.left_side_numerator, problem.left_side_denominator))
+        problems.append(entry)
+    return {'lesson': {'id': lesson.id, 'number': lesson.number,
+                       'name': lesson.name, 'version': lesson.version},
+            'salt': salt,
+            'problems': problems}
+
+
+def answered_at(value, now):
+    # clients report when the answer was given; clock skew is clamped
+    try:
+        timestamp = datetime.utcfromtimestamp(float(value) / 1000)
+    except (TypeError, ValueError, OverflowError):
+        return now
+    oldest = now - timedelta(
+        seconds=current_app.config['KYBURZ_SYNC_MAX_AGE'])
+    return min(max(timestamp, oldest), now)
+
+
+def sync_answers(user, items, check_access):
+    if not isinstance(items, list):
+        raise SyncError('Expected a list of answers.')
+    if len(items) > current_app.config['KYBURZ_SYNC_MAX_BATCH']:
+        raise SyncError('Send at most {0} answers at a time.'.format(
+            current_app.config['KYBURZ_SYNC_MAX_BATCH']))
+    items = [item for item in items if isinstance(item, dict)]
+    try:
+        return record_items(user, items, check_access)
+    except IntegrityError:
+        # an upload of the same answers running at the same time recorded
+        # them first; now that it has, the retry reports them as synced
+        db.session.rollback()
+        return record_items(user, items, check_access)
+
+
+def record_items(user, items, check_access):
+    problem_ids = set()
+    client_ids = set()
+    for item in items:
+        problem_ids.add(to_int(item.get('problem_id')))
+        if valid_client_id(item.get('client_id')):
+            client_ids.add(item['client_id'])
+    problems = {}
+    problem_ids.discard(None)
+    if problem_ids:
+        problems = dict((problem.id, problem) for problem in
+                        Problem.query.filter(Problem.id.in_(problem_ids)))
+    for lesson in set(problem.lesson for problem in problems.values()):
+        check_access(lesson)
+    # answers from a retried upload were already recorded
+    synced = {}
+    if client_ids:
+        synced = dict(db.session.query(AnswerSubmission.client_id,
+                                       AnswerSubmission.is_correct)
+                      .filter(AnswerSubmission.user_id == user.id,
+                              AnswerSubmission.client_id.in_(client_ids)))
+
+    now = datetime.utcnow()
+    results = []
+    submissions = []
+    for item in items:
+        client_id = item.get('client_id')
+        if not valid_client_id(client_id):
+            results.append({'client_id': client_id,
+                            'error': 'The client id must be between 1 and '
+                                     '36 characters.'})
+            continue
+        if client_id in synced:
+            results.append({'client_id': client_id,
+                            'is_correct': synced[client_id]})
+            continue
+        problem = problems.get(to_int(item.get('problem_id')))
+        values = dict((field, item.get(field)) for field in (
+            'variable_value', 'left_side_value', 'right_side_value'))
+        error = problem is None and 'Unknown problem.' or check_values(values)
+        if error is not None:
+            results.append({'client_id': client_id, 'error': error})
+            continue
+        values.update(client_id=client_id,
+                      timestamp=answered_at(item.get('answered_at'), now))
+        synced[client_id] = None
+        submissions.append((client_id, problem, values))
+    answers = record_answers(user, [submission[1:]
+                                    for submission in submissions])
+    for (client_id, problem, values), answer in zip(submissions, answers):
+        results.append({'client_id': client_id,
+                        'problem_id': problem.id,
+                        'is_correct': answer.is_correct})
+    return results
+
+
+def valid_client_id(value):
+    return isinstance(value, basestring) and 1 <= len(value) <= 36
+
+
+def check_values(values):
+    for value in values.values():
+        if not isinstance(value, basestring) or not 1 <= len(value) <= 32:
+            return 'Every value must be between 1 and 32 characters.'
+        try:
+            parse.parse_fraction(value)
+        except parse.ParseError as e:
+            return e.message
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,33 @@
+from flask import current_app
+from flask.ext.wtf import Form
+from wtforms import StringField, TextAreaField, SubmitField
+from wtforms.validators import Required, Optional, Length
+from wtforms import ValidationError
+from ..teacher import parse
+from .steps import split_steps
+
+
+def number(form, field):
+    try:
+        parse.parse_fraction(field.data)
+    except parse.ParseError as e:
+        raise ValidationError(e.message)
+
+
+def step_count(form, field):
+    limit = current_app.config['KYBURZ_MAX_STEPS']
+    if len(split_steps(field.data)) > limit:
+        raise ValidationError('Show at most {0} steps.'.format(limit))
+
+
+class AnswerForm(Form):
+    steps = TextAreaField('Your work, one equation per line',
+                          validators=[Optional(), Length(0, 2000),
+                                      step_count])
+    variable_value = StringField('Value of the variable',
+                                 validators=[Required(), Length(1, 32), number])
+    left_side_value = StringField('Value of the left side',
+                                  validators=[Required(), Length(1, 32), number])
+    right_side_value = StringField('Value of the right side',
+                                   validators=[Required(), Length(1, 32), number])
+    submit = SubmitField('Check Answer')
@@ -0,0 +1,120 @@
+from fractions import Fraction
+from sqlalchemy import and_, cast, BigInteger
+from .. import db, live, metrics_registry
+from ..models import AnswerSubmission, Problem
+from ..teacher import parse
+from .misconceptions import diagnose
+from .recommend import update_mastery
+from .steps import step_columns
+from .worklist import record_progress
+
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def is_correct(problem, variable_value, left_side_value, right_side_value):
+    if not problem.solution_denominator:
+        return False
+    solution = Fraction(problem.solution_numerator,
+                        problem.solution_denominator)
+    side = Fraction(problem.left_side_numerator, problem.left_side_denominator)
+    return parse.parse_fraction(variable_value) == solution and \
+        parse.parse_fraction(left_side_value) == side and \
+        parse.parse_fraction(right_side_value) == side
+
+
+def fraction_columns(variable_value, left_side_value, right_side_value):
+    columns = {}
+    for prefix, value in (('variable', variable_value),
+                          ('left_side', left_side_value),
+                          ('right_side', right_side_value)):
+        try:
+            fraction = parse.parse_fraction(value)
+        except parse.ParseError:
+            fraction = None
+        if fraction is not None and max(abs(fraction.numerator),
+                                        fraction.denominator) > MAX_INTEGER:
+            fraction = None
+        columns[prefix + '_numerator'] = \
+            None if fraction is None else fraction.numerator
+        columns[prefix + '_denominator'] = \
+            None if fraction is None else fraction.denominator
+    return columns
+
+
+def equal_fractions(numerator, denominator, other_numerator,
+                    other_denominator):
+    # both denominators are positive, but the problem's left side value
+    # is not always in lowest terms; the products of two 32 bit columns
+    # need 64 bits
+    return cast(numerator, BigInteger) * other_denominator == \
+        cast(other_numerator, BigInteger) * denominator
+
+
+def correct_clause(answer=AnswerSubmission, problem=Problem):
+    return and_(
+        problem.solution_denominator != 0,
+        equal_fractions(answer.variable_numerator, answer.variable_denominator,
+                        problem.solution_numerator,
+                        problem.solution_denominator),
+        equal_fractions(answer.left_side_numerator,
+                        answer.left_side_denominator,
+                        problem.left_side_numerator,
+                        problem.left_side_denominator),
+        equal_fractions(answer.right_side_numerator,
+                        answer.right_side_denominator,
+                        problem.left_side_numerator,
+                        problem.left_side_denominator))
+
+
+def grade_answer(user, problem, variable_value, left_side_value,
+                 right_side_value, steps=(), **columns):
+    columns.update(step_columns(problem, steps))
+    answer = AnswerSubmission(
+        user_id=user.id,
+        problem_id=problem.id,
+        variable_value=variable_value,
+        left_side_value=left_side_value,
+        right_side_value=right_side_value,
+        is_correct=is_correct(problem, variable_value, left_side_value,
+                              right_side_value),
+        **dict(fraction_columns(variable_value, left_side_value,
+                                right_side_value), **columns))
+    if not answer.is_correct:
+        answer.misconception = diagnose(problem, answer.variable_numerator,
+                                        answer.variable_denominator)
+    db.session.add(answer)
+    update_mastery(user, problem, answer.is_correct)
+    # the session does not autoflush; the next answer of a batch looks up
+    # the same mastery row, and the work queue counts this answer
+    db.session.flush()
+    if answer.is_correct:
+        record_progress(user, problem)
+    return answer
+
+
+def announce(user, problem, answer):
+    metrics_registry.answers_graded.inc(
+        result='correct' if answer.is_correct else 'incorrect')
+    live.broker.publish(problem.lesson_id, {
+        'user_id': user.id,
+        'student': user.full_name,
+        'problem_id': problem.id,
+        'is_correct': answer.is_correct})
+
+
+def record_answer(user, problem, variable_value, left_side_value,
+                  right_side_value, steps=()):
+    answer = grade_answer(user, problem, variable_value, left_side_value,
+                          right_side_value, steps)
+    db.session.commit()
+    announce(user, problem, answer)
+    return answer
+
+
+def record_answers(user, submissions):
+    graded = [(problem, grade_answer(user, problem, **values))
+              for problem, values in submissions]
+    db.session.commit()
+    for problem, answer in graded:
+        announce(user, problem, answer)
+    return [answer for problem, answer in graded]
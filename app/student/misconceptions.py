@@ -0,0 +1,136 @@
+import json
+import re
+from fractions import Fraction
+from threading import Lock
+from ..sharding import current_shard
+from ..teacher import parse
+from .recommend import equation_of
+
+MESSAGES = {
+    'distribution': u'It looks like the number in front of the parentheses '
+                    u'was not multiplied by every term inside them.',
+    'constant_sign': u'It looks like a number kept its sign when it moved to '
+                     u'the other side of the equation.',
+    'variable_sign': u'It looks like an x term kept its sign when it moved to '
+                     u'the other side of the equation.',
+    'answer_sign': u'Your answer has the wrong sign.',
+    'divided_constant': u'It looks like you divided by a number that should '
+                        u'have been added or subtracted.',
+    'subtracted_coefficient': u'It looks like you subtracted the number in '
+                              u'front of x instead of dividing by it.',
+    'multiplied_coefficient': u'It looks like you multiplied by the number in '
+                              u'front of x instead of dividing by it.',
+    'reciprocal': u'It looks like you divided the wrong way around.',
+}
+
+# a number, or a lone minus sign, in front of parentheses
+DISTRIBUTED = re.compile(r'(\d+|-)\*?\(([^()]+)\)')
+FIRST_TERM = re.compile(r'^([+-]?[^+-]+)(.*)$')
+
+
+def undistributed(text):
+    # the equation as it reads when only the first term inside each pair of
+    # parentheses is multiplied
+    def forget(match):
+        factor, inside = match.groups()
+        first, rest = FIRST_TERM.match(inside).groups()
+        if factor == '-':
+            return '-({0}){1}'.format(first, rest)
+        return '{0}*({1}){2}'.format(factor, first, rest)
+    return DISTRIBUTED.sub(forget, ''.join(text.split()))
+
+
+def distribution_answer(text):
+    if '(' not in text:
+        return None
+    try:
+        a, b, c, d = parse.linear_coefficients(undistributed(text))
+    except parse.ParseError:
+        return None
+    if a == c:
+        return None
+    return Fraction(d - b, a - c)
+
+
+def mistakes(equation):
+    """The answer each common mistake leads to, most specific first."""
+    a = equation['left_coefficient']
+    b = equation['left_constant']
+    c = equation['right_coefficient']
+    d = equation['right_constant']
+    if not a:
+        # students gather the x terms on the side that has them
+        a, b, c, d = c, d, a, b
+    coefficient = a - c
+    constant = d - b
+    if not coefficient:
+        return []
+    answers = [('distribution', distribution_answer(equation['text']))]
+    if b:
+        answers.append(('constant_sign', Fraction(d + b, coefficient)))
+    if c and a + c:
+        answers.append(('variable_sign', Fraction(constant, a + c)))
+    answers.append(('answer_sign', Fraction(-constant, coefficient)))
+    if b not in (0, 1) and d:
+        answers.append(('divided_constant', Fraction(d, b) / coefficient))
+    if coefficient != 1:
+        answers.append(('subtracted_coefficient', constant - coefficient))
+    if coefficient not in (1, -1):
+        answers.append(('multiplied_coefficient', constant * coefficient))
+    if constant:
+        answers.append(('reciprocal', Fraction(coefficient, constant)))
+    return [(name, answer) for name, answer in answers if answer is not None]
+
+
+def misconception_table(equation):
+    if not equation['solution_denominator']:
+        return {}
+    solution = Fraction(equation['solution_numerator'],
+                        equation['solution_denominator'])
+    table = {}
+    for name, answer in mistakes(equation):
+        # when two mistakes give the same answer the likelier one is kept
+        if answer != solution:
+            table.setdefault(str(answer), name)
+    return table
+
+
+def table_columns(equation):
+    return {'misconceptions': json.dumps(misconception_table(equation),
+                                         sort_keys=True)}
+
+
+class TableCache(object):
+    def __init__(self, size=10000):
+        self.lock = Lock()
+        self.size = size
+        self.tables = {}
+
+    def get(self, problem):
+        # the text is part of the key so a reused id is never trusted
+        key = (current_shard(), problem.id, problem.text)
+        table = self.tables.get(key)
+        if table is None:
+            if problem.misconceptions is None:
+                table = misconception_table(equation_of(problem))
+            else:
+                table = json.loads(problem.misconceptions)
+            with self.lock:
+                if len(self.tables) >= self.size:
+                    self.tables.clear()
+                self.tables[key] = table
+        return table
+
+
+tables = TableCache()
+
+
+def diagnose(problem, numerator, denominator):
+    if not denominator:
+        return None
+    return tables.get(problem).get(str(Fraction(numerator, denominator)))
+
+
+def misconception_feedback(answer):
+    message = MESSAGES.get(answer.misconception)
+    return [message] if message else []
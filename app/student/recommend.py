@@ -0,0 +1,162 @@
+import math
+from bisect import bisect_left
+from .. import db, bus
+from ..caching import SharedCache
+from ..models import Problem, AnswerSubmission, AnswerRollup, Mastery
+
+# the difficulty a student should face to succeed about 70% of the time
+TARGET_OFFSET = math.log(0.7 / 0.3)
+
+SKILL_DIFFICULTY = {
+    'one_step': -1.0,
+    'two_step': 0.0,
+    'both_sides': 0.8,
+    'distributive': 1.0,
+}
+
+
+def describe(equation):
+    a = equation['left_coefficient']
+    b = equation['left_constant']
+    c = equation['right_coefficient']
+    d = equation['right_constant']
+    if '(' in equation['text']:
+        skill = 'distributive'
+    elif a and c:
+        skill = 'both_sides'
+    else:
+        coefficient, constant = (a, b) if a else (c, d)
+        if coefficient in (1, -1) or not constant:
+            skill = 'one_step'
+        else:
+            skill = 'two_step'
+    difficulty = SKILL_DIFFICULTY[skill]
+    if min(a, b, c, d) < 0:
+        difficulty += 0.3
+    if equation['solution_denominator'] not in (1, -1):
+        difficulty += 0.6
+    if (equation['solution_numerator'] or 0) < 0:
+        difficulty += 0.2
+    difficulty += 0.1 * math.log(1 + max(abs(a), abs(b), abs(c), abs(d)))
+    return {'skill': skill, 'difficulty': difficulty}
+
+
+def expected_score(rating, difficulty):
+    return 1.0 / (1.0 + math.exp(difficulty - rating))
+
+
+def update_mastery(user, problem, is_correct):
+    skill = problem.skill or describe(equation_of(problem))['skill']
+    difficulty = problem.difficulty
+    if difficulty is None:
+        difficulty = describe(equation_of(problem))['difficulty']
+    state = Mastery.query.get((user.id, skill))
+    if state is None:
+        state = Mastery(user_id=user.id, skill=skill, rating=0.0, attempts=0)
+    state.rating = rate(state.rating, state.attempts, difficulty, is_correct)
+    state.attempts += 1
+    db.session.add(state)
+    return state
+
+
+def rate(rating, attempts, difficulty, is_correct):
+    # large steps while the estimate is new, smaller once it has settled
+    k = max(0.15, 1.0 / (1.0 + 0.2 * attempts))
+    return rating + k * ((1.0 if is_correct else 0.0) -
+                         expected_score(rating, difficulty))
+
+
+def equation_of(problem):
+    return dict((column, getattr(problem, column)) for column in (
+        'text', 'left_coefficient', 'left_constant', 'right_coefficient',
+        'right_constant', 'solution_numerator', 'solution_denominator'))
+
+
+class DifficultyIndex(object):
+    def __init__(self, problems):
+        self.skills = {}
+        self.problem_ids = []
+        for problem_id, skill, difficulty in problems:
+            self.problem_ids.append(problem_id)
+            self.skills.setdefault(skill, []).append((difficulty, problem_id))
+        self.difficulties = {}
+        for skill, entries in self.skills.items():
+            entries.sort()
+            self.difficulties[skill] = [d for d, problem_id in entries]
+
+    def nearest(self, skill, target, exclude):
+        entries = self.skills[skill]
+        difficulties = self.difficulties[skill]
+        right = bisect_left(difficulties, target)
+        left = right - 1
+        while left >= 0 or right < len(entries):
+            if right >= len(entries) or left >= 0 and \
+                    target - difficulties[left] <= difficulties[right] - target:
+                candidate = entries[left]
+                left -= 1
+            else:
+                candidate = entries[right]
+                right += 1
+            if candidate[1] not in exclude:
+                return abs(candidate[0] - target), candidate[1]
+        return None
+
+    def recommend(self, ratings, exclude=()):
+        best = None
+        for skill in self.skills:
+            rating = ratings.get(skill, 0.0)
+            found = self.nearest(skill, rating - TARGET_OFFSET, exclude)
+            if found is not None and (best is None or
+                                      (found[0], rating) < best[:2]):
+                best = (found[0], rating, found[1])
+        return best and best[2]
+
+
+class IndexCache(SharedCache):
+    def get(self, lesson_id):
+        return self.cached(lesson_id, lambda: DifficultyIndex(
+            load_problems(lesson_id)))
+
+
+indexes = IndexCache(bus, 'difficulty_index')
+
+
+def load_problems(lesson_id):
+    problems = []
+    for problem in Problem.query.filter_by(lesson_id=lesson_id):
+        if problem.skill is None or problem.difficulty is None:
+            described = describe(equation_of(problem))
+            problems.append((problem.id, described['skill'],
+                             described['difficulty']))
+        else:
+            problems.append((problem.id, problem.skill, problem.difficulty))
+    return problems
+
+
+def mastery_of(user):
+    return dict(db.session.query(Mastery.skill, Mastery.rating)
+                .filter(Mastery.user_id == user.id))
+
+
+def solved_in(user, problem_ids):
+    if not problem_ids:
+        return set()
+    solved = set(problem_id for problem_id, in db.session.query(
+        AnswerSubmission.problem_id).filter(
+        AnswerSubmission.user_id == user.id,
+        AnswerSubmission.problem_id.in_(problem_ids),
+        AnswerSubmission.is_correct == True))
+    # answers that have been archived are remembered by their rollup
+    solved.update(problem_id for problem_id, in db.session.query(
+        AnswerRollup.problem_id).filter(
+        AnswerRollup.user_id == user.id,
+        AnswerRollup.problem_id.in_(problem_ids),
+        AnswerRollup.correct > 0))
+    return solved
+
+
+def next_problem(user, lesson_id, solved=None):
+    index = indexes.get(lesson_id)
+    if solved is None:
+        solved = solved_in(user, index.problem_ids)
+    return index.recommend(mastery_of(user), solved)
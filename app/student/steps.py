@@ -0,0 +1,90 @@
+from fractions import gcd
+from threading import Lock
+from flask import current_app
+from ..sharding import current_shard
+from ..teacher import parse
+
+# one character per step is stored with the submission
+EQUIVALENT = '='
+NOT_EQUIVALENT = 'x'
+UNREADABLE = '?'
+
+
+def canonical_form(left_coefficient, left_constant, right_coefficient,
+                   right_constant):
+    # ax + b = cx + d has the same solutions as (a - c)x + (b - d) = 0, and
+    # two of those are equivalent exactly when one is a multiple of the other
+    coefficient = left_coefficient - right_coefficient
+    constant = left_constant - right_constant
+    divisor = gcd(coefficient, constant)
+    if divisor == 0:
+        return 0, 0
+    if divisor * (coefficient or constant) < 0:
+        divisor = -divisor
+    return coefficient // divisor, constant // divisor
+
+
+class CanonicalCache(object):
+    def __init__(self, size=10000):
+        self.lock = Lock()
+        self.size = size
+        self.forms = {}
+
+    def get(self, problem):
+        # the text is part of the key so a reused id is never trusted
+        key = (current_shard(), problem.id, problem.text)
+        form = self.forms.get(key)
+        if form is None:
+            form = canonical_form(problem.left_coefficient,
+                                  problem.left_constant,
+                                  problem.right_coefficient,
+                                  problem.right_constant)
+            with self.lock:
+                if len(self.forms) >= self.size:
+                    self.forms.clear()
+                self.forms[key] = form
+        return form
+
+
+canonical_forms = CanonicalCache()
+
+
+def split_steps(text):
+    return [''.join(line.split()) for line in (text or '').splitlines()
+            if line.strip()]
+
+
+def check_step(target, step):
+    try:
+        form = canonical_form(*parse.linear_coefficients(step))
+    except parse.ParseError:
+        return UNREADABLE
+    return EQUIVALENT if form == target else NOT_EQUIVALENT
+
+
+def check_steps(problem, steps):
+    target = canonical_forms.get(problem)
+    return ''.join(check_step(target, step) for step in steps)
+
+
+def step_columns(problem, steps):
+    steps = steps[:current_app.config['KYBURZ_MAX_STEPS']]
+    if not steps:
+        return {}
+    return {'steps': '\n'.join(steps),
+            'step_checks': check_steps(problem, steps)}
+
+
+def step_feedback(answer):
+    if not answer.step_checks:
+        return []
+    messages = []
+    for number, (step, check) in enumerate(
+            zip(answer.steps.split('\n'), answer.step_checks), 1):
+        if check == NOT_EQUIVALENT:
+            messages.append(u'Step {0} ({1}) is not equivalent to the '
+                            u'problem.'.format(number, step))
+        elif check == UNREADABLE:
+            messages.append(u'Step {0} ({1}) could not be read as a linear '
+                            u'equation.'.format(number, step))
+    return messages
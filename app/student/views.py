@@ -0,0 +1,120 @@
+from datetime import datetime
+from flask import render_template, redirect, url_for, flash, abort, \
+    request, jsonify, current_app
+from flask.ext.login import login_required, current_user
+from . import student
+from ..models import Lesson, Problem
+from .forms import AnswerForm
+from .grading import record_answer
+from .steps import split_steps, step_feedback
+from .misconceptions import misconception_feedback
+from .recommend import next_problem, solved_in
+from .worklist import due_work
+from .bundle import lesson_bundle, bundle_etag, sync_answers, SyncError
+
+
+def check_access(lesson):
+    if lesson.author_id != current_user.id and \
+            not current_user.is_student_of(lesson.author):
+        abort(403)
+
+
+@student.route('/lessons')
+@login_required
+def lessons():
+    teacher_ids = [t.teacher_id for t in current_user.teachers]
+    lessons = []
+    if teacher_ids:
+        lessons = Lesson.query.filter(Lesson.author_id.in_(teacher_ids)) \
+            .order_by(Lesson.author_id, Lesson.number).all()
+    return render_template('student/lessons.html', lessons=lessons,
+                           work=due_work(current_user),
+                           now=datetime.utcnow())
+
+
+@student.route('/lesson/<int:lesson_id>')
+@login_required
+def lesson(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    check_access(lesson)
+    problems = lesson.problems.order_by(Problem.number).all()
+    solved = solved_in(current_user, [problem.id for problem in problems])
+    recommended = next_problem(current_user, lesson.id, solved)
+    return render_template('student/lesson.html', lesson=lesson,
+                           problems=problems, solved=solved,
+                           recommended=recommended)
+
+
+@student.route('/problem/<int:problem_id>', methods=['GET', 'POST'])
+@login_required
+def problem(problem_id):
+    problem = Problem.query.get_or_404(problem_id)
+    lesson = problem.lesson
+    check_access(lesson)
+    form = AnswerForm()
+    if form.validate_on_submit():
+        answer = record_answer(current_user, problem,
+                               form.variable_value.data,
+                               form.left_side_value.data,
+                               form.right_side_value.data,
+                               split_steps(form.steps.data))
+        for message in step_feedback(answer):
+            flash(message)
+        for message in misconception_feedback(answer):
+            flash(message)
+        if not answer.is_correct:
+            flash('That is not quite right. Try again.')
+            return redirect(url_for('.problem', problem_id=problem.id))
+        flash('Correct!')
+        recommended = next_problem(current_user, lesson.id)
+        if recommended is None:
+            return redirect(url_for('.lesson', lesson_id=lesson.id))
+        return redirect(url_for('.problem', problem_id=recommended))
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(error)
+    return render_template('student/problem.html', problem=problem,
+                           lesson=lesson, form=form)
+
+
+@student.route('/lesson/<int:lesson_id>/offline')
+@login_required
+def offline(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    check_access(lesson)
+    return render_template('student/offline.html', lesson=lesson)
+
+
+@student.route('/lesson/<int:lesson_id>/bundle.json')
+@login_required
+def bundle(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    check_access(lesson)
+    etag = bundle_etag(lesson)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(lesson_bundle(lesson))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 0
+    response.cache_control.must_revalidate = True
+    return response
+
+
+@student.route('/sync', methods=['POST'])
+@login_required
+def sync():
+    # only JSON bodies are accepted, which a cross-site form cannot send
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    try:
+        results = sync_answers(current_user, data.get('answers'),
+                               check_access)
+    except SyncError as e:
+        response = jsonify(error=e.message)
+        response.status_code = 400
+        return response
+    return jsonify(results=results)
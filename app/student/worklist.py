@@ -0,0 +1,128 @@
+from datetime import datetime
+from sqlalchemy import case, func
+from .. import db
+from ..models import Assignment, WorkItem, AnswerSubmission, AnswerRollup, \
+    TeachingRelationship
+from .recommend import indexes, solved_in
+
+work_items = WorkItem.__table__
+
+
+def solved_counts(lesson_id, student_ids):
+    if not student_ids:
+        return {}
+    problem_ids = indexes.get(lesson_id).problem_ids
+    if not problem_ids:
+        return {}
+    solved = set(db.session.query(
+        AnswerSubmission.user_id, AnswerSubmission.problem_id).filter(
+        AnswerSubmission.user_id.in_(student_ids),
+        AnswerSubmission.problem_id.in_(problem_ids),
+        AnswerSubmission.is_correct == True))
+    solved.update(db.session.query(
+        AnswerRollup.user_id, AnswerRollup.problem_id).filter(
+        AnswerRollup.user_id.in_(student_ids),
+        AnswerRollup.problem_id.in_(problem_ids),
+        AnswerRollup.correct > 0))
+    counts = {}
+    for student_id, problem_id in solved:
+        counts[student_id] = counts.get(student_id, 0) + 1
+    return counts
+
+
+def add_work(assignments, student_ids):
+    now = datetime.utcnow()
+    rows = []
+    for assignment in assignments:
+        total = len(indexes.get(assignment.lesson_id).problem_ids)
+        solved = solved_counts(assignment.lesson_id, student_ids)
+        for student_id in student_ids:
+            count = solved.get(student_id, 0)
+            rows.append({'student_id': student_id,
+                         'assignment_id': assignment.id,
+                         'lesson_id': assignment.lesson_id,
+                         'lesson_name': assignment.lesson.name,
+                         'due_at': assignment.due_at,
+                         'problems_total': total,
+                         'problems_solved': count,
+                         'completed_at': now if count >= total else None})
+    if rows:
+        db.session.execute(work_items.insert(), rows)
+
+
+def assign_lesson(lesson, teacher, due_at):
+    assignment = Assignment(lesson=lesson, teacher_id=teacher.id,
+                            due_at=due_at)
+    db.session.add(assignment)
+    db.session.flush()
+    student_ids = [student_id for student_id, in db.session.query(
+        TeachingRelationship.student_id)
+        .filter(TeachingRelationship.teacher_id == teacher.id)]
+    add_work([assignment], student_ids)
+    return assignment
+
+
+def add_students(teacher, student_ids):
+    # students who join later still get the work that is not yet due
+    assignments = Assignment.query.filter(
+        Assignment.teacher_id == teacher.id,
+        Assignment.due_at >= datetime.utcnow()).all()
+    add_work(assignments, student_ids)
+
+
+def problem_added(lesson_id):
+    db.session.execute(work_items.update()
+                       .where(work_items.c.lesson_id == lesson_id)
+                       .values(problems_total=work_items.c.problems_total + 1,
+                               completed_at=None))
+
+
+def record_progress(user, problem):
+    # counting again, rather than adding one, keeps a problem that is
+    # answered correctly twice from counting twice
+    items = WorkItem.query.filter_by(student_id=user.id,
+                                     lesson_id=problem.lesson_id,
+                                     completed_at=None).all()
+    if not items:
+        return
+    solved = len(solved_in(user, indexes.get(problem.lesson_id).problem_ids))
+    for item in items:
+        item.problems_solved = solved
+        if solved >= item.problems_total:
+            item.completed_at = datetime.utcnow()
+        db.session.add(item)
+
+
+def recount_lesson(lesson_id):
+    student_ids = [student_id for student_id, in db.session.query(
+        WorkItem.student_id).filter(WorkItem.lesson_id == lesson_id)
+        .distinct()]
+    solved = solved_counts(lesson_id, student_ids)
+    now = datetime.utcnow()
+    for student_id in student_ids:
+        count = solved.get(student_id, 0)
+        db.session.execute(
+            work_items.update()
+            .where(work_items.c.lesson_id == lesson_id)
+            .where(work_items.c.student_id == student_id)
+            .values(problems_solved=count,
+                    completed_at=case(
+                        [(work_items.c.problems_total <= count,
+                          func.coalesce(work_items.c.completed_at, now))],
+                        else_=None)))
+
+
+def due_work(user):
+    return WorkItem.query.filter_by(student_id=user.id, completed_at=None) \
+        .order_by(WorkItem.due_at).all()
+
+
+def assignment_progress(lesson_id):
+    return db.session.query(
+        Assignment,
+        func.count(WorkItem.student_id),
+        func.count(WorkItem.completed_at)) \
+        .outerjoin(WorkItem, WorkItem.assignment_id == Assignment.id) \
+        .filter(Assignment.lesson_id == lesson_id) \
+        .group_by(Assignment.id) \
+        .order_by(Assignment.due_at).all()
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 teacher = Blueprint('teacher', __name__)
 
-from . import views
+from . import views, tasks
@@ -0,0 +1,162 @@
+from itertools import chain
+import numpy as np
+from sqlalchemy import and_, case, func, literal, select, union_all
+from .. import db, bus
+from ..caching import SharedCache
+from ..models import AnswerSubmission, AnswerRollup, Problem
+
+# share of the class in each of the upper and lower groups
+GROUP_SHARE = 0.27
+
+
+def answer_rows(lesson_id):
+    live = select([
+        AnswerSubmission.user_id, AnswerSubmission.problem_id,
+        case([(AnswerSubmission.is_correct == True, 1)], else_=0),
+        AnswerSubmission.id]) \
+        .select_from(AnswerSubmission.__table__.join(Problem.__table__)) \
+        .where(Problem.lesson_id == lesson_id)
+    # archived answers are older than any live one; a rollup only shows
+    # the first attempt was right when every attempt was
+    archived = select([
+        AnswerRollup.user_id, AnswerRollup.problem_id,
+        case([(and_(AnswerRollup.attempts > 0,
+                    AnswerRollup.correct == AnswerRollup.attempts), 1)],
+             else_=0),
+        literal(0)]) \
+        .select_from(AnswerRollup.__table__.join(Problem.__table__)) \
+        .where(Problem.lesson_id == lesson_id)
+    result = db.session.execute(union_all(live, archived))
+    try:
+        # the driver's plain tuples, flattened, are many times faster to
+        # convert than a list of result rows; every column is an integer,
+        # so there is nothing for SQLAlchemy to process
+        return np.fromiter(chain.from_iterable(result.cursor),
+                           np.int64).reshape(-1, 4)
+    finally:
+        result.close()
+
+
+def build_matrix(rows, problem_ids):
+    """Students x problems first attempt scores, and which were tried."""
+    problem_ids = np.asarray(problem_ids, dtype=np.int64)
+    by_id = np.argsort(problem_ids)
+    position = np.searchsorted(problem_ids, rows[:, 1], sorter=by_id)
+    known = position < len(problem_ids)
+    known[known] = problem_ids[by_id[position[known]]] == rows[known, 1]
+    rows, position = rows[known], position[known]
+    students, row = np.unique(rows[:, 0], return_inverse=True)
+    cell = row * len(problem_ids) + by_id[position]
+    # the earliest answer to each cell is the first attempt; one sort on a
+    # combined key is many times faster than lexsort on the two
+    span = int(rows[:, 3].max()) + 1 if len(rows) else 1
+    if len(students) * len(problem_ids) <= np.iinfo(np.int64).max // span:
+        order = np.argsort(cell * span + rows[:, 3])
+    else:
+        order = np.lexsort((rows[:, 3], cell))
+    sorted_cells = cell[order]
+    boundary = np.ones(len(sorted_cells), dtype=bool)
+    boundary[1:] = sorted_cells[1:] != sorted_cells[:-1]
+    first = np.flatnonzero(boundary)
+    cells = sorted_cells[first]
+    matrix = np.zeros(len(students) * len(problem_ids), dtype=np.int8)
+    attempted = np.zeros(len(students) * len(problem_ids), dtype=bool)
+    matrix[cells] = rows[order[first], 2]
+    attempted[cells] = True
+    shape = (len(students), len(problem_ids))
+    return students, matrix.reshape(shape), attempted.reshape(shape)
+
+
+def ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def item_statistics(matrix, attempted):
+    scores = matrix.astype(np.float64)
+    tried = attempted.astype(np.float64)
+    total = scores.sum(axis=1)
+    answered = tried.sum(axis=0)
+    correct = scores.sum(axis=0)
+    wrong = answered - correct
+    # sums over the students who tried each problem, all from products
+    # with the total score, so no students x problems temporary is needed
+    total_tried = total.dot(tried)
+    total_correct = total.dot(scores)
+    difficulty = ratio(correct, answered)
+    # the point biserial against the rest of the test, so an item is not
+    # correlated with itself
+    rest_sum = total_tried - correct
+    rest_squares = (total * total).dot(tried) - 2 * total_correct + correct
+    rest_mean = ratio(rest_sum, answered)
+    rest_sd = np.sqrt(np.maximum(
+        ratio(rest_squares, answered) - rest_mean ** 2, 0))
+    rest_correct = ratio(total_correct - correct, correct)
+    rest_wrong = ratio(rest_sum - (total_correct - correct), wrong)
+    point_biserial = ratio(
+        (rest_correct - rest_wrong) * np.sqrt(difficulty * (1 - difficulty)),
+        rest_sd)
+    # upper and lower groups by total score
+    group = max(1, int(round(GROUP_SHARE * len(total))))
+    ranked = np.argsort(total, kind='mergesort')
+    lower, upper = ranked[:group], ranked[-group:]
+    discrimination = \
+        ratio(scores[upper].sum(axis=0), tried[upper].sum(axis=0)) - \
+        ratio(scores[lower].sum(axis=0), tried[lower].sum(axis=0))
+    return {'answered': answered,
+            'difficulty': difficulty,
+            'point_biserial': point_biserial,
+            'discrimination': discrimination,
+            'score_correct': ratio(total_correct, correct),
+            'score_wrong': ratio(total_tried - total_correct, wrong)}
+
+
+def number(value):
+    return None if np.isnan(value) else float(value)
+
+
+def item_analysis(lesson_id):
+    problems = db.session.query(Problem.id, Problem.number, Problem.text) \
+        .filter(Problem.lesson_id == lesson_id) \
+        .order_by(Problem.number).all()
+    students, matrix, attempted = build_matrix(
+        answer_rows(lesson_id), [problem_id for problem_id, _, _ in problems])
+    stats = item_statistics(matrix, attempted)
+    return {'students': len(students),
+            'problems': [{'problem_id': problem_id,
+                          'number': problem_number,
+                          'text': text,
+                          'students': int(stats['answered'][i]),
+                          'difficulty': number(stats['difficulty'][i]),
+                          'point_biserial': number(stats['point_biserial'][i]),
+                          'discrimination': number(stats['discrimination'][i]),
+                          'score_correct': number(stats['score_correct'][i]),
+                          'score_wrong': number(stats['score_wrong'][i])}
+                         for i, (problem_id, problem_number, text)
+                         in enumerate(problems)]}
+
+
+def answer_stamp(lesson):
+    count, last = db.session.query(
+        func.count(AnswerSubmission.id), func.max(AnswerSubmission.id)) \
+        .join(Problem, Problem.id == AnswerSubmission.problem_id) \
+        .filter(Problem.lesson_id == lesson.id).one()
+    return lesson.version, count, last
+
+
+class AnalysisCache(SharedCache):
+    def get(self, lesson):
+        # new answers and archiving change the stamp; regrading does not,
+        # so the regrade task invalidates the lesson itself
+        stamp = answer_stamp(lesson)
+
+        def load():
+            return stamp, item_analysis(lesson.id)
+        cached_stamp, analysis = self.cached(lesson.id, load)
+        if cached_stamp != stamp:
+            self.discard([self.key(lesson.id)])
+            cached_stamp, analysis = self.cached(lesson.id, load)
+        return analysis
+
+
+analyses = AnalysisCache(bus, 'item_analysis', size=256)
@@ -0,0 +1,27 @@
+from sqlalchemy import func, literal, select
+from .. import db
+from ..models import Lesson, Problem
+
+
+def copy_lesson(lesson, teacher, name=None):
+    number = db.session.query(func.max(Lesson.number)) \
+        .filter(Lesson.author_id == teacher.id).scalar() or 0
+    copy = Lesson(author_id=teacher.id, number=number + 1,
+                  name=name or lesson.name)
+    db.session.add(copy)
+    # every problem column except the keys is copied, so new columns
+    # come along without changes here
+    columns = [c for c in Problem.__table__.columns
+               if c.name not in ('id', 'lesson_id')]
+    try:
+        db.session.flush()
+        db.session.execute(Problem.__table__.insert().from_select(
+            ['lesson_id'] + [c.name for c in columns],
+            select([literal(copy.id)] + columns)
+            .where(Problem.lesson_id == lesson.id)
+            .order_by(Problem.number)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return copy
@@ -1,7 +1,11 @@
 from flask.ext.wtf import Form
-from wtforms import StringField, SubmitField, IntegerField
-from wtforms.validators import Required, Length, Regexp
+from flask.ext.wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, SubmitField, IntegerField, DateField, \
+    BooleanField
+from wtforms.validators import Required, Length, Regexp, Optional, Email
 from wtforms import ValidationError
+from .. import metrics_registry
+from ..models import Permission, User
 import parse
 
 
@@ -19,6 +23,48 @@ class AddProblemForm(Form):
 
     def validate_text(self, field):
         try:
-            parse.parse_equation(field.data)
+            with metrics_registry.parse_seconds.time():
+                self.parsed_equation = parse.parse_equation(field.data)
         except parse.ParseError as e:
-            raise ValidationError(e.message)
\ No newline at end of file
+            raise ValidationError(e.message)
+
+
+class RosterForm(Form):
+    roster = FileField('Roster (CSV with email, first_name, last_name and '
+                       'an optional password column)',
+                       validators=[FileRequired(),
+                                   FileAllowed(['csv'], 'Upload a .csv file.')])
+    submit = SubmitField('Import Students')
+
+
+class CopyLessonForm(Form):
+    name = StringField('Name of the copy', validators=[Required(),
+                                                       Length(1, 128)])
+    email = StringField('Copy to teacher (leave blank to copy into your '
+                        'own lessons)',
+                        validators=[Optional(), Length(1, 64), Email()])
+    submit = SubmitField('Copy Lesson')
+
+    def validate_email(self, field):
+        teacher = User.query.filter_by(email=field.data).first()
+        if teacher is None or not teacher.can(Permission.CREATE_LESSONS):
+            raise ValidationError('There is no teacher with that email.')
+        self.teacher = teacher
+
+
+class DeleteLessonForm(Form):
+    submit = SubmitField('Delete Lesson')
+
+
+class RegradeForm(Form):
+    submit = SubmitField('Regrade Answers')
+
+
+class AssignForm(Form):
+    due_date = DateField('Due date (YYYY-MM-DD)', validators=[Required()])
+    submit = SubmitField('Assign to My Students')
+
+
+class WorksheetsForm(Form):
+    pdf = BooleanField('Also make PDFs')
+    submit = SubmitField('Print Worksheets')
@@ -44,7 +44,7 @@ class PolynomialExpression(object):
         return result
 
 
-def parse_equation(equation):
+def linear_coefficients(equation):
     eq_no_white_space = ''.join(equation.split())
     variable = None
     for char in eq_no_white_space:
@@ -94,6 +94,12 @@ def parse_equation(equation):
     else:
         right_coefficient = 0
     right_constant = right_expression.coefficients[0]
+    return left_coefficient, left_constant, right_coefficient, right_constant
+
+
+def parse_equation(equation):
+    left_coefficient, left_constant, right_coefficient, right_constant = \
+        linear_coefficients(equation)
 
     solution_numerator = right_constant - left_constant
     solution_denominator = left_coefficient - right_coefficient
@@ -122,6 +128,13 @@ def parse_equation(equation):
             }
 
 
+def parse_fraction(text):
+    try:
+        return fractions.Fraction(''.join(text.split()))
+    except (ValueError, ZeroDivisionError):
+        raise ParseError('{0} is not a number or a fraction'.format(text))
+
+
 def parse_expression(expression):
     pattern = re.compile(r'^[A-Za-z0-9+*()-]')
     if not pattern.match(expression):
@@ -0,0 +1,83 @@
+import csv
+from fractions import Fraction
+from StringIO import StringIO
+from sqlalchemy import case, distinct, func, select, union_all
+from .. import db
+from ..archive import lesson_submissions
+from ..models import AnswerSubmission, AnswerRollup, Problem
+from ..student.grading import correct_clause
+
+
+def lesson_accuracy(lesson_id):
+    is_correct = correct_clause()
+    live = select([
+        AnswerSubmission.problem_id.label('problem_id'),
+        AnswerSubmission.user_id.label('user_id'),
+        func.count(AnswerSubmission.id).label('attempts'),
+        func.sum(case([(is_correct, 1)], else_=0)).label('correct')]) \
+        .select_from(AnswerSubmission.__table__.join(Problem.__table__)) \
+        .where(Problem.lesson_id == lesson_id) \
+        .group_by(AnswerSubmission.problem_id, AnswerSubmission.user_id)
+    # archived submissions only survive as per-student rollups
+    archived = select([AnswerRollup.problem_id, AnswerRollup.user_id,
+                       AnswerRollup.attempts, AnswerRollup.correct]) \
+        .select_from(AnswerRollup.__table__.join(Problem.__table__)) \
+        .where(Problem.lesson_id == lesson_id)
+    answers = union_all(live, archived).alias('answers')
+    rows = db.session.query(
+        Problem.id, Problem.number, Problem.text,
+        func.sum(answers.c.attempts), func.sum(answers.c.correct),
+        func.count(distinct(case([(answers.c.correct > 0,
+                                   answers.c.user_id)])))) \
+        .outerjoin(answers, answers.c.problem_id == Problem.id) \
+        .filter(Problem.lesson_id == lesson_id) \
+        .group_by(Problem.id, Problem.number, Problem.text) \
+        .order_by(Problem.number)
+    return [{'problem_id': problem_id,
+             'number': number,
+             'text': text,
+             'attempts': attempts or 0,
+             'correct': correct or 0,
+             'students_solved': solved,
+             'accuracy': float(correct or 0) / attempts if attempts else None}
+            for problem_id, number, text, attempts, correct, solved in rows]
+
+
+def common_wrong_answers(lesson_id, per_problem=3):
+    count = func.count(AnswerSubmission.id)
+    rows = db.session.query(
+        AnswerSubmission.problem_id, AnswerSubmission.variable_numerator,
+        AnswerSubmission.variable_denominator, count) \
+        .join(Problem, Problem.id == AnswerSubmission.problem_id) \
+        .filter(Problem.lesson_id == lesson_id,
+                AnswerSubmission.variable_denominator != None,
+                ~correct_clause()) \
+        .group_by(AnswerSubmission.problem_id,
+                  AnswerSubmission.variable_numerator,
+                  AnswerSubmission.variable_denominator) \
+        .order_by(AnswerSubmission.problem_id, count.desc())
+    answers = {}
+    for problem_id, numerator, denominator, times in rows:
+        found = answers.setdefault(problem_id, [])
+        if len(found) < per_problem:
+            found.append((str(Fraction(numerator, denominator)), times))
+    return answers
+
+
+def submissions_csv(lesson):
+    problems = dict((problem.id, problem.number)
+                    for problem in lesson.problems)
+    yield 'timestamp,user_id,problem_number,variable_value,' \
+        'left_side_value,right_side_value,is_correct,steps,step_checks\r\n'
+    for record in lesson_submissions(lesson):
+        out = StringIO()
+        csv.writer(out).writerow([
+            record['timestamp'].isoformat(), record['user_id'],
+            problems.get(record['problem_id']),
+            record['variable_value'].encode('utf-8'),
+            record['left_side_value'].encode('utf-8'),
+            record['right_side_value'].encode('utf-8'),
+            int(bool(record['is_correct'])),
+            (record.get('steps') or '').encode('utf-8'),
+            record.get('step_checks') or ''])
+        yield out.getvalue()
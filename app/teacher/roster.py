@@ -0,0 +1,155 @@
+import codecs
+import csv
+import hashlib
+import random
+import re
+from multiprocessing import Pool
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from .. import db, tenancy
+from ..email import make_message
+from ..models import Role, User, TeachingRelationship, UserLocation
+from ..student import worklist
+
+COLUMNS = ('email', 'first_name', 'last_name', 'password')
+REQUIRED_COLUMNS = ('email', 'first_name', 'last_name')
+PASSWORD_CHARACTERS = 'abcdefghjkmnpqrstuvwxyz23456789'
+
+email_pattern = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class RosterError(Exception):
+    def __init__(self, message):
+        super(RosterError, self).__init__(message)
+
+
+def read_roster(data):
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    reader = csv.DictReader(data.splitlines())
+    columns = [c.strip().lower() for c in reader.fieldnames or []]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise RosterError('The roster is missing the column(s): ' +
+                          ', '.join(missing))
+    reader.fieldnames = columns
+    rows = []
+    errors = []
+    seen = set()
+    for line, record in enumerate(reader, 2):
+        try:
+            row = dict((c, (record.get(c) or '').decode('utf-8').strip())
+                       for c in COLUMNS)
+        except UnicodeDecodeError:
+            errors.append((line, 'The row is not valid UTF-8.'))
+            continue
+        error = check_row(row, seen)
+        if error is not None:
+            errors.append((line, error))
+            continue
+        seen.add(row['email'])
+        row['line'] = line
+        rows.append(row)
+    return rows, errors
+
+
+def check_row(row, seen):
+    if not email_pattern.match(row['email']) or len(row['email']) > 64:
+        return u'"{0}" is not a valid email address.'.format(row['email'])
+    if row['email'] in seen:
+        return u'{0} appears more than once.'.format(row['email'])
+    if not 1 <= len(row['first_name']) <= 64:
+        return 'The first name must be between 1 and 64 characters.'
+    if len(row['last_name']) > 64:
+        return 'The last name must be at most 64 characters.'
+
+
+def chunks(items, size=500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def hash_passwords(passwords):
+    if len(passwords) < current_app.config['KYBURZ_ROSTER_POOL_THRESHOLD']:
+        return [generate_password_hash(p) for p in passwords]
+    pool = Pool(current_app.config['KYBURZ_ROSTER_POOL_PROCESSES'])
+    try:
+        return pool.map(generate_password_hash, passwords, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def random_password(length=10):
+    rng = random.SystemRandom()
+    return ''.join(rng.choice(PASSWORD_CHARACTERS) for i in range(length))
+
+
+def provision(teacher, rows):
+    errors = []
+    existing = set()
+    for chunk in chunks([row['email'] for row in rows]):
+        existing.update(email for email, in db.session.query(User.email)
+                        .filter(User.email.in_(chunk)))
+        existing.update(email for email, in db.session.query(
+            UserLocation.email).filter(UserLocation.email.in_(chunk)))
+    created = []
+    for row in rows:
+        if row['email'] in existing:
+            errors.append((row['line'], u'{0} is already registered.'
+                           .format(row['email'])))
+        else:
+            created.append(row)
+    if not created:
+        return created, errors
+
+    for row in created:
+        row['generated_password'] = not row['password']
+        if row['generated_password']:
+            row['password'] = random_password()
+    hashes = hash_passwords([row['password'] for row in created])
+    role = Role.query.filter_by(name='User').first()
+    try:
+        db.session.execute(User.__table__.insert(), [{
+            'email': row['email'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'password_hash': password_hash,
+            'avatar_hash': hashlib.md5(row['email'].encode('utf-8')).hexdigest(),
+            'role_id': role and role.id,
+            'confirmed': False} for row, password_hash in zip(created, hashes)])
+        ids = {}
+        for chunk in chunks([row['email'] for row in created]):
+            ids.update(db.session.query(User.email, User.id)
+                       .filter(User.email.in_(chunk)))
+        for row in created:
+            row['id'] = ids[row['email']]
+        db.session.execute(TeachingRelationship.__table__.insert(), [
+            {'teacher_id': teacher.id, 'student_id': row['id']}
+            for row in created])
+        worklist.add_students(teacher, [row['id'] for row in created])
+        # students join the teacher's school
+        location = UserLocation.query.get(teacher.email)
+        tenancy.locate([row['email'] for row in created],
+                       location and location.tenant_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise RosterError('Some of these email addresses were registered '
+                          'while the roster was being imported. '
+                          'Please upload it again.')
+    return created, errors
+
+
+def welcome_messages(teacher, students, choose_password=()):
+    # generated passwords are never mailed; those students get a link to
+    # choose their own, which a retried mail can simply issue again
+    expiration = current_app.config['KYBURZ_ROSTER_TOKEN_EXPIRATION']
+    return [make_message(
+        student.email, 'Welcome to Kyburz Math', 'teacher/email/welcome',
+        first_name=student.first_name, teacher=teacher, email=student.email,
+        reset_token=student.generate_reset_token(expiration)
+        if student.id in choose_password else None,
+        token=student.generate_confirmation_token(expiration))
+        for student in students]
@@ -0,0 +1,104 @@
+from flask import current_app
+from sqlalchemy import case, func, literal, select
+from .. import db
+from ..email import send_async_batch, link_context
+from ..jobs import task, enqueue
+from ..models import User, Lesson, Problem, AnswerSubmission
+from ..student.grading import correct_clause
+from ..student.worklist import recount_lesson
+from .roster import provision, welcome_messages, chunks, RosterError
+from . import worksheets
+
+
+@task('provision_roster', max_attempts=1,
+      template='teacher/roster_result.html')
+def provision_roster(context, teacher_id, rows, errors):
+    teacher = User.query.get(teacher_id)
+    context.progress(10, 'Creating {0} accounts.'.format(len(rows)))
+    try:
+        created, provision_errors = provision(teacher, rows)
+    except RosterError as e:
+        return {'created': [], 'errors': errors, 'message': e.message}
+    if created:
+        # a job of its own, so a mail server that is down is retried
+        # without touching the accounts
+        enqueue('send_welcome_mail', owner=teacher, teacher_id=teacher_id,
+                student_ids=[row['id'] for row in created],
+                choose_password=[row['id'] for row in created
+                                 if row['generated_password']])
+    return {'created': [{'first_name': row['first_name'],
+                         'last_name': row['last_name'],
+                         'email': row['email']} for row in created],
+            'errors': sorted(errors + provision_errors),
+            'message': '{0} student accounts were created.'.format(
+                len(created))}
+
+
+@task('send_welcome_mail')
+def send_welcome_mail(context, teacher_id, student_ids, choose_password):
+    teacher = User.query.get(teacher_id)
+    students = []
+    for chunk in chunks(student_ids):
+        students.extend(User.query.filter(User.id.in_(chunk)))
+    with link_context():
+        messages = welcome_messages(teacher, students, set(choose_password))
+    context.progress(10, 'Sending {0} welcome emails.'.format(len(messages)))
+    # a retry sends the whole batch again; fresh links replace the old ones
+    send_async_batch(current_app._get_current_object(), messages)
+    return {'message': '{0} welcome emails were sent.'.format(len(messages))}
+
+
+@task('regrade_lesson')
+def regrade_lesson(context, lesson_id, batch_size=5000):
+    answers = AnswerSubmission.__table__
+    problem_ids = select([Problem.id]).where(Problem.lesson_id == lesson_id)
+    first, last, total = db.session.query(
+        func.min(AnswerSubmission.id), func.max(AnswerSubmission.id),
+        func.count(AnswerSubmission.id)) \
+        .filter(AnswerSubmission.problem_id.in_(problem_ids)).one()
+    db.session.commit()
+    if not total:
+        return {'message': 'There were no answers to regrade.'}
+    is_correct = select([case([(correct_clause(), literal(True))],
+                              else_=literal(False))]) \
+        .where(Problem.id == answers.c.problem_id).as_scalar()
+    changed = 0
+    for start in range(first, last + 1, batch_size):
+        changed += db.session.execute(
+            answers.update()
+            .where(answers.c.id.between(start, start + batch_size - 1))
+            .where(answers.c.problem_id.in_(problem_ids))
+            .where(answers.c.is_correct != is_correct)
+            .values(is_correct=is_correct)).rowcount
+        db.session.commit()
+        context.progress(min(100, 100 * (start + batch_size - first) //
+                             (last - first + 1)),
+                         '{0} of {1} answers changed so far.'.format(
+                             changed, total))
+    if changed:
+        from .analytics import analyses
+        recount_lesson(lesson_id)
+        db.session.commit()
+        analyses.invalidate(lesson_id)
+    return {'message': 'Regraded {0} answers; {1} changed.'.format(
+        total, changed)}
+
+
+@task('generate_worksheets', template='teacher/worksheets_result.html')
+def generate_worksheets(context, lesson_ids, pdf=False):
+    lessons = Lesson.query.filter(Lesson.id.in_(lesson_ids)) \
+        .order_by(Lesson.number).all()
+    formats = ['html']
+    message = ''
+    if pdf and worksheets.pdf_library() is None:
+        message = ' PDFs are not available on this server.'
+    elif pdf:
+        formats.append('pdf')
+    rendered = worksheets.generate(
+        lessons, formats, lambda count: context.progress(
+            10, 'Rendering {0} files.'.format(count)))
+    return {'lessons': [{'id': lesson.id, 'number': lesson.number,
+                         'name': lesson.name} for lesson in lessons],
+            'formats': formats,
+            'message': '{0} files were rendered; the rest were already up to '
+                       'date.{1}'.format(len(rendered), message)}
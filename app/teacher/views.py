@@ -1,19 +1,29 @@
-from flask import render_template, redirect, url_for, flash
+from datetime import datetime, time
+from flask import render_template, redirect, url_for, flash, abort, \
+    current_app, request, Response, stream_with_context, send_file
 from flask.ext.login import current_user
+from sqlalchemy import func
 from . import teacher
-from .. import db
+from .. import db, live, search, jobs
+from ..deletion import delete_lesson
 from ..models import Permission, Lesson, Problem
-from .forms import AddLessonForm, AddProblemForm
+from ..student import misconceptions, recommend, worklist
+from .forms import AddLessonForm, AddProblemForm, RosterForm, CopyLessonForm, \
+    DeleteLessonForm, RegradeForm, AssignForm, WorksheetsForm
+from .cloning import copy_lesson
+from .reports import lesson_accuracy, common_wrong_answers, submissions_csv
+from .roster import read_roster, RosterError
+from . import worksheets
 from ..decorators import permission_required
-import parse
 
 @teacher.route('/lessons', methods=['GET', 'POST'])
 @permission_required(Permission.CREATE_LESSONS)
 def lessons():
     form = AddLessonForm()
     if form.validate_on_submit():
-        num_lessons = Lesson.query.filter_by(author_id=current_user.id).count()
-        lesson = Lesson(number=num_lessons + 1,
+        last_number = db.session.query(func.max(Lesson.number)) \
+            .filter(Lesson.author_id == current_user.id).scalar() or 0
+        lesson = Lesson(number=last_number + 1,
                         name=form.name.data,
                         author_id=current_user.id)
         db.session.add(lesson)
@@ -23,7 +33,8 @@ def lessons():
         for field, errors in form.errors.items():
             for error in errors:
                 flash(error)
-    return render_template('teacher/lessons.html', form=form, user=current_user)
+    return render_template('teacher/lessons.html', form=form, user=current_user,
+                           worksheets_form=WorksheetsForm())
 
 
 @teacher.route('/edit_lesson/<int:lesson_id>', methods=['GET', 'POST'])
@@ -33,15 +44,237 @@ def edit_lesson(lesson_id):
     form = AddProblemForm()
     if form.validate_on_submit():
         num_problems = Problem.query.filter_by(lesson_id=lesson.id).count()
-        parsed_equation = parse.parse_equation(form.text.data)
+        parsed_equation = form.parsed_equation
         parsed_equation['number'] = num_problems + 1
         parsed_equation['lesson_id'] = lesson.id
+        parsed_equation.update(recommend.describe(parsed_equation))
+        parsed_equation.update(misconceptions.table_columns(parsed_equation))
         equation = Problem(**parsed_equation)
         db.session.add(equation)
+        lesson.version = (lesson.version or 0) + 1
+        worklist.problem_added(lesson.id)
         db.session.commit()
+        recommend.indexes.invalidate(lesson.id)
         return redirect(url_for('teacher.edit_lesson', lesson_id=lesson_id))
     else:
         for field, errors in form.errors.items():
             for error in errors:
                 flash(error)
-    return render_template('teacher/edit_lesson.html', lesson=lesson, form=form)
+    return render_template('teacher/edit_lesson.html', lesson=lesson, form=form,
+                           assign_form=AssignForm(),
+                           assignments=worklist.assignment_progress(lesson.id),
+                           pdf=worksheets.pdf_library() is not None)
+
+
+@teacher.route('/assign/<int:lesson_id>', methods=['POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def assign(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    form = AssignForm()
+    if form.validate_on_submit():
+        # due at the end of the chosen day
+        due_at = datetime.combine(form.due_date.data, time.max)
+        worklist.assign_lesson(lesson, current_user, due_at)
+        db.session.commit()
+        flash(u'"{0}" was assigned to your students.'.format(lesson.name))
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(error)
+    return redirect(url_for('teacher.edit_lesson', lesson_id=lesson.id))
+
+
+@teacher.route('/worksheets', methods=['POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def generate_worksheets():
+    form = WorksheetsForm()
+    if not form.validate_on_submit():
+        abort(400)
+    lesson_ids = [lesson_id for lesson_id, in db.session.query(Lesson.id)
+                  .filter(Lesson.author_id == current_user.id)]
+    if not lesson_ids:
+        flash('Add a lesson first.')
+        return redirect(url_for('teacher.lessons'))
+    job = jobs.enqueue('generate_worksheets', owner=current_user,
+                       lesson_ids=lesson_ids, pdf=form.pdf.data)
+    return redirect(url_for('main.job', job_id=job.id))
+
+
+@teacher.route('/worksheets/<int:lesson_id>/<kind>.<format>')
+@permission_required(Permission.CREATE_LESSONS)
+def worksheet(lesson_id, kind, format):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    if kind not in worksheets.KINDS or format not in worksheets.FORMATS or \
+            format == 'pdf' and worksheets.pdf_library() is None:
+        abort(404)
+    # rendered once per version of the lesson, then served from disk
+    return send_file(worksheets.worksheet(lesson, kind, format),
+                     mimetype=worksheets.MIMETYPES[format], conditional=True)
+
+
+@teacher.route('/copy_lesson/<int:lesson_id>', methods=['GET', 'POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def copy(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    form = CopyLessonForm()
+    if form.validate_on_submit():
+        teacher = form.email.data and form.teacher or current_user
+        copy = copy_lesson(lesson, teacher, form.name.data)
+        if teacher.id != current_user.id:
+            flash(u'The lesson was copied to {0}.'.format(teacher.full_name))
+            return redirect(url_for('teacher.lessons'))
+        return redirect(url_for('teacher.edit_lesson', lesson_id=copy.id))
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(error)
+    form.name.data = form.name.data or 'Copy of ' + lesson.name
+    return render_template('teacher/copy_lesson.html', lesson=lesson,
+                           form=form)
+
+
+@teacher.route('/delete_lesson/<int:lesson_id>', methods=['GET', 'POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def delete(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    deletion = delete_lesson(lesson)
+    form = DeleteLessonForm()
+    if form.validate_on_submit():
+        name = lesson.name
+        deletion.execute()
+        flash(u'The lesson "{0}" was deleted.'.format(name))
+        return redirect(url_for('teacher.lessons'))
+    return render_template('delete.html', form=form,
+                           title=u'Lesson {0}: {1}'.format(lesson.number,
+                                                           lesson.name),
+                           counts=deletion.counts())
+
+
+@teacher.route('/report/<int:lesson_id>')
+@permission_required(Permission.CREATE_LESSONS)
+def report(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    return render_template('teacher/report.html', lesson=lesson,
+                           problems=lesson_accuracy(lesson.id),
+                           wrong_answers=common_wrong_answers(lesson.id),
+                           regrade_form=RegradeForm())
+
+
+@teacher.route('/regrade/<int:lesson_id>', methods=['POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def regrade(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    form = RegradeForm()
+    if not form.validate_on_submit():
+        abort(400)
+    job = jobs.enqueue('regrade_lesson', owner=current_user,
+                       lesson_id=lesson.id)
+    return redirect(url_for('main.job', job_id=job.id))
+
+
+@teacher.route('/report/<int:lesson_id>/items')
+@permission_required(Permission.CREATE_LESSONS)
+def item_analysis(lesson_id):
+    # numpy is slow to import and only this page needs it
+    from .analytics import analyses
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    return render_template('teacher/item_analysis.html', lesson=lesson,
+                           analysis=analyses.get(lesson))
+
+
+@teacher.route('/report/<int:lesson_id>/submissions.csv')
+@permission_required(Permission.CREATE_LESSONS)
+def submissions_export(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    filename = 'lesson-{0}-submissions.csv'.format(lesson.number)
+    return Response(stream_with_context(submissions_csv(lesson)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition':
+                             'attachment; filename=' + filename})
+
+
+@teacher.route('/live/<int:lesson_id>')
+@permission_required(Permission.CREATE_LESSONS)
+def live_session(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    problems = lesson.problems.order_by(Problem.number).all()
+    return render_template('teacher/live.html', lesson=lesson,
+                           problems=problems)
+
+
+@teacher.route('/live/<int:lesson_id>/events')
+@permission_required(Permission.CREATE_LESSONS)
+def live_events(lesson_id):
+    lesson = Lesson.query.get_or_404(lesson_id)
+    if lesson.author_id != current_user.id:
+        abort(403)
+    events = live.broker.listen(lesson.id,
+                                current_app.config['KYBURZ_LIVE_KEEPALIVE'])
+    try:
+        snapshot = live.lesson_progress(lesson.id)
+    except Exception:
+        events.close()
+        raise
+
+    def stream():
+        yield live.format_event('snapshot', snapshot)
+        for event in events:
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield live.format_event('answer', event)
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache',
+                                 'X-Accel-Buffering': 'no'})
+    # also when the client is gone before the stream started
+    response.call_on_close(events.close)
+    return response
+
+
+@teacher.route('/roster', methods=['GET', 'POST'])
+@permission_required(Permission.CREATE_LESSONS)
+def roster():
+    form = RosterForm()
+    if form.validate_on_submit():
+        try:
+            rows, errors = read_roster(form.roster.data.read())
+        except RosterError as e:
+            flash(e.message)
+        else:
+            job = jobs.enqueue('provision_roster', owner=current_user,
+                               teacher_id=current_user.id, rows=rows,
+                               errors=errors)
+            return redirect(url_for('main.job', job_id=job.id))
+    else:
+        for field, field_errors in form.errors.items():
+            for error in field_errors:
+                flash(error)
+    return render_template('teacher/roster.html', form=form)
+
+
+@teacher.route('/search')
+@permission_required(Permission.CREATE_LESSONS)
+def search_lessons():
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search.search(current_user.id, query, page,
+                            current_app.config['KYBURZ_SEARCH_RESULTS_PER_PAGE'])
+    return render_template('teacher/search.html', results=results)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+from multiprocessing import Pool
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader
+from .. import db
+from ..models import Problem, User, TeachingRelationship
+from ..sharding import current_shard
+
+KINDS = ('worksheet', 'answers')
+FORMATS = ('html', 'pdf')
+MIMETYPES = {'html': 'text/html', 'pdf': 'application/pdf'}
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                            'templates')
+
+templates = None
+
+
+def pdf_library():
+    # PDFs are optional and need WeasyPrint
+    try:
+        import weasyprint
+    except ImportError:
+        return None
+    return weasyprint
+
+
+def worksheet_root(directory=None):
+    directory = directory or current_app.config['KYBURZ_WORKSHEET_DIR']
+    shard = current_shard()
+    # lesson ids repeat across shards
+    if shard is None:
+        return directory
+    return os.path.join(directory, 'shards', shard)
+
+
+def lesson_directory(lesson_id):
+    return os.path.join(worksheet_root(), 'lesson-{0}'.format(lesson_id))
+
+
+def class_list(teacher_id):
+    return [(student_id, u'{0} {1}'.format(first_name, last_name))
+            for student_id, first_name, last_name in db.session.query(
+                User.id, User.first_name, User.last_name)
+            .join(TeachingRelationship,
+                  TeachingRelationship.student_id == User.id)
+            .filter(TeachingRelationship.teacher_id == teacher_id)
+            .order_by(User.last_name, User.first_name, User.id)]
+
+
+def artifact_prefix(lesson, students):
+    # a new version of the lesson or a change to the class means new files
+    digest = hashlib.sha1(json.dumps(students)).hexdigest()[:12]
+    return 'v{0}-{1}-'.format(lesson.version or 1, digest)
+
+
+def artifact_path(lesson, students, kind, format):
+    return os.path.join(lesson_directory(lesson.id), '{0}{1}.{2}'.format(
+        artifact_prefix(lesson, students), kind, format))
+
+
+def problem_order(lesson, student_id, problems):
+    # seeded from the lesson version and the student, so a copy printed
+    # again later still matches its answer key
+    seed = hashlib.sha1('{0}:{1}:{2}'.format(
+        lesson.id, lesson.version or 1, student_id)).hexdigest()
+    problems = list(problems)
+    random.Random(int(seed, 16)).shuffle(problems)
+    return problems
+
+
+def fraction(numerator, denominator):
+    if denominator == 1:
+        return str(numerator)
+    return '{0}/{1}'.format(numerator, denominator)
+
+
+def artifact_spec(lesson, students, kind, format):
+    problems = [{'text': problem.text,
+                 'solution': fraction(problem.solution_numerator,
+                                      problem.solution_denominator),
+                 'side': fraction(problem.left_side_numerator,
+                                  problem.left_side_denominator)}
+                for problem in lesson.problems.order_by(Problem.number)]
+    sheets = [{'student': name,
+               'problems': problem_order(lesson, student_id, problems)}
+              for student_id, name in students] or \
+        [{'student': None, 'problems': problems}]
+    return {'path': artifact_path(lesson, students, kind, format),
+            'kind': kind,
+            'format': format,
+            'lesson': {'number': lesson.number, 'name': lesson.name},
+            'sheets': sheets}
+
+
+def write_artifact(spec):
+    # runs in pool processes, so it only uses what is in the spec
+    global templates
+    if templates is None:
+        templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                                autoescape=True)
+    html = templates.get_template('teacher/worksheet.html').render(**spec)
+    if spec['format'] == 'pdf':
+        content = pdf_library().HTML(string=html).write_pdf()
+    else:
+        content = html.encode('utf-8')
+    directory = os.path.dirname(spec['path'])
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    temporary = '{0}.{1}.tmp'.format(spec['path'], os.getpid())
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    os.rename(temporary, spec['path'])
+    return spec['path']
+
+
+def prune(lesson, students):
+    # files for older versions or classes are never asked for again
+    directory = lesson_directory(lesson.id)
+    if not os.path.isdir(directory):
+        return
+    prefix = artifact_prefix(lesson, students)
+    for filename in os.listdir(directory):
+        if not filename.startswith(prefix) and not filename.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def forget(lesson_id):
+    shutil.rmtree(lesson_directory(lesson_id), ignore_errors=True)
+
+
+def worksheet(lesson, kind, format):
+    students = class_list(lesson.author_id)
+    path = artifact_path(lesson, students, kind, format)
+    if not os.path.exists(path):
+        write_artifact(artifact_spec(lesson, students, kind, format))
+        prune(lesson, students)
+    return path
+
+
+def generate(lessons, formats=('html',), progress=None):
+    specs = []
+    classes = {}
+    for lesson in lessons:
+        if lesson.author_id not in classes:
+            classes[lesson.author_id] = class_list(lesson.author_id)
+        students = classes[lesson.author_id]
+        for kind in KINDS:
+            for format in formats:
+                if not os.path.exists(artifact_path(lesson, students, kind,
+                                                    format)):
+                    specs.append(artifact_spec(lesson, students, kind,
+                                               format))
+    if progress is not None:
+        progress(len(specs))
+    if len(specs) < current_app.config['KYBURZ_WORKSHEET_POOL_THRESHOLD']:
+        paths = [write_artifact(spec) for spec in specs]
+    else:
+        pool = Pool(current_app.config['KYBURZ_WORKSHEET_POOL_PROCESSES'])
+        try:
+            paths = pool.map(write_artifact, specs)
+        finally:
+            pool.close()
+            pool.join()
+    for lesson in lessons:
+        prune(lesson, classes[lesson.author_id])
+    return paths
@@ -0,0 +1,338 @@
+import time
+from contextlib import contextmanager
+from flask import g, session, request, render_template, current_app
+from flask.ext.login import current_user, logout_user, user_logged_in, \
+    user_logged_out
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import select
+from . import db, login_manager, bus
+from .caching import SharedCache
+from .models import Role, User, Job, Tenant, UserLocation, \
+    TeachingRelationship
+from .sharding import shard_keys
+
+locations = UserLocation.__table__
+
+# shared lookup tables that every shard fills itself, matched by this column
+REFERENCE_TABLES = {'roles': 'name'}
+
+
+class TenantError(Exception):
+    def __init__(self, message):
+        super(TenantError, self).__init__(message)
+
+
+class TenantDirectory(SharedCache):
+    def get(self, tenant_id):
+        def load():
+            tenant = Tenant.query.get(tenant_id)
+            return tenant and (tenant.shard, tenant.moving)
+        return self.cached(('tenant', tenant_id), load)
+
+    def tenant_of(self, email):
+        def load():
+            location = UserLocation.query.get(email)
+            return location and location.tenant_id
+        return self.cached(('email', email), load)
+
+    def keys(self, tenant_id, emails):
+        return [('tenant', tenant_id)] + [('email', email) for email in emails]
+
+    def invalidate(self, tenant_id=None, emails=()):
+        SharedCache.invalidate(self, *self.keys(tenant_id, emails))
+
+    def invalidate_on_commit(self, tenant_id=None, emails=()):
+        SharedCache.invalidate_on_commit(self, *self.keys(tenant_id, emails))
+
+
+# one directory serves every shard; move_tenant sleeps for its ttl in case a
+# process was not listening to the bus
+directory = TenantDirectory(bus, 'tenant_directory', sharded=False,
+                            ttl_setting='KYBURZ_TENANT_CACHE_SECONDS')
+
+
+def init_app(app):
+    # must run before any other hook loads the current user
+    app.before_request(select_tenant)
+    user_logged_in.connect(remember_tenant, app)
+    user_logged_out.connect(forget_tenant, app)
+    login_manager.token_loader(load_remembered_user)
+
+
+def use_tenant(tenant_id):
+    location = tenant_id is not None and directory.get(tenant_id) or None
+    g.tenant_id = location and tenant_id
+    g.shard = location and location[0]
+    return location
+
+
+def use_tenant_of(email):
+    location = UserLocation.query.get(email)
+    return use_tenant(location and location.tenant_id)
+
+
+def select_tenant():
+    tenant_id = session.get('tenant_id')
+    location = use_tenant(tenant_id)
+    if (location and location[0]) != session.get('shard') or \
+            tenant_id is not None and location is None:
+        # user ids change when a tenant moves, so the login is void
+        session.clear()
+        use_tenant(None)
+    elif current_user.is_authenticated and \
+            directory.tenant_of(current_user.email) != g.tenant_id:
+        # the user joined a tenant after logging in
+        logout_user()
+        session.clear()
+        use_tenant(None)
+    elif location and location[1] and \
+            request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        # a school being moved is read only until the copy is finished
+        return render_template('503.html'), 503, {
+            'Retry-After': str(current_app.config[
+                'KYBURZ_TENANT_CACHE_SECONDS'])}
+
+
+def remember_tenant(sender, user):
+    session['tenant_id'] = g.get('tenant_id')
+    session['shard'] = g.get('shard')
+
+
+def forget_tenant(sender, user):
+    session.pop('tenant_id', None)
+    session.pop('shard', None)
+
+
+def remember_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'],
+                             salt='remember')
+
+
+def remember_token(user):
+    return remember_serializer().dumps({'id': user.id,
+                                        'tenant': g.get('tenant_id'),
+                                        'shard': g.get('shard')})
+
+
+def load_remembered_user(token):
+    try:
+        data = remember_serializer().loads(token)
+    except BadSignature:
+        return None
+    location = use_tenant(data.get('tenant'))
+    if data.get('tenant') is not None and location is None or \
+            (location and location[0]) != data.get('shard'):
+        use_tenant(None)
+        return None
+    remember_tenant(None, None)
+    return User.query.get(data.get('id'))
+
+
+@contextmanager
+def use_shard(shard):
+    # every shard gets a fresh session; uncommitted work is discarded
+    previous = g.get('shard'), g.get('tenant_id')
+    db.session.remove()
+    g.shard, g.tenant_id = shard, None
+    try:
+        yield
+    finally:
+        db.session.remove()
+        g.shard, g.tenant_id = previous
+
+
+def email_taken(email):
+    return UserLocation.query.get(email) is not None or \
+        User.query.filter_by(email=email).first() is not None
+
+
+def locate(emails, tenant_id=None):
+    if emails:
+        db.session.execute(locations.insert(), [
+            {'email': email, 'tenant_id': tenant_id} for email in emails])
+        directory.invalidate_on_commit(emails=emails)
+
+
+def relocate(old_email, new_email):
+    db.session.execute(locations.update()
+                       .where(locations.c.email == old_email)
+                       .values(email=new_email))
+    directory.invalidate_on_commit(emails=[old_email, new_email])
+
+
+def add_teacher(tenant, email):
+    tenant_id, shard = tenant.id, tenant.shard
+    with use_shard(shard):
+        teacher = User.query.filter_by(email=email).first()
+        if teacher is None:
+            raise TenantError('There is no user {0} on the shard of {1}.'
+                              .format(email, tenant.name))
+        emails = [teacher.email] + [address for address, in db.session.query(
+            User.email).join(TeachingRelationship,
+                             TeachingRelationship.student_id == User.id)
+            .filter(TeachingRelationship.teacher_id == teacher.id)]
+    for chunk in chunks(emails, 500):
+        found = dict((location.email, location) for location in
+                     UserLocation.query.filter(UserLocation.email.in_(chunk)))
+        for address in chunk:
+            location = found.get(address) or UserLocation(email=address)
+            current = location.tenant_id and directory.get(location.tenant_id)
+            if current and current[0] != shard:
+                raise TenantError('{0} belongs to a tenant on another '
+                                  'shard.'.format(address))
+            location.tenant_id = tenant_id
+            db.session.add(location)
+    db.session.commit()
+    directory.invalidate(tenant_id, emails)
+    return len(emails)
+
+
+def tenant_tables():
+    return [table for table in db.Model.metadata.sorted_tables
+            if not table.info.get('directory')]
+
+
+def foreign_keys(table):
+    return [(column.name, key.column.table.name)
+            for column in table.columns for key in column.foreign_keys]
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def reference_map(reader, writer, table, column):
+    pairs = select([table.c[column], table.c.id])
+    names = dict(writer.execute(pairs).fetchall())
+    return dict((old_id, names.get(name))
+                for name, old_id in reader.execute(pairs).fetchall())
+
+
+def copy_tenant(tenant_id, reader, writer, batch_size, report=None):
+    tables = tenant_tables()
+    referenced = set(name for table in tables
+                     for column, name in foreign_keys(table))
+    emails = [email for email, in db.session.query(UserLocation.email)
+              .filter(UserLocation.tenant_id == tenant_id)]
+    maps = {}
+    counts = []
+    for table in tables:
+        if table.name in REFERENCE_TABLES:
+            maps[table.name] = reference_map(reader, writer, table,
+                                             REFERENCE_TABLES[table.name])
+            continue
+        keys = foreign_keys(table)
+        owners = [(column, name) for column, name in keys
+                  if name not in REFERENCE_TABLES]
+        if table.name == 'users':
+            column, values = table.c.email, emails
+        elif owners:
+            column, values = table.c[owners[0][0]], \
+                sorted(maps.get(owners[0][1], ()))
+        else:
+            # shard-wide bookkeeping such as backfill checkpoints stays put
+            continue
+        # ids are reassigned in the target, so references are rewritten
+        generated = [c.name for c in table.primary_key.columns] == ['id']
+        id_map = maps.setdefault(table.name, {})
+        copied = skipped = 0
+        for chunk in chunks(values, batch_size):
+            rows = []
+            query = table.select().where(column.in_(chunk))
+            for row in reader.execute(query):
+                record = dict(row.items())
+                if any(record[c] is not None and
+                       record[c] not in maps.get(name, ())
+                       for c, name in keys):
+                    skipped += 1
+                    continue
+                for c, name in keys:
+                    if record[c] is not None:
+                        record[c] = maps[name][record[c]]
+                if generated:
+                    old_id = record.pop('id')
+                    if table.name in referenced:
+                        id_map[old_id] = writer.execute(
+                            table.insert(), record).inserted_primary_key[0]
+                        copied += 1
+                        continue
+                rows.append(record)
+            if rows:
+                writer.execute(table.insert(), rows)
+                copied += len(rows)
+        counts.append((table.name, copied, skipped))
+        if report is not None:
+            report(table.name, copied, skipped)
+    return counts
+
+
+def move_tenant(tenant, shard, wait=None, batch_size=None,
+                delete_source=False, report=None):
+    """Copy a tenant's rows to another shard and route it there.
+
+    Archived answer files are not moved: they hold the ids of the source
+    shard, which the copy reassigns. The copied rollups keep the summaries,
+    but the raw archived answers stay with the source shard, so the source
+    is not deleted while the tenant has any.
+    """
+    from .archive import has_archive
+    from .deletion import delete_user
+    if shard not in shard_keys(current_app):
+        raise TenantError('There is no shard called {0}.'.format(shard))
+    if tenant.shard == shard:
+        raise TenantError('{0} is already on that shard.'.format(tenant.name))
+    if wait is None:
+        wait = current_app.config['KYBURZ_TENANT_CACHE_SECONDS']
+    batch_size = batch_size or current_app.config['KYBURZ_DELETE_BATCH_SIZE']
+    tenant_id, source = tenant.id, tenant.shard
+    tenant.moving = True
+    db.session.add(tenant)
+    db.session.commit()
+    directory.invalidate(tenant_id)
+    # wait until every process has seen that the tenant is read only
+    time.sleep(wait)
+    try:
+        emails = [email for email, in db.session.query(UserLocation.email)
+                  .filter(UserLocation.tenant_id == tenant_id)]
+        with use_shard(source):
+            # job arguments hold ids that change in the new shard
+            if Job.query.join(User, User.id == Job.owner_id).filter(
+                    User.email.in_(emails),
+                    Job.status.in_(('queued', 'running'))).count():
+                raise TenantError('The tenant still has unfinished jobs.')
+            if delete_source and has_archive(
+                    [user_id for chunk in chunks(emails, batch_size)
+                     for user_id, in db.session.query(User.id)
+                     .filter(User.email.in_(chunk))]):
+                raise TenantError('Archived answers are not moved, so the '
+                                  'old copy has to be kept.')
+        with use_shard(shard):
+            Role.insert_roles()
+        reader = db.get_engine(current_app, bind=source).connect()
+        try:
+            with db.get_engine(current_app, bind=shard).begin() as writer:
+                counts = copy_tenant(tenant_id, reader, writer, batch_size,
+                                     report)
+        finally:
+            reader.close()
+    except:
+        Tenant.query.filter_by(id=tenant_id).update({'moving': False})
+        db.session.commit()
+        directory.invalidate(tenant_id)
+        raise
+    Tenant.query.filter_by(id=tenant_id).update({'shard': shard,
+                                                 'moving': False})
+    db.session.commit()
+    directory.invalidate(tenant_id)
+    if delete_source:
+        if any(skipped for name, copied, skipped in counts):
+            raise TenantError('Some rows refer to other tenants, so the old '
+                              'copy was kept.')
+        # requests that still route to the old shard only read from it
+        time.sleep(wait)
+        with use_shard(source):
+            for chunk in chunks(emails, batch_size):
+                for user in User.query.filter(User.email.in_(chunk)).all():
+                    delete_user(user, forget=False).execute(batch_size)
+    return counts
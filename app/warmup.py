@@ -0,0 +1,59 @@
+import mimetypes
+import time
+from collections import OrderedDict
+from jinja2.utils import LRUCache
+from sqlalchemy.orm import configure_mappers
+from importtimer import ImportTimer
+
+
+def preload(app, register_blueprints, timer=None):
+    phases = OrderedDict()
+    if timer is not None:
+        # started by the entry point, before the app package was imported
+        phases['imports'] = time.time() - timer.started
+    else:
+        timer = ImportTimer().start()
+
+    start = time.time()
+    try:
+        register_blueprints(app)
+    finally:
+        timer.stop()
+    phases['blueprints'] = time.time() - start
+
+    start = time.time()
+    configure_mappers()
+    phases['mappers'] = time.time() - start
+
+    start = time.time()
+    templates = app.jinja_env.list_templates()
+    app.jinja_env.cache = LRUCache(max(len(templates), 400))
+    for name in templates:
+        app.jinja_env.get_template(name)
+    phases['templates'] = time.time() - start
+
+    start = time.time()
+    app.url_map.update()
+    mimetypes.init()
+    time.strptime('2015', '%Y')
+    phases['caches'] = time.time() - start
+
+    app.extensions['kyburz_startup'] = {'phases': phases,
+                                        'imports': timer.timings,
+                                        'templates': len(templates)}
+    return app
+
+
+def format_report(app, limit=20):
+    report = app.extensions.get('kyburz_startup')
+    if report is None:
+        return 'The app was not preloaded; set KYBURZ_PRELOAD=1.'
+    lines = ['Startup phases:']
+    for phase, seconds in report['phases'].items():
+        lines.append('  {0:<12} {1:8.1f} ms'.format(phase, seconds * 1000))
+    lines.append('Templates compiled: {0}'.format(report['templates']))
+    lines.append('Slowest imports (exclusive time):')
+    imports = sorted(report['imports'].items(), key=lambda i: -i[1])
+    for module, seconds in imports[:limit]:
+        lines.append('  {0:<40} {1:8.1f} ms'.format(module, seconds * 1000))
+    return '\n'.join(lines)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from app import create_app, db
+from app.models import Lesson, Problem, AnswerSubmission
+from app.teacher.analytics import answer_rows, build_matrix, \
+    item_analysis, item_statistics
+
+
+def synthetic_rows(students, problems, seed=None, tried=0.9):
+    # abilities and difficulties on the same scale, as in a Rasch model
+    rng = np.random.RandomState(seed)
+    ability = rng.normal(0, 1, students)
+    difficulty = rng.normal(0, 1, problems)
+    user, problem = np.nonzero(rng.random_sample((students, problems)) <
+                               tried)
+    # one to three answers to each problem a student tries
+    repeats = rng.randint(1, 4, len(user))
+    user = np.repeat(user, repeats)
+    problem = np.repeat(problem, repeats)
+    chance = 1 / (1 + np.exp(difficulty[problem] - ability[user]))
+    correct = (rng.random_sample(len(user)) < chance).astype(np.int64)
+    ids = rng.permutation(len(user)) + 1
+    return np.column_stack((user + 1, problem + 1, correct, ids)) \
+        .astype(np.int64)
+
+
+def check(matrix, attempted, stats, samples=5):
+    # the vectorized point biserial against the textbook one, one item
+    # at a time
+    total = matrix.sum(axis=1).astype(np.float64)
+    for j in np.linspace(0, matrix.shape[1] - 1, samples).astype(int):
+        mask = attempted[:, j]
+        item = matrix[mask, j].astype(np.float64)
+        rest = total[mask] - item
+        expected = np.corrcoef(item, rest)[0, 1]
+        if not np.allclose(expected, stats['point_biserial'][j],
+                           equal_nan=True):
+            raise AssertionError('problem {0}: {1} != {2}'.format(
+                j, stats['point_biserial'][j], expected))
+
+
+def load_database(app, rows, problems):
+    with app.app_context():
+        db.create_all()
+        db.session.add(Lesson(id=1, number=1, name='Benchmark'))
+        db.session.execute(Problem.__table__.insert(), [
+            {'id': i, 'lesson_id': 1, 'number': i, 'text': 'x={0}'.format(i)}
+            for i in range(1, problems + 1)])
+        db.session.commit()
+        # straight through the driver; the answers only need the columns
+        # the analysis reads
+        connection = db.engine.raw_connection()
+        try:
+            # a scratch file that is thrown away, so nothing to fsync
+            connection.cursor().execute('PRAGMA synchronous = OFF')
+            connection.cursor().executemany(
+                'INSERT INTO {0} (id, user_id, problem_id, is_correct) '
+                'VALUES (?, ?, ?, ?)'.format(AnswerSubmission.__tablename__),
+                ((int(i), int(u), int(p), int(c)) for u, p, c, i in rows))
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def time_database(rows, problems, repeat):
+    # always a scratch SQLite file, never a database that holds real data
+    tempdir = tempfile.mkdtemp(prefix='kyburz-items-')
+    try:
+        app = create_app('testing')
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(tempdir, 'items.sqlite')
+        start = time.time()
+        load_database(app, rows, problems)
+        loaded = time.time() - start
+        timings = {'query': [], 'analysis': []}
+        with app.app_context():
+            for _ in range(repeat):
+                start = time.time()
+                answer_rows(1)
+                timings['query'].append(time.time() - start)
+                start = time.time()
+                item_analysis(1)
+                timings['analysis'].append(time.time() - start)
+        return {'loaded': loaded,
+                'query': min(timings['query']),
+                'analysis': min(timings['analysis'])}
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def run(students=10000, problems=500, seed=None, repeat=3, database=True):
+    start = time.time()
+    rows = synthetic_rows(students, problems, seed)
+    generated = time.time() - start
+    problem_ids = np.arange(1, problems + 1)
+    timings = {'matrix': [], 'statistics': []}
+    for _ in range(repeat):
+        start = time.time()
+        _, matrix, attempted = build_matrix(rows, problem_ids)
+        timings['matrix'].append(time.time() - start)
+        start = time.time()
+        stats = item_statistics(matrix, attempted)
+        timings['statistics'].append(time.time() - start)
+    check(matrix, attempted, stats)
+    report = {'students': students,
+              'problems': problems,
+              'answers': len(rows),
+              'generated': generated,
+              'matrix': min(timings['matrix']),
+              'statistics': min(timings['statistics'])}
+    if database:
+        report['database'] = time_database(rows, problems, repeat)
+    return report
+
+
+def format_report(report):
+    return '\n'.join([
+        '{0} students x {1} problems, {2} answers'.format(
+            report['students'], report['problems'], report['answers']),
+        'synthetic data   {0:8.2f} s'.format(report['generated']),
+        'build matrix     {0:8.2f} s'.format(report['matrix']),
+        'item statistics  {0:8.2f} s'.format(report['statistics'])] + ([
+        'load SQLite      {0:8.2f} s'.format(report['database']['loaded']),
+        'query answers    {0:8.2f} s'.format(report['database']['query']),
+        'whole analysis   {0:8.2f} s'.format(report['database']['analysis'])]
+        if 'database' in report else []))
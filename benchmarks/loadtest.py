@@ -0,0 +1,284 @@
+import cookielib
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib
+import urllib2
+from fractions import Fraction
+from werkzeug.serving import make_server, WSGIRequestHandler
+from app import create_app, db, admission_control
+from app.models import Role, User, Lesson, Problem
+
+csrf_token = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+# what the run leaves out compared to production, shown with the results
+LIMITATIONS = ('Production settings, except that mail is not sent, the '
+               'limits per address are off since every user shares one, '
+               'and no job worker runs.')
+
+EQUATIONS = ['2x+3=7', '3(x-1)=2x+4', '5x=2', '4-x=3x', '7(2-x)=3(x+1)',
+             '-2x+5=x-4', '6x-1=4x+8', 'x+1=2x']
+
+
+class NoRedirect(urllib2.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Results(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, elapsed, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self):
+        summary = {}
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            summary[name] = {
+                'requests': len(latencies),
+                'errors': self.errors.get(name, 0),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1]}
+        return summary
+
+
+def percentile(ordered, p):
+    index = int(round(p / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class VirtualUser(object):
+    def __init__(self, harness, email, password='cat'):
+        self.harness = harness
+        self.email = email
+        self.password = password
+        self.opener = urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(cookielib.CookieJar()), NoRedirect)
+
+    def request(self, name, path, data=None, expect=(200, 302)):
+        url = self.harness.base_url + path
+        if data is not None:
+            data = urllib.urlencode(data)
+        start = time.time()
+        try:
+            response = self.opener.open(url, data)
+        except urllib2.HTTPError as e:
+            response = e
+        except Exception:
+            self.harness.results.record(name, time.time() - start, False)
+            return None, ''
+        body = response.read()
+        status = response.getcode()
+        self.harness.results.record(name, time.time() - start,
+                                    status in expect)
+        return status, body
+
+    def submit(self, name, path, fields):
+        status, body = self.request(name + ' GET', path)
+        match = csrf_token.search(body)
+        if match is None:
+            self.harness.results.record(name + ' POST', 0, False)
+            return None, ''
+        fields = dict(fields, csrf_token=match.group(1))
+        return self.request(name + ' POST', path, fields, expect=(302,))
+
+    def sign_up(self):
+        self.submit('auth.register', '/auth/register', {
+            'email': self.email, 'first_name': 'Load', 'last_name': 'Test',
+            'password': self.password, 'password2': self.password})
+        self.submit('auth.login', '/auth/login', {
+            'email': self.email, 'password': self.password})
+        token = self.harness.confirmation_token(self.email)
+        if token is not None:
+            self.request('auth.confirm', '/auth/confirm/' + token)
+
+    def teach(self, problems):
+        self.sign_up()
+        self.harness.promote(self.email)
+        self.submit('teacher.lessons', '/teacher/lessons',
+                    {'name': 'Load test lesson'})
+        lesson_id = self.harness.latest_lesson(self.email)
+        if lesson_id is None:
+            return
+        for text in problems:
+            self.submit('teacher.edit_lesson',
+                        '/teacher/edit_lesson/{0}'.format(lesson_id),
+                        {'text': text})
+
+    def learn(self, rng):
+        self.sign_up()
+        self.harness.enroll(self.email, rng)
+        self.request('student.lessons', '/student/lessons')
+        for lesson_id, problems in self.harness.lessons_for(self.email):
+            self.request('student.lesson',
+                         '/student/lesson/{0}'.format(lesson_id))
+            for problem_id, answer in problems:
+                fields = {'variable_value': answer[0],
+                          'left_side_value': answer[1],
+                          'right_side_value': answer[1]}
+                if rng.random() < 0.3:
+                    fields = dict(fields, variable_value='12345')
+                self.submit('student.problem',
+                            '/student/problem/{0}'.format(problem_id), fields)
+        self.request('auth.logout', '/auth/logout')
+
+
+class Harness(object):
+    def __init__(self, database=None, port=0, reset=False):
+        if database is not None and not reset:
+            # every table is dropped before the run
+            raise ValueError('The load test empties {0}; pass reset=True if '
+                             'that is what you want.'.format(database))
+        self.tempdir = tempfile.mkdtemp(prefix='kyburz-loadtest-')
+        if database is None:
+            database = 'sqlite:///' + os.path.join(self.tempdir, 'load.sqlite')
+        self.app = create_app('loadtest')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = database
+        # rate limit state of earlier runs would throttle this one
+        admission_control.directory = os.path.join(self.tempdir, 'admission')
+        self.database = database
+        self.results = Results()
+        self.lock = threading.Lock()
+        self.teachers = []
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            Role.insert_roles()
+        self.server = make_server('127.0.0.1', port, self.app, threaded=True,
+                                  request_handler=QuietRequestHandler)
+        self.base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+
+    def confirmation_token(self, email):
+        with self.app.app_context():
+            user = User.query.filter_by(email=email).first()
+            return user and user.generate_confirmation_token()
+
+    def promote(self, email):
+        with self.app.app_context():
+            user = User.query.filter_by(email=email).first()
+            if user is not None:
+                user.role = Role.query.filter_by(name='Teacher').first()
+                db.session.commit()
+                with self.lock:
+                    self.teachers.append(user.id)
+
+    def latest_lesson(self, email):
+        with self.app.app_context():
+            lesson = Lesson.query.join(User, User.id == Lesson.author_id) \
+                .filter(User.email == email) \
+                .order_by(Lesson.id.desc()).first()
+            return lesson and lesson.id
+
+    def enroll(self, email, rng):
+        with self.app.app_context():
+            user = User.query.filter_by(email=email).first()
+            if user is None or not self.teachers:
+                return
+            user.add_teacher(User.query.get(rng.choice(self.teachers)))
+            db.session.commit()
+
+    def lessons_for(self, email):
+        with self.app.app_context():
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                return []
+            lessons = []
+            for relationship in user.teachers:
+                for lesson in Lesson.query.filter_by(
+                        author_id=relationship.teacher_id):
+                    lessons.append((lesson.id, [
+                        (p.id, answer(p)) for p in
+                        lesson.problems.order_by(Problem.number)]))
+            return lessons
+
+    def run(self, users=20, teachers=2, ramp=10.0, seed=None):
+        rng = random.Random(seed)
+        server = threading.Thread(target=self.server.serve_forever)
+        server.daemon = True
+        server.start()
+        start = time.time()
+        try:
+            threads = [threading.Thread(
+                target=VirtualUser(self, 'teacher{0}@load.test'.format(i))
+                .teach, args=(EQUATIONS,)) for i in range(teachers)]
+            run_all(threads, 0)
+            threads = [threading.Thread(
+                target=VirtualUser(self, 'student{0}@load.test'.format(i))
+                .learn, args=(random.Random(rng.random()),))
+                for i in range(users)]
+            run_all(threads, ramp)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            shutil.rmtree(self.tempdir)
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.gmtime(start)),
+                'duration': time.time() - start,
+                'revision': revision(),
+                'database': self.database.split(':')[0],
+                'users': users,
+                'teachers': teachers,
+                'ramp': ramp,
+                'limitations': LIMITATIONS,
+                'endpoints': self.results.summary()}
+
+
+def answer(problem):
+    if not problem.solution_denominator:
+        return '0', '0'
+    return (str(Fraction(problem.solution_numerator,
+                         problem.solution_denominator)),
+            str(Fraction(problem.left_side_numerator,
+                         problem.left_side_denominator)))
+
+
+def run_all(threads, ramp):
+    for i, thread in enumerate(threads):
+        thread.start()
+        if ramp and i < len(threads) - 1:
+            time.sleep(float(ramp) / len(threads))
+    for thread in threads:
+        thread.join()
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_report(report, baseline=None):
+    lines = ['{0:<28} {1:>6} {2:>6} {3:>9} {4:>9} {5:>9}'.format(
+        'endpoint', 'reqs', 'errors', 'p50 ms', 'p95 ms', 'p99 ms')]
+    for name, stats in sorted(report['endpoints'].items()):
+        line = '{0:<28} {1:>6} {2:>6} {3:>9.1f} {4:>9.1f} {5:>9.1f}'.format(
+            name, stats['requests'], stats['errors'], stats['p50'] * 1000,
+            stats['p95'] * 1000, stats['p99'] * 1000)
+        previous = (baseline or {}).get('endpoints', {}).get(name)
+        if previous and previous['p95']:
+            line += ' {0:+6.0f}% p95'.format(
+                (stats['p95'] / previous['p95'] - 1) * 100)
+        lines.append(line)
+    lines.append(report['limitations'])
+    return '\n'.join(lines)
@@ -12,7 +12,81 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     KYBURZ_MAIL_SUBJECT_PREFIX = '[Kyburz]'
     KYBURZ_MAIL_SENDER = os.environ.get('KYBURZ_MAIL_SENDER')
+    # links in mail sent by background jobs, which have no request to
+    # take the address from
+    KYBURZ_EXTERNAL_URL = os.environ.get('KYBURZ_EXTERNAL_URL') or \
+        'http://localhost:5000'
     KYBURZ_ADMIN = os.environ.get('KYBURZ_ADMIN')
+    KYBURZ_ASSETS_DIR = os.path.join(basedir, 'app', 'static', 'dist')
+    KYBURZ_ASSETS_MAX_AGE = 365 * 24 * 3600
+    KYBURZ_LIVE_KEEPALIVE = 15
+    KYBURZ_PROFILE_REQUESTS = bool(os.environ.get('KYBURZ_PROFILE_REQUESTS'))
+    KYBURZ_SLOW_REQUEST_TIME = 0.5
+    KYBURZ_SLOWEST_QUERIES_SHOWN = 5
+    KYBURZ_METRICS_DIR = os.environ.get('KYBURZ_METRICS_DIR')
+    KYBURZ_METRICS_FLUSH_INTERVAL = 5
+    # /metrics answers these addresses, and scrapers that send
+    # "Authorization: Bearer <token>"
+    KYBURZ_METRICS_ALLOW = (os.environ.get('KYBURZ_METRICS_ALLOW') or
+                            '127.0.0.1 ::1').split()
+    KYBURZ_METRICS_TOKEN = os.environ.get('KYBURZ_METRICS_TOKEN')
+    KYBURZ_ROSTER_POOL_THRESHOLD = 20
+    KYBURZ_ROSTER_POOL_PROCESSES = None
+    KYBURZ_ROSTER_TOKEN_EXPIRATION = 7 * 24 * 3600
+    KYBURZ_SEARCH_RESULTS_PER_PAGE = 20
+    KYBURZ_BACKFILL_BATCH_SIZE = 1000
+    KYBURZ_BACKFILL_SLEEP = 0.05
+    KYBURZ_ARCHIVE_DIR = os.environ.get('KYBURZ_ARCHIVE_DIR') or \
+        os.path.join(basedir, 'archive')
+    KYBURZ_ARCHIVE_AFTER_DAYS = 365
+    KYBURZ_ARCHIVE_BATCH_SIZE = 5000
+    KYBURZ_DELETE_BATCH_SIZE = 1000
+    KYBURZ_SYNC_MAX_BATCH = 200
+    KYBURZ_SYNC_MAX_AGE = 7 * 24 * 3600
+    KYBURZ_MAX_STEPS = 30
+    KYBURZ_WORKSHEET_DIR = os.environ.get('KYBURZ_WORKSHEET_DIR') or \
+        os.path.join(basedir, 'worksheets')
+    KYBURZ_WORKSHEET_POOL_THRESHOLD = 8
+    KYBURZ_WORKSHEET_POOL_PROCESSES = None
+    KYBURZ_JOBS_INLINE = False
+    KYBURZ_WORKER_PROCESSES = 2
+    KYBURZ_WORKER_POLL_INTERVAL = 1.0
+    KYBURZ_JOB_TIMEOUT = 600
+    KYBURZ_JOB_RETRY_DELAY = 30
+    KYBURZ_JOB_MAX_ATTEMPTS = 3
+    # KYBURZ_SHARDS="east=postgresql://... west=postgresql://..."
+    KYBURZ_SHARDS = dict(shard.split('=', 1) for shard in
+                         os.environ.get('KYBURZ_SHARDS', '').split())
+    KYBURZ_TENANT_CACHE_SECONDS = 30
+    # KYBURZ_CACHE_BUS_URL="unix:///run/kyburz/bus" or "redis://host:6379/0"
+    KYBURZ_CACHE_BUS_URL = os.environ.get('KYBURZ_CACHE_BUS_URL')
+    KYBURZ_CACHE_BUS_RETRY = 5
+    KYBURZ_CACHE_FALLBACK_SECONDS = 5
+    # shared by the workers of one machine, so limits apply per machine
+    KYBURZ_ADMISSION_DIR = os.environ.get('KYBURZ_ADMISSION_DIR') or \
+        os.path.join(basedir, 'admission')
+    KYBURZ_ADMISSION_BUCKETS = 16384
+    # concurrency: requests in progress at once; user and ip: a token
+    # bucket of (requests per second, burst); methods default to POST
+    KYBURZ_ADMISSION_LIMITS = {
+        'auth.login': {'concurrency': 4, 'user': (1.0 / 30, 10),
+                       'ip': (5, 100)},
+        'auth.register': {'concurrency': 4, 'ip': (1, 30)},
+        'auth.change_password': {'concurrency': 4, 'user': (1.0 / 30, 5)},
+        'auth.password_reset_request': {'concurrency': 2,
+                                        'user': (1.0 / 60, 3),
+                                        'ip': (1, 30)},
+        'auth.password_reset': {'concurrency': 4, 'ip': (1, 30)},
+        'auth.change_email_request': {'concurrency': 2,
+                                      'user': (1.0 / 60, 3)},
+        'auth.resend_confirmation': {'methods': ('GET',),
+                                     'user': (1.0 / 60, 3)},
+        'teacher.edit_lesson': {'concurrency': 8, 'user': (2, 30)},
+        'teacher.submissions_export': {'methods': ('GET',), 'concurrency': 2,
+                                       'user': (1.0 / 10, 3)},
+        'teacher.worksheet': {'methods': ('GET',), 'concurrency': 2,
+                              'user': (1, 20)},
+    }
 
     @staticmethod
     def init_app(app):
@@ -27,6 +101,8 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    KYBURZ_JOBS_INLINE = True
+    KYBURZ_ADMISSION_LIMITS = {}
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
 
@@ -36,10 +112,23 @@ class ProductionConfig(Config):
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
 
 
+class LoadTestConfig(ProductionConfig):
+    # production settings for benchmarks/loadtest.py, which sends no mail;
+    # its users all share one address, so only the per address limits are
+    # left out
+    MAIL_SUPPRESS_SEND = True
+    KYBURZ_MAIL_SENDER = 'Kyburz Load Test <loadtest@load.test>'
+    KYBURZ_ADMISSION_LIMITS = dict(
+        (endpoint, dict((kind, value) for kind, value in limit.items()
+                        if kind != 'ip'))
+        for endpoint, limit in Config.KYBURZ_ADMISSION_LIMITS.items())
+
+
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
+    'loadtest': LoadTestConfig,
 
     'default': DevelopmentConfig
 }
@@ -0,0 +1,56 @@
+import sys
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+
+class ImportTimer(object):
+    """Exclusive import time per module.
+
+    Kept outside the app package so an entry point can start it before the
+    package itself is imported.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.stack = []
+        self.started = None
+        self.original_import = None
+
+    def start(self):
+        self.started = time.time()
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+        return self
+
+    def stop(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def timed_import(self, name, *args, **kwargs):
+        before = set(sys.modules)
+        self.stack.append([0.0, set()])
+        start = time.time()
+        try:
+            return self.original_import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children, loaded_by_children = self.stack.pop()
+            loaded = set(m for m in sys.modules
+                         if m not in before and sys.modules[m] is not None)
+            if self.stack:
+                self.stack[-1][0] += elapsed
+                self.stack[-1][1].update(loaded)
+            loaded -= loaded_by_children
+            if loaded:
+                module = max(loaded, key=len)
+                self.timings[module] = elapsed - children
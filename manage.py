@@ -1,12 +1,20 @@
 #!/usr/bin/env python
 import os
+from functools import wraps
+from importtimer import ImportTimer
+
+# started before the app package, so the startup report covers its imports
+import_timer = ImportTimer().start() if os.getenv('KYBURZ_PRELOAD') else None
+
 from app import create_app, db
 from app.models import User, Role, Permission, Lesson, Problem, \
     AnswerSubmission, TeachingRelationship
 from flask.ext.script import Manager, Shell
 from flask.ext.migrate import Migrate, MigrateCommand
 
-app = create_app(os.getenv('KYBURZ_CONFIG') or 'default')
+app = create_app(os.getenv('KYBURZ_CONFIG') or 'default',
+                 preload=bool(os.getenv('KYBURZ_PRELOAD')),
+                 import_timer=import_timer)
 manager = Manager(app)
 migrate = Migrate(app, db)
 
@@ -19,6 +27,15 @@ manager.add_command("shell", Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
 
+def on_shard(f):
+    @wraps(f)
+    def decorated(shard=None, **kwargs):
+        from app.tenancy import use_shard
+        with use_shard(shard):
+            return f(**kwargs)
+    return decorated
+
+
 @manager.command
 def test():
     """Run the unit tests."""
@@ -27,5 +44,228 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+@manager.command
+def build_assets():
+    """Build the fingerprinted, precompressed static bundles."""
+    from app.assets import build
+    for name, filename in sorted(build(app).items()):
+        print('{0} -> {1}'.format(name, filename))
+
+
+@manager.command
+def startup_report():
+    """Show the preload phase and per-module import timings."""
+    from app.warmup import format_report
+    print(format_report(app))
+
+
+@manager.option('-u', '--users', type=int, default=20,
+                help='Number of virtual students')
+@manager.option('-t', '--teachers', type=int, default=2,
+                help='Number of virtual teachers')
+@manager.option('-r', '--ramp', type=float, default=10.0,
+                help='Seconds over which the students are started')
+@manager.option('-d', '--database', default=None,
+                help='Scratch database URL (a temporary SQLite by default)')
+@manager.option('--reset', action='store_true', default=False,
+                help='Allow emptying the --database before the run')
+@manager.option('-o', '--output', default=None,
+                help='Write the results as JSON to this file')
+@manager.option('-c', '--compare', default=None,
+                help='Compare against an earlier JSON results file')
+@manager.option('-s', '--seed', type=int, default=None)
+def loadtest(users, teachers, ramp, database, reset, output, compare, seed):
+    """Run the scripted user journey against a local server."""
+    import json
+    from benchmarks.loadtest import Harness, format_report
+    if database is not None and not reset:
+        print('The load test drops every table in {0}; add --reset to go '
+              'ahead.'.format(database))
+        return
+    report = Harness(database, reset=reset).run(users, teachers, ramp, seed)
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+@manager.option('-u', '--students', type=int, default=10000)
+@manager.option('-p', '--problems', type=int, default=500)
+@manager.option('-r', '--repeat', type=int, default=3)
+@manager.option('-s', '--seed', type=int, default=None)
+@manager.option('--memory-only', dest='memory_only', action='store_true',
+                default=False, help='Skip the scratch database')
+def benchmark_items(students, problems, repeat, seed, memory_only):
+    """Time the item analysis on a synthetic class."""
+    from benchmarks.item_analysis import run, format_report
+    print(format_report(run(students, problems, seed, repeat,
+                            not memory_only)))
+
+
+@manager.option('--seed', type=int, default=0)
+@manager.option('--teachers', type=int, default=20)
+@manager.option('--students', type=int, default=30,
+                help='Students per teacher')
+@manager.option('--lessons', type=int, default=5, help='Lessons per teacher')
+@manager.option('--problems', type=int, default=10,
+                help='Problems per lesson')
+@manager.option('--submissions', type=int, default=1000000)
+@manager.option('--batch-size', dest='batch_size', type=int, default=10000)
+@manager.option('--archive-after', dest='archive_after', type=int,
+                default=120, help='Archive answers older than this many '
+                'days, counted back from the newest')
+def fake(seed, teachers, students, lessons, problems, submissions,
+         batch_size, archive_after):
+    """Fill the database with a reproducible synthetic data set."""
+    from app.fake import Generator
+    Generator(seed, batch_size).generate(teachers, students, lessons,
+                                         problems, submissions, archive_after)
+
+
+@manager.option('name', nargs='?', default=None,
+                help='Backfill to run (all unfinished ones by default)')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=None, help='Rows per chunk')
+@manager.option('-s', '--sleep', type=float, default=None,
+                help='Seconds to pause between chunks')
+@manager.option('--restart', action='store_true', default=False,
+                help='Forget the checkpoint and start from the first row')
+@manager.option('-l', '--list', dest='show', action='store_true',
+                default=False, help='Show the registered backfills')
+@manager.option('--shard', default=None, help='Shard to work on')
+@on_shard
+def backfill(name, batch_size, sleep, restart, show):
+    """Run a chunked, resumable data backfill."""
+    from app import backfill
+    if show:
+        for backfill_name, checkpoint in backfill.status():
+            if checkpoint is None:
+                state = 'not started'
+            elif checkpoint.finished_at is not None:
+                state = 'finished at {0}'.format(checkpoint.finished_at)
+            else:
+                state = '{0} rows, resumes after id {1}'.format(
+                    checkpoint.rows, checkpoint.last_id)
+            print('{0}: {1}'.format(backfill_name, state))
+        return
+
+    def report(backfill_name, rows, last_id, rate):
+        print('{0}: {1} rows, last id {2}, {3:.0f} rows/s'.format(
+            backfill_name, rows, last_id, rate))
+    for backfill_name in [name] if name else backfill.backfills:
+        result = backfill.run(backfill_name, batch_size=batch_size,
+                              sleep=sleep, restart=restart, report=report)
+        print('{0}: done, {1} rows in {2:.1f}s'.format(
+            backfill_name, result['rows'], result['seconds']))
+
+
+@manager.option('-d', '--days', type=int, default=None,
+                help='Archive submissions older than this many days')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=None)
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true',
+                default=False, help='Only count what would be archived')
+@manager.option('--shard', default=None, help='Shard to work on')
+@on_shard
+def archive(days, batch_size, dry_run):
+    """Move old answer submissions to compressed monthly files."""
+    from app.archive import archive_old_submissions
+
+    def report(archived, last_id):
+        print('{0} submissions archived, last id {1}'.format(archived,
+                                                             last_id))
+    archived = archive_old_submissions(days, batch_size=batch_size,
+                                       dry_run=dry_run, report=report)
+    print('{0} submissions {1}.'.format(
+        archived, 'would be archived' if dry_run else 'archived'))
+
+
+@manager.option('-u', '--user', default=None, help='Email of a user to delete')
+@manager.option('-l', '--lesson', type=int, default=None,
+                help='Id of a lesson to delete')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=None)
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true',
+                default=False, help='Only count the rows that would go')
+@manager.option('--shard', default=None, help='Shard to work on')
+@on_shard
+def delete(user, lesson, batch_size, dry_run):
+    """Delete a user or lesson and everything that depends on it."""
+    from app.deletion import delete_user, delete_lesson
+    if user is not None:
+        target = User.query.filter_by(email=user).first()
+        if target is None:
+            print('There is no user {0}.'.format(user))
+            return
+        deletion = delete_user(target)
+    elif lesson is not None:
+        target = Lesson.query.get(lesson)
+        if target is None:
+            print('There is no lesson {0}.'.format(lesson))
+            return
+        deletion = delete_lesson(target)
+    else:
+        print('Give a --user or a --lesson to delete.')
+        return
+    counts = deletion.counts() if dry_run else deletion.execute(batch_size)
+    for description, count in counts:
+        print('{0}: {1}'.format(description, count))
+
+
+@manager.option('-p', '--processes', type=int, default=None,
+                help='Number of worker processes')
+def worker(processes):
+    """Run background jobs until interrupted."""
+    from app.jobs import run_workers
+    run_workers(app, processes)
+
+
+@manager.option('name', nargs='?', default=None, help='Name of the tenant')
+@manager.option('-c', '--create', action='store_true', default=False,
+                help='Create the tenant')
+@manager.option('-a', '--add', default=None,
+                help='Email of a teacher to add with their students')
+@manager.option('-m', '--move', default=None,
+                help='Shard to move the tenant to ("main" for the main '
+                     'database)')
+@manager.option('--delete-source', dest='delete_source', action='store_true',
+                default=False, help='Delete the old copy after a move')
+@manager.option('--no-wait', dest='wait', action='store_const', const=0,
+                default=None, help='Do not wait for other processes to see '
+                                   'that the tenant is moving')
+def tenant(name, create, add, move, delete_source, wait):
+    """List, create, fill and move tenants between shards."""
+    from app import tenancy
+    from app.models import Tenant
+    if name is None:
+        for t in Tenant.query.order_by(Tenant.name):
+            print('{0}: {1}{2}'.format(t.name, t.shard or 'main',
+                                       ' (moving)' if t.moving else ''))
+        return
+    if create:
+        db.session.add(Tenant(name=name))
+        db.session.commit()
+    t = Tenant.query.filter_by(name=name).first()
+    if t is None:
+        print('There is no tenant called {0}.'.format(name))
+        return
+    try:
+        if add is not None:
+            added = tenancy.add_teacher(t, add)
+            print('{0} users added to {1}.'.format(added, t.name))
+        if move is not None:
+            def report(table, copied, skipped):
+                print('{0}: {1} rows copied, {2} skipped'.format(
+                    table, copied, skipped))
+            tenancy.move_tenant(t, None if move == 'main' else move, wait=wait,
+                                delete_source=delete_source, report=report)
+    except tenancy.TenantError as e:
+        print(e.message)
+
+
 if __name__ == '__main__':
     manager.run()
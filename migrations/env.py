@@ -1,6 +1,7 @@
 from __future__ import with_statement
 from alembic import context
 from sqlalchemy import engine_from_config, pool
+from functools import partial
 from logging.config import fileConfig
 
 # this is the Alembic Config object, which provides
@@ -24,6 +25,11 @@ target_metadata = current_app.extensions['migrate'].db.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+def include_object(shard, object, name, type_, reflected, compare_to):
+    table = object if type_ == 'table' else getattr(object, 'table', None)
+    return shard is None or table is None or \
+        not table.info.get('directory')
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -49,22 +55,30 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
-    engine = engine_from_config(
-                config.get_section(config.config_ini_section),
-                prefix='sqlalchemy.',
-                poolclass=pool.NullPool)
-
-    connection = engine.connect()
-    context.configure(
-                connection=connection,
-                target_metadata=target_metadata
-                )
-
-    try:
-        with context.begin_transaction():
-            context.run_migrations()
-    finally:
-        connection.close()
+    # every shard has the same schema and its own migration history
+    urls = [(None, config.get_main_option('sqlalchemy.url'))] + \
+        sorted(current_app.config.get('KYBURZ_SHARDS', {}).items())
+    for shard, url in urls:
+        engine = engine_from_config(
+                    {'sqlalchemy.url': url},
+                    prefix='sqlalchemy.',
+                    poolclass=pool.NullPool)
+
+        connection = engine.connect()
+        # the tenant directory lives in the main database only; migrations
+        # read the shard from the context options to skip it
+        context.configure(
+                    connection=connection,
+                    target_metadata=target_metadata,
+                    include_object=partial(include_object, shard),
+                    shard=shard
+                    )
+
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.close()
 
 if context.is_offline_mode():
     run_migrations_offline()
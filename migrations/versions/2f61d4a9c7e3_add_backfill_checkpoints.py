@@ -0,0 +1,33 @@
+"""add backfill checkpoints
+
+Revision ID: 2f61d4a9c7e3
+Revises: 5d0b8e6c41a9
+Create Date: 2016-02-22 09:31:55.104377
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f61d4a9c7e3'
+down_revision = '5d0b8e6c41a9'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('backfill_checkpoints',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # the features are filled in by "manage.py backfill problem_features",
+    # which runs today's code rather than the code of this revision; until
+    # then the recommender describes problems that have none itself
+
+
+def downgrade():
+    op.drop_table('backfill_checkpoints')
@@ -0,0 +1,35 @@
+"""add mastery table and problem skill and difficulty
+
+Revision ID: 3c9e1f7a2b54
+Revises: 4a8425d30d22
+Create Date: 2016-02-08 10:12:41.318204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c9e1f7a2b54'
+down_revision = '4a8425d30d22'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('mastery',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('skill', sa.String(length=16), nullable=False),
+    sa.Column('rating', sa.Float(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'skill')
+    )
+    op.add_column('problems', sa.Column('skill', sa.String(length=16), nullable=True))
+    op.add_column('problems', sa.Column('difficulty', sa.Float(), nullable=True))
+    op.create_index('ix_answer_submissions_user_id_problem_id', 'answer_submissions', ['user_id', 'problem_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_answer_submissions_user_id_problem_id', 'answer_submissions')
+    op.drop_column('problems', 'difficulty')
+    op.drop_column('problems', 'skill')
+    op.drop_table('mastery')
@@ -0,0 +1,80 @@
+"""add full text search over lessons and problems
+
+Revision ID: 5d0b8e6c41a9
+Revises: 3c9e1f7a2b54
+Create Date: 2016-02-15 19:47:03.552918
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d0b8e6c41a9'
+down_revision = '3c9e1f7a2b54'
+
+from alembic import op
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE search_index USING fts5("
+    "body, author, lesson_id UNINDEXED)",
+    "CREATE TRIGGER lessons_search_insert AFTER INSERT ON lessons BEGIN "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "VALUES (new.id * 2, new.name, new.author_id, new.id); END",
+    "CREATE TRIGGER lessons_search_update AFTER UPDATE OF name, author_id "
+    "ON lessons BEGIN "
+    "UPDATE search_index SET body = new.name, author = new.author_id "
+    "WHERE rowid = new.id * 2; "
+    "UPDATE search_index SET author = new.author_id WHERE rowid IN "
+    "(SELECT id * 2 + 1 FROM problems WHERE lesson_id = new.id); END",
+    "CREATE TRIGGER lessons_search_delete AFTER DELETE ON lessons BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER problems_search_insert AFTER INSERT ON problems BEGIN "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT new.id * 2 + 1, new.text, author_id, id FROM lessons "
+    "WHERE id = new.lesson_id; END",
+    "CREATE TRIGGER problems_search_update AFTER UPDATE OF text, lesson_id "
+    "ON problems BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; "
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT new.id * 2 + 1, new.text, author_id, id FROM lessons "
+    "WHERE id = new.lesson_id; END",
+    "CREATE TRIGGER problems_search_delete AFTER DELETE ON problems BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT id * 2, name, author_id, id FROM lessons",
+    "INSERT INTO search_index (rowid, body, author, lesson_id) "
+    "SELECT problems.id * 2 + 1, problems.text, lessons.author_id, "
+    "lessons.id FROM problems JOIN lessons ON lessons.id = problems.lesson_id",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER lessons_search_insert",
+    "DROP TRIGGER lessons_search_update",
+    "DROP TRIGGER lessons_search_delete",
+    "DROP TRIGGER problems_search_insert",
+    "DROP TRIGGER problems_search_update",
+    "DROP TRIGGER problems_search_delete",
+    "DROP TABLE search_index",
+]
+POSTGRES_UPGRADE = [
+    "CREATE INDEX ix_lessons_search ON lessons USING gin "
+    "(to_tsvector('english', coalesce(name, '')))",
+    "CREATE INDEX ix_problems_search ON problems USING gin "
+    "(to_tsvector('simple', coalesce(text, '')))",
+]
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX ix_lessons_search",
+    "DROP INDEX ix_problems_search",
+]
+
+
+def run(sqlite, postgresql):
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': sqlite, 'postgresql': postgresql}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade():
+    run(SQLITE_UPGRADE, POSTGRES_UPGRADE)
+
+
+def downgrade():
+    run(SQLITE_DOWNGRADE, POSTGRES_DOWNGRADE)
@@ -0,0 +1,35 @@
+"""add numeric answer columns to answer submissions
+
+Revision ID: 6a47f2c0d81e
+Revises: 2f61d4a9c7e3
+Create Date: 2016-03-01 14:05:27.630912
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a47f2c0d81e'
+down_revision = '2f61d4a9c7e3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('answer_submissions', sa.Column('variable_numerator', sa.Integer(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('variable_denominator', sa.Integer(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('left_side_numerator', sa.Integer(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('left_side_denominator', sa.Integer(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('right_side_numerator', sa.Integer(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('right_side_denominator', sa.Integer(), nullable=True))
+    op.create_index('ix_answer_submissions_problem_id_answer', 'answer_submissions', ['problem_id', 'variable_numerator', 'variable_denominator', 'left_side_numerator', 'left_side_denominator', 'right_side_numerator', 'right_side_denominator'], unique=False)
+    # existing rows are filled in by "manage.py backfill answer_fractions"
+
+
+def downgrade():
+    op.drop_index('ix_answer_submissions_problem_id_answer', 'answer_submissions')
+    op.drop_column('answer_submissions', 'right_side_denominator')
+    op.drop_column('answer_submissions', 'right_side_numerator')
+    op.drop_column('answer_submissions', 'left_side_denominator')
+    op.drop_column('answer_submissions', 'left_side_numerator')
+    op.drop_column('answer_submissions', 'variable_denominator')
+    op.drop_column('answer_submissions', 'variable_numerator')
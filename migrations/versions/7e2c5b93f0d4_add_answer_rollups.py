@@ -0,0 +1,34 @@
+"""add answer rollups for archived submissions
+
+Revision ID: 7e2c5b93f0d4
+Revises: 6a47f2c0d81e
+Create Date: 2016-03-09 16:44:12.908126
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7e2c5b93f0d4'
+down_revision = '6a47f2c0d81e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('answer_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('problem_id', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('correct', sa.Integer(), nullable=True),
+    sa.Column('first_correct_at', sa.DateTime(), nullable=True),
+    sa.Column('last_submitted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['problem_id'], ['problems.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'problem_id')
+    )
+    op.create_index('ix_answer_rollups_problem_id', 'answer_rollups', ['problem_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_answer_rollups_problem_id', 'answer_rollups')
+    op.drop_table('answer_rollups')
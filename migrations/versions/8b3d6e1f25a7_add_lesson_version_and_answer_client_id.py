@@ -0,0 +1,26 @@
+"""add lesson version and answer client id for offline sync
+
+Revision ID: 8b3d6e1f25a7
+Revises: 7e2c5b93f0d4
+Create Date: 2016-03-21 11:18:40.277351
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8b3d6e1f25a7'
+down_revision = '7e2c5b93f0d4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('lessons', sa.Column('version', sa.Integer(), nullable=True, server_default='1'))
+    op.add_column('answer_submissions', sa.Column('client_id', sa.String(length=36), nullable=True))
+    op.create_index('ix_answer_submissions_user_id_client_id', 'answer_submissions', ['user_id', 'client_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_answer_submissions_user_id_client_id', 'answer_submissions')
+    op.drop_column('answer_submissions', 'client_id')
+    op.drop_column('lessons', 'version')
@@ -0,0 +1,24 @@
+"""add the steps students show with their answers
+
+Revision ID: a4d7f9e2c6b1
+Revises: 9c1e4a7b3d52
+Create Date: 2016-04-02 10:41:27.185342
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7f9e2c6b1'
+down_revision = '9c1e4a7b3d52'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('answer_submissions', sa.Column('steps', sa.Text(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('step_checks', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('answer_submissions', 'step_checks')
+    op.drop_column('answer_submissions', 'steps')
@@ -0,0 +1,50 @@
+"""add the tenant directory
+
+Revision ID: b8e2c5d1f374
+Revises: a4d7f9e2c6b1
+Create Date: 2016-04-09 16:25:52.903716
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2c5d1f374'
+down_revision = 'a4d7f9e2c6b1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def on_shard():
+    # set by env.py; the directory is only kept in the main database
+    return op.get_context().opts.get('shard') is not None
+
+
+def upgrade():
+    if on_shard():
+        return
+    op.create_table('tenants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=128), nullable=True),
+    sa.Column('shard', sa.String(length=64), nullable=True),
+    sa.Column('moving', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('user_locations',
+    sa.Column('email', sa.String(length=64), nullable=False),
+    sa.Column('tenant_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ),
+    sa.PrimaryKeyConstraint('email')
+    )
+    op.create_index('ix_user_locations_tenant_id', 'user_locations', ['tenant_id'], unique=False)
+    # everyone starts out in the main database, outside any tenant
+    op.execute('INSERT INTO user_locations (email) '
+               'SELECT email FROM users WHERE email IS NOT NULL')
+
+
+def downgrade():
+    if on_shard():
+        return
+    op.drop_index('ix_user_locations_tenant_id', 'user_locations')
+    op.drop_table('user_locations')
+    op.drop_table('tenants')
@@ -0,0 +1,56 @@
+"""add assignments and work items
+
+Revision ID: c3f8a1d6e925
+Revises: b8e2c5d1f374
+Create Date: 2016-04-16 11:08:45.270931
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a1d6e925'
+down_revision = 'b8e2c5d1f374'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('assignments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lesson_id', sa.Integer(), nullable=True),
+    sa.Column('teacher_id', sa.Integer(), nullable=True),
+    sa.Column('due_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ),
+    sa.ForeignKeyConstraint(['teacher_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_assignments_lesson_id', 'assignments', ['lesson_id'], unique=False)
+    op.create_index('ix_assignments_teacher_id', 'assignments', ['teacher_id'], unique=False)
+    op.create_table('work_items',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('assignment_id', sa.Integer(), nullable=False),
+    sa.Column('lesson_id', sa.Integer(), nullable=True),
+    sa.Column('lesson_name', sa.String(length=128), nullable=True),
+    sa.Column('due_at', sa.DateTime(), nullable=True),
+    sa.Column('problems_total', sa.Integer(), nullable=True),
+    sa.Column('problems_solved', sa.Integer(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['assignment_id'], ['assignments.id'], ),
+    sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'assignment_id')
+    )
+    op.create_index('ix_work_items_assignment_id', 'work_items', ['assignment_id'], unique=False)
+    op.create_index('ix_work_items_lesson_id', 'work_items', ['lesson_id'], unique=False)
+    op.create_index('ix_work_items_student_id_completed_at_due_at', 'work_items', ['student_id', 'completed_at', 'due_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_work_items_student_id_completed_at_due_at', 'work_items')
+    op.drop_index('ix_work_items_lesson_id', 'work_items')
+    op.drop_index('ix_work_items_assignment_id', 'work_items')
+    op.drop_table('work_items')
+    op.drop_index('ix_assignments_teacher_id', 'assignments')
+    op.drop_index('ix_assignments_lesson_id', 'assignments')
+    op.drop_table('assignments')
@@ -0,0 +1,25 @@
+"""add the misconception table to problems and the diagnosis to answers
+
+Revision ID: d5a9e3c7b204
+Revises: c3f8a1d6e925
+Create Date: 2016-04-18 15:22:06.518374
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5a9e3c7b204'
+down_revision = 'c3f8a1d6e925'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('problems', sa.Column('misconceptions', sa.Text(), nullable=True))
+    op.add_column('answer_submissions', sa.Column('misconception', sa.String(length=32), nullable=True))
+    # existing problems are filled in by "manage.py backfill problem_misconceptions"
+
+
+def downgrade():
+    op.drop_column('answer_submissions', 'misconception')
+    op.drop_column('problems', 'misconceptions')
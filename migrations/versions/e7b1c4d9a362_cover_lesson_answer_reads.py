@@ -0,0 +1,23 @@
+"""cover the item analysis reads with the answer problem_id index
+
+Revision ID: e7b1c4d9a362
+Revises: d5a9e3c7b204
+Create Date: 2016-04-20 09:47:13.802215
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e7b1c4d9a362'
+down_revision = 'd5a9e3c7b204'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_answer_submissions_problem_id_user_id', 'answer_submissions', ['problem_id', 'user_id', 'is_correct', 'id'], unique=False)
+    op.drop_index('ix_answer_submissions_problem_id', 'answer_submissions')
+
+
+def downgrade():
+    op.create_index('ix_answer_submissions_problem_id', 'answer_submissions', ['problem_id'], unique=False)
+    op.drop_index('ix_answer_submissions_problem_id_user_id', 'answer_submissions')
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, bus
+from app.admission import Admission
+from app.models import User, Role
+
+
+class AdmissionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-admission-')
+        self.app = create_app('testing')
+        self.app.config.update(
+            WTF_CSRF_ENABLED=False,
+            KYBURZ_ADMISSION_DIR=os.path.join(self.directory, 'admission'),
+            KYBURZ_ADMISSION_LIMITS={
+                'auth.login': {'user': (1.0 / 30, 3), 'ip': (5, 100)}})
+        self.admission = Admission(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='owner@example.com', password='cat',
+                            confirmed=True))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def login(self, password, address):
+        return self.app.test_client().post(
+            '/auth/login', data={'email': 'owner@example.com',
+                                 'password': password},
+            environ_base={'REMOTE_ADDR': address})
+
+    def test_directory_made_on_first_use(self):
+        self.assertFalse(os.path.exists(self.app.config['KYBURZ_ADMISSION_DIR']))
+        self.login('dog', '10.0.0.1')
+        self.assertTrue(os.path.isdir(self.app.config['KYBURZ_ADMISSION_DIR']))
+
+    def test_guessing_does_not_lock_out_the_owner(self):
+        for _ in range(3):
+            self.assertEqual(self.login('dog', '10.0.0.1').status_code, 200)
+        self.assertEqual(self.login('dog', '10.0.0.1').status_code, 429)
+        self.assertEqual(self.login('cat', '10.0.0.2').status_code, 302)
+
+    def test_testing_has_no_limits(self):
+        self.assertEqual(create_app('testing')
+                         .config['KYBURZ_ADMISSION_LIMITS'], {})
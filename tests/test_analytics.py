@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from app import create_app, db, bus
+from app.models import User, Lesson, Problem, AnswerSubmission, AnswerRollup
+from app.teacher.analytics import build_matrix, item_analysis
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def test_first_attempts(self):
+        # student, problem, correct, answer id; the rollup has id 0
+        rows = np.array([[7, 20, 1, 5], [7, 20, 0, 2], [7, 10, 1, 3],
+                         [9, 10, 1, 0], [9, 10, 0, 1], [9, 30, 1, 4]],
+                        dtype=np.int64)
+        students, matrix, attempted = build_matrix(rows, [20, 10])
+        self.assertEqual(students.tolist(), [7, 9])
+        self.assertEqual(matrix.tolist(), [[0, 1], [0, 1]])
+        self.assertEqual(attempted.tolist(), [[True, True], [False, True]])
+
+    def test_item_analysis(self):
+        users = [User(email='s{0}@example.com'.format(i), password='cat')
+                 for i in range(4)]
+        lesson = Lesson(name='Linear', number=1)
+        db.session.add_all(users + [lesson])
+        db.session.flush()
+        problems = [Problem(lesson_id=lesson.id, number=i + 1,
+                            text='x={0}'.format(i + 1)) for i in range(2)]
+        db.session.add_all(problems)
+        db.session.flush()
+        scores = [(1, 1), (1, 0), (0, 1), (0, 0)]
+        for user, (first, second) in zip(users, scores):
+            db.session.add(AnswerSubmission(
+                user_id=user.id, problem_id=problems[0].id,
+                is_correct=bool(first)))
+            db.session.add(AnswerSubmission(
+                user_id=user.id, problem_id=problems[1].id,
+                is_correct=bool(second)))
+        # an archived wrong first attempt outweighs a later live answer
+        db.session.add(AnswerRollup(user_id=users[3].id,
+                                    problem_id=problems[0].id,
+                                    attempts=2, correct=1))
+        db.session.commit()
+        analysis = item_analysis(lesson.id)
+        self.assertEqual(analysis['students'], 4)
+        first, second = analysis['problems']
+        self.assertEqual(first['students'], 4)
+        self.assertAlmostEqual(first['difficulty'], 0.5)
+        self.assertAlmostEqual(second['difficulty'], 0.5)
+        # on two problems the rest score is the other problem, which is
+        # uncorrelated here
+        self.assertAlmostEqual(first['point_biserial'], 0.0)
+        self.assertAlmostEqual(first['score_correct'], 1.5)
+        self.assertAlmostEqual(first['score_wrong'], 0.5)
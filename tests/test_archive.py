@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from app import create_app, db, bus
+from app.archive import archive_before, archive_path, read_archive
+from app.deletion import delete_lesson, delete_user
+from app.models import User, Lesson, Problem, AnswerSubmission, AnswerRollup
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-archive-')
+        self.app = create_app('testing')
+        self.app.config['KYBURZ_ARCHIVE_DIR'] = self.directory
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.teacher = User(email='teacher@example.com', password='cat')
+        self.student = User(email='student@example.com', password='cat')
+        db.session.add_all([self.teacher, self.student])
+        db.session.flush()
+        self.lesson = Lesson(name='Linear', number=1,
+                             author_id=self.teacher.id)
+        db.session.add(self.lesson)
+        db.session.flush()
+        self.problem = Problem(lesson_id=self.lesson.id, number=1,
+                               text='x=1')
+        db.session.add(self.problem)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def answer(self, problem_id):
+        answer = AnswerSubmission(user_id=self.student.id,
+                                  problem_id=problem_id, is_correct=True,
+                                  timestamp=datetime(2015, 3, 1))
+        db.session.add(answer)
+        db.session.commit()
+        return answer.id
+
+    def test_answers_without_a_problem_are_archived(self):
+        kept = self.answer(self.problem.id)
+        # a problem deleted without its answers
+        self.answer(self.problem.id + 1)
+        self.assertEqual(archive_before(datetime(2016, 1, 1)), 2)
+        self.assertEqual(AnswerSubmission.query.count(), 0)
+        self.assertEqual([record['id'] for record in
+                          read_archive(self.teacher.id)], [kept])
+        self.assertTrue(os.path.exists(
+            archive_path(self.directory, '2015-03', None)))
+        self.assertEqual([(r.problem_id, r.attempts)
+                          for r in AnswerRollup.query], [(self.problem.id, 1)])
+
+    def test_deleting_a_student_removes_their_archived_answers(self):
+        other = User(email='other@example.com', password='cat')
+        db.session.add(other)
+        db.session.commit()
+        self.answer(self.problem.id)
+        kept = AnswerSubmission(user_id=other.id, problem_id=self.problem.id,
+                                is_correct=False,
+                                timestamp=datetime(2015, 3, 2))
+        db.session.add(kept)
+        db.session.commit()
+        kept_id = kept.id
+        archive_before(datetime(2016, 1, 1))
+        deletion = delete_user(self.student)
+        self.assertIn(("the user's archived answers", 1), deletion.counts())
+        deletion.execute()
+        self.assertEqual([record['id'] for record in
+                          read_archive(self.teacher.id)], [kept_id])
+
+    def test_deleting_a_lesson_removes_its_archive_file(self):
+        self.answer(self.problem.id)
+        archive_before(datetime(2016, 1, 1))
+        path = archive_path(self.directory, '2015-03', self.teacher.id)
+        self.assertTrue(os.path.exists(path))
+        delete_lesson(self.lesson).execute()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(read_archive(self.teacher.id)), [])
@@ -0,0 +1,191 @@
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from threading import Event
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import create_app, db, bus, caching
+from app.caching import InvalidationBus, SharedCache, SocketTransport
+
+
+class FakeNetwork(object):
+    """Delivers every message to every listening bus, like the real ones."""
+    def __init__(self):
+        self.receivers = []
+        self.up = True
+
+    def transport(self, url):
+        return FakeTransport(self)
+
+
+class FakeTransport(object):
+    def __init__(self, network):
+        self.network = network
+
+    def listen(self, ready, receive):
+        if not self.network.up:
+            raise IOError('The bus is down.')
+        self.network.receivers.append(receive)
+        ready()
+        # the listener thread is a daemon; it stays here until exit
+        Event().wait()
+
+    def send(self, message):
+        for receive in list(self.network.receivers):
+            receive(message)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(0.01)
+
+
+class CachingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['KYBURZ_CACHE_BUS_URL'] = 'fake://'
+        self.app.config['KYBURZ_CACHE_FALLBACK_SECONDS'] = 0.2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.network = FakeNetwork()
+        self.transport_for = caching.transport_for
+        caching.transport_for = self.network.transport
+        self.quiet = logging.getLogger('kyburz.tests.caching')
+        self.quiet.addHandler(logging.NullHandler())
+        self.quiet.propagate = False
+        # this process's bus, with a listener on the fake network
+        self.restart(bus, 'local')
+        self.local = SharedCache(bus, 'test_cache')
+        self.data = {'remote': 1}
+
+    def tearDown(self):
+        caching.transport_for = self.transport_for
+        self.restart(bus, None)
+        del bus.caches['test_cache']
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def restart(self, process_bus, origin):
+        process_bus.url = self.app.config['KYBURZ_CACHE_BUS_URL'] \
+            if origin else None
+        process_bus.pid = None
+        process_bus.listening_since()
+        if origin:
+            # every bus in a test shares the pid, so the origin that keeps
+            # a bus from hearing itself is set by hand
+            process_bus.origin = origin
+
+    def other_process(self, up=True):
+        self.network.up = up
+        other = InvalidationBus(self.app)
+        other.logger = self.quiet
+        other.retry = 3600
+        cache = SharedCache(other, 'test_cache')
+        self.restart(other, 'remote')
+        if up:
+            wait_until(lambda: other.since is not None)
+        self.addCleanup(event.remove, Session,
+                        'after_commit', other.after_commit)
+        self.addCleanup(event.remove, Session,
+                        'after_rollback', other.after_rollback)
+        return cache
+
+    def load(self, process):
+        return lambda: self.data[process]
+
+    def test_invalidation_reaches_other_processes(self):
+        remote = self.other_process()
+        wait_until(lambda: bus.since is not None)
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+        self.data['remote'] = 2
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+        self.local.invalidate('key')
+        self.assertEqual(remote.cached('key', self.load('remote')), 2)
+
+    def test_invalidate_on_commit_waits_for_the_commit(self):
+        remote = self.other_process()
+        wait_until(lambda: bus.since is not None)
+        remote.cached('key', self.load('remote'))
+        self.data['remote'] = 2
+        self.local.invalidate_on_commit('key')
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+        db.session.commit()
+        self.assertEqual(remote.cached('key', self.load('remote')), 2)
+
+    def test_rollback_drops_the_invalidation(self):
+        remote = self.other_process()
+        wait_until(lambda: bus.since is not None)
+        remote.cached('key', self.load('remote'))
+        self.data['remote'] = 2
+        self.local.invalidate_on_commit('key')
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+
+    def test_entries_outlive_the_ttl_while_listening(self):
+        remote = self.other_process()
+        remote.cached('key', self.load('remote'))
+        self.data['remote'] = 2
+        time.sleep(0.3)
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+
+    def test_entries_expire_when_the_listener_is_down(self):
+        remote = self.other_process(up=False)
+        self.assertIsNone(remote.bus.listening_since())
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+        self.data['remote'] = 2
+        self.assertEqual(remote.cached('key', self.load('remote')), 1)
+        time.sleep(0.3)
+        self.assertEqual(remote.cached('key', self.load('remote')), 2)
+
+
+class SocketTransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-bus-')
+        self.listeners = []
+
+    def tearDown(self):
+        for listener in self.listeners:
+            listener.close()
+        shutil.rmtree(self.directory)
+
+    def listener(self, filename):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.bind(os.path.join(self.directory, filename))
+        self.listeners.append(listener)
+        return listener
+
+    def test_a_busy_listener_does_not_block_the_rest(self):
+        # a live process whose queue is full
+        busy = os.path.join(self.directory, '{0}.sock'.format(os.getpid()))
+        self.listener(os.path.basename(busy))
+        filler = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        filler.setblocking(False)
+        try:
+            while True:
+                filler.sendto('x', busy)
+        except socket.error:
+            pass
+        finally:
+            filler.close()
+        others = [self.listener('{0}.sock'.format(n)) for n in range(5)]
+        for other in others:
+            other.settimeout(1)
+        transport = SocketTransport(self.directory)
+        transport.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        transport.sender.settimeout(0.01)
+        with self.assertRaises(socket.error):
+            transport.send('message')
+        for other in others:
+            self.assertEqual(other.recv(100), 'message')
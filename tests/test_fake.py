@@ -0,0 +1,40 @@
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, bus
+from app.fake import Generator
+from app.models import AnswerSubmission, AnswerRollup, Mastery, WorkItem, \
+    UserLocation, User
+
+
+class FakeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-archive-')
+        self.app = create_app('testing')
+        self.app.config['KYBURZ_ARCHIVE_DIR'] = self.directory
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def test_derived_tables_are_filled(self):
+        Generator(seed=1).generate(teachers=2, students_per_teacher=3,
+                                   lessons_per_teacher=2,
+                                   problems_per_lesson=3, submissions=300)
+        self.assertEqual(UserLocation.query.count(), User.query.count())
+        self.assertEqual(WorkItem.query.count(), 2 * 2 * 3)
+        self.assertGreater(AnswerRollup.query.count(), 0)
+        self.assertGreater(AnswerSubmission.query.count(), 0)
+        self.assertEqual(
+            sum(m.attempts for m in Mastery.query),
+            sum(r.attempts for r in AnswerRollup.query) +
+            AnswerSubmission.query.count())
+        self.assertGreater(AnswerSubmission.query.filter(
+            AnswerSubmission.misconception != None).count(), 0)
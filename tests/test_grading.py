@@ -0,0 +1,76 @@
+import unittest
+from sqlalchemy.dialects import postgresql
+from app import create_app, db, bus
+from app.models import User, Lesson, Problem, AnswerSubmission
+from app.student import bundle
+from app.student.grading import grade_answer, correct_clause
+from app.teacher.parse import parse_equation
+from app.teacher.reports import lesson_accuracy
+
+
+class GradingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def test_products_are_64_bit(self):
+        sql = str(correct_clause().compile(dialect=postgresql.dialect()))
+        self.assertEqual(sql.count('AS BIGINT'), 6)
+
+    def test_large_answers(self):
+        student = User(email='student@example.com', password='cat')
+        lesson = Lesson(name='Linear', number=1)
+        db.session.add_all([student, lesson])
+        db.session.flush()
+        problem = Problem(lesson_id=lesson.id, number=1,
+                          **parse_equation('2x+3=7'))
+        db.session.add(problem)
+        db.session.flush()
+        answer = grade_answer(student, problem, '2147483647', '7', '7')
+        db.session.commit()
+        self.assertFalse(answer.is_correct)
+        self.assertEqual(answer.variable_numerator, 2147483647)
+        accuracy = lesson_accuracy(lesson.id)
+        self.assertEqual(accuracy[0]['attempts'], 1)
+        self.assertEqual(accuracy[0]['correct'], 0)
+
+    def test_sync_reports_answers_recorded_by_a_concurrent_upload(self):
+        student = User(email='student@example.com', password='cat')
+        lesson = Lesson(name='Linear', number=1)
+        db.session.add_all([student, lesson])
+        db.session.flush()
+        problem = Problem(lesson_id=lesson.id, number=1,
+                          **parse_equation('2x+3=7'))
+        db.session.add(problem)
+        db.session.commit()
+        item = {'client_id': 'a', 'problem_id': problem.id,
+                'variable_value': '2', 'left_side_value': '7',
+                'right_side_value': '7'}
+        record_answers = bundle.record_answers
+
+        def concurrent(user, submissions):
+            # the other upload commits between the lookup and the insert
+            bundle.record_answers = record_answers
+            record_answers(user, submissions)
+            return record_answers(user, submissions)
+        bundle.record_answers = concurrent
+        try:
+            results = bundle.sync_answers(
+                student, [item, {'client_id': 'x' * 37}, {'client_id': 7}],
+                lambda lesson: None)
+        finally:
+            bundle.record_answers = record_answers
+        self.assertEqual(results[0], {'client_id': 'a', 'is_correct': True})
+        self.assertEqual([result['client_id'] for result in results[1:]],
+                         ['x' * 37, 7])
+        self.assertTrue(all('error' in result for result in results[1:]))
+        self.assertEqual(AnswerSubmission.query.count(), 1)
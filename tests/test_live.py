@@ -0,0 +1,31 @@
+import unittest
+from app import create_app, db, bus
+from app.live import ProgressBroker
+
+
+class LiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.broker = ProgressBroker()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def test_events_published_after_listen_are_kept(self):
+        events = self.broker.listen(1, keepalive=0)
+        self.broker.publish(1, {'problem_id': 2})
+        self.assertEqual(next(events), {'problem_id': 2})
+        events.close()
+        self.assertEqual(self.broker.channels, {})
+
+    def test_closing_an_unread_stream_unsubscribes(self):
+        # as when the snapshot fails before the stream is read
+        self.broker.listen(1).close()
+        self.assertEqual(self.broker.channels, {})
@@ -0,0 +1,97 @@
+import errno
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from threading import Thread
+from app import create_app
+from app.metrics import Metrics, MERGED, sample, process_alive
+
+
+def exited_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-metrics-')
+        self.metrics = Metrics()
+        self.metrics.directory = self.directory
+        self.jobs = self.metrics.counter('test_jobs_total', 'Jobs.')
+        self.busy = self.metrics.gauge('test_busy', 'Busy workers.')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_export_is_not_public(self):
+        app = create_app('testing')
+        app.config['KYBURZ_METRICS_TOKEN'] = 'secret'
+        client = app.test_client()
+
+        def get(address, token=None):
+            headers = {'Authorization': 'Bearer ' + token} if token else {}
+            return client.get('/metrics', headers=headers,
+                              environ_base={'REMOTE_ADDR': address})
+        self.assertEqual(get('127.0.0.1').status_code, 200)
+        self.assertEqual(get('203.0.113.9').status_code, 404)
+        self.assertEqual(get('203.0.113.9', 'guess').status_code, 404)
+        self.assertEqual(get('203.0.113.9', 'secret').status_code, 200)
+
+    def test_gauge_from_many_threads(self):
+        interval = sys.getcheckinterval()
+        # switch threads as often as possible to expose lost updates
+        sys.setcheckinterval(1)
+        try:
+            def work():
+                for _ in range(10000):
+                    self.busy.inc()
+                    self.busy.dec()
+                self.busy.inc()
+            threads = [Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual(self.metrics.aggregate()[self.busy.key({})], 4)
+
+    def test_files_of_exited_processes_are_merged(self):
+        for i in range(2):
+            with open(os.path.join(self.directory, '{0}-0.json'.format(
+                    exited_pid())), 'w') as f:
+                json.dump({self.jobs.key({}): 3, self.busy.key({}): 1}, f)
+        self.jobs.inc()
+        for _ in range(2):
+            totals = self.metrics.aggregate()
+            self.assertEqual(totals[self.jobs.key({})], 7)
+            self.assertNotIn(self.busy.key({}), totals)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['merge.lock', MERGED])
+
+    def test_other_files_are_left_alone(self):
+        for filename in ('alerts.json', 'old-config.json'):
+            with open(os.path.join(self.directory, filename), 'w') as f:
+                json.dump({self.jobs.key({}): 100}, f)
+        self.jobs.inc()
+        self.assertEqual(self.metrics.aggregate()[self.jobs.key({})], 1)
+        self.assertIn('alerts.json', os.listdir(self.directory))
+
+    def test_processes_of_other_users_are_alive(self):
+        def kill(pid, signal):
+            raise OSError(errno.EPERM, 'Operation not permitted')
+        original, os.kill = os.kill, kill
+        try:
+            self.assertTrue(process_alive(1))
+        finally:
+            os.kill = original
+        self.assertFalse(process_alive(exited_pid()))
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(sample('test', {'path': u'a\\b"c\nd'}, 1),
+                         u'test{path="a\\\\b\\"c\\nd"} 1')
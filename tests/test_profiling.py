@@ -0,0 +1,45 @@
+import logging
+import unittest
+from app import create_app, db, bus
+from app.models import User
+from app.profiling import RequestProfiler
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['KYBURZ_PROFILE_REQUESTS'] = True
+        self.app.config['KYBURZ_SLOW_REQUEST_TIME'] = 0
+        self.profiler = RequestProfiler(self.app)
+        self.handler = ListHandler()
+        self.app.logger.addHandler(self.handler)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def test_slow_requests_leave_out_parameters(self):
+        @self.app.route('/lookup')
+        def lookup():
+            User.query.filter_by(email='secret@example.com').first()
+            return ''
+        self.app.test_client().get('/lookup')
+        self.assertIn('FROM users', self.handler.messages[-1])
+        self.assertNotIn('secret@example.com', self.handler.messages[-1])
+        self.assertNotIn('secret@example.com',
+                         repr(self.profiler.slow_requests[0]))
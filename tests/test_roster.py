@@ -0,0 +1,78 @@
+import json
+import unittest
+from datetime import datetime
+from app import create_app, db, mail, jobs, metrics_registry, bus
+from app.models import User, Role, TeachingRelationship, Job
+
+
+class RosterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['KYBURZ_EXTERNAL_URL'] = 'https://kyburz.example.com'
+        self.app.config['KYBURZ_MAIL_SENDER'] = 'Kyburz <kyburz@example.com>'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.teacher = User(email='teacher@example.com', password='cat',
+                            first_name='Ada', last_name='Teacher',
+                            role=Role.query.filter_by(name='Teacher').first())
+        db.session.add(self.teacher)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def rows(self):
+        return [{'line': 2, 'email': 'bo@example.com', 'first_name': 'Bo',
+                 'last_name': 'Student', 'password': ''}]
+
+    def provision(self):
+        return jobs.enqueue('provision_roster', owner=self.teacher,
+                            teacher_id=self.teacher.id, rows=self.rows(),
+                            errors=[])
+
+    def test_welcome_mail_from_a_worker(self):
+        # like a worker, only an application context is active
+        with mail.record_messages() as outbox:
+            job = self.provision()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(outbox), 1)
+        self.assertIn('https://kyburz.example.com/auth/confirm/',
+                      outbox[0].body)
+        self.assertIn('https://kyburz.example.com/auth/reset/',
+                      outbox[0].body)
+        self.assertIsNotNone(User.query.filter_by(
+            email='bo@example.com').first())
+        self.assertEqual(metrics_registry.aggregate().get(
+            metrics_registry.mail_queue_depth.key({}), 0), 0)
+
+    def test_accounts_survive_a_failed_mail(self):
+        # nothing listens on port 1, so the connection is refused
+        state = self.app.extensions['mail']
+        state.suppress, state.server, state.port, state.use_tls = \
+            False, '127.0.0.1', 1, False
+        job = self.provision()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual([row['email'] for row in
+                          json.loads(job.result)['created']],
+                         ['bo@example.com'])
+        self.assertEqual(TeachingRelationship.query.count(), 1)
+        mailing = Job.query.filter_by(name='send_welcome_mail').one()
+        self.assertEqual(mailing.status, 'queued')
+        self.assertIn('Retrying', mailing.message)
+        # the retry works once the mail server is back
+        state.suppress = True
+        mailing.run_after = datetime.utcnow()
+        db.session.commit()
+        # the task ends the session the job was loaded in
+        mailing_id = mailing.id
+        with mail.record_messages() as outbox:
+            self.assertTrue(jobs.claim(mailing_id, 'test'))
+            jobs.execute(mailing_id)
+        self.assertEqual(Job.query.get(mailing_id).status, 'done')
+        self.assertEqual(len(outbox), 1)
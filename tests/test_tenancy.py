@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, bus
+from app.models import User, Role, Tenant, UserLocation, TeachingRelationship
+from app.archive import archive_path, archive_root, write_partition
+from app.tenancy import use_shard, move_tenant, TenantError
+
+
+class TenancyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='kyburz-shards-')
+        self.app = create_app('testing')
+        # shards are binds, and their engines are made on first use
+        url = 'sqlite:///' + os.path.join(self.directory, 'east.sqlite')
+        self.app.config['KYBURZ_SHARDS'] = {'east': url}
+        self.app.config['SQLALCHEMY_BINDS']['east'] = url
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['KYBURZ_ARCHIVE_DIR'] = os.path.join(self.directory,
+                                                             'archive')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.Model.metadata.create_all(db.get_engine(self.app, bind='east'))
+        tenant = Tenant(name='School', shard='east')
+        db.session.add(tenant)
+        db.session.commit()
+        # use_shard starts a new session, so only the id is kept
+        self.tenant_id = tenant.id
+        with use_shard('east'):
+            Role.insert_roles()
+            teacher = User(email='teacher@example.com', password='cat',
+                           confirmed=True,
+                           role=Role.query.filter_by(name='Teacher').first())
+            # a student of another school who shares the teacher
+            student = User(email='student@example.com', password='cat',
+                           confirmed=True)
+            db.session.add_all([teacher, student])
+            teacher.add_student(student)
+            db.session.commit()
+        db.session.add_all([
+            UserLocation(email='teacher@example.com',
+                         tenant_id=self.tenant_id),
+            UserLocation(email='student@example.com')])
+        db.session.commit()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def tenant(self):
+        return Tenant.query.get(self.tenant_id)
+
+    def login(self):
+        return self.client.post('/auth/login', data={
+            'email': 'teacher@example.com', 'password': 'cat'})
+
+    def test_login_uses_the_shard_of_the_tenant(self):
+        self.assertIsNone(
+            User.query.filter_by(email='teacher@example.com').first())
+        self.assertEqual(self.login().status_code, 302)
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['shard'], 'east')
+            self.assertIn('user_id', session)
+
+    def test_move_voids_the_login(self):
+        self.login()
+        move_tenant(self.tenant(), None, wait=0)
+        self.client.get('/')
+        with self.client.session_transaction() as session:
+            self.assertNotIn('user_id', session)
+            self.assertNotIn('shard', session)
+        self.assertEqual(self.login().status_code, 302)
+        with self.client.session_transaction() as session:
+            self.assertIsNone(session['shard'])
+
+    def test_copy_skips_rows_of_other_tenants(self):
+        counts = dict((table, (copied, skipped)) for table, copied, skipped
+                      in move_tenant(self.tenant(), None, wait=0))
+        self.assertEqual(counts['users'], (1, 0))
+        self.assertEqual(counts['teaching_relationships'], (0, 1))
+        self.assertIsNotNone(
+            User.query.filter_by(email='teacher@example.com').first())
+        self.assertIsNone(
+            User.query.filter_by(email='student@example.com').first())
+        self.assertEqual(TeachingRelationship.query.count(), 0)
+
+    def test_writes_wait_while_moving(self):
+        self.login()
+        Tenant.query.filter_by(id=self.tenant_id).update({'moving': True})
+        db.session.commit()
+        bus.caches['tenant_directory'].discard(None)
+        self.assertEqual(self.client.get('/auth/change-password')
+                         .status_code, 200)
+        response = self.client.post('/auth/change-password', data={
+            'old_password': 'cat', 'password': 'dog', 'password2': 'dog'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_old_copy_is_kept_while_it_has_archived_answers(self):
+        with use_shard('east'):
+            teacher = User.query.filter_by(email='teacher@example.com').one()
+            write_partition(archive_path(archive_root(), '2015-03',
+                                         teacher.id), [{'id': 1}])
+        with self.assertRaises(TenantError):
+            move_tenant(self.tenant(), None, wait=0, delete_source=True)
+        self.assertEqual(self.tenant().shard, 'east')
+        self.assertFalse(self.tenant().moving)
@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, bus
+from app.models import User, Role, Lesson, Problem, WorkItem
+from app.student.grading import grade_answer
+from app.student.worklist import assign_lesson
+from app.teacher.parse import parse_equation
+
+
+class WorklistTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.teacher = User(email='teacher@example.com', password='cat',
+                            role=Role.query.filter_by(name='Teacher').first())
+        self.student = User(email='student@example.com', password='cat')
+        self.lesson = Lesson(name='Linear', number=1)
+        db.session.add_all([self.teacher, self.student, self.lesson])
+        db.session.flush()
+        self.lesson.author_id = self.teacher.id
+        self.teacher.add_student(self.student)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        # ids start over in the next test's database
+        for cache in bus.caches.values():
+            cache.discard(None)
+
+    def add_problem(self, text, number):
+        problem = Problem(lesson_id=self.lesson.id, number=number,
+                          **parse_equation(text))
+        db.session.add(problem)
+        db.session.commit()
+        return problem
+
+    def test_solving_the_last_problem_completes_the_item(self):
+        problem = self.add_problem('2x+3=7', 1)
+        assign_lesson(self.lesson, self.teacher,
+                      datetime.utcnow() + timedelta(days=1))
+        db.session.commit()
+        grade_answer(self.student, problem, '2', '7', '7')
+        db.session.commit()
+        item = WorkItem.query.filter_by(student_id=self.student.id).one()
+        self.assertEqual(item.problems_solved, 1)
+        self.assertIsNotNone(item.completed_at)
+
+    def test_each_correct_answer_counts_at_once(self):
+        first = self.add_problem('2x+3=7', 1)
+        second = self.add_problem('3x=6', 2)
+        assign_lesson(self.lesson, self.teacher,
+                      datetime.utcnow() + timedelta(days=1))
+        db.session.commit()
+        grade_answer(self.student, first, '2', '7', '7')
+        db.session.commit()
+        item = WorkItem.query.filter_by(student_id=self.student.id).one()
+        self.assertEqual(item.problems_solved, 1)
+        self.assertIsNone(item.completed_at)
+        grade_answer(self.student, second, '1', '3', '6')
+        grade_answer(self.student, second, '2', '6', '6')
+        db.session.commit()
+        self.assertEqual(item.problems_solved, 2)
+        self.assertIsNotNone(item.completed_at)